@@ -132,6 +132,49 @@ STATICFILES_DIRS = [
 STATIC_ROOT = os.path. join(BASE_DIR, 'staticfiles')
 STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
 
+# Graph windows with more raw points than this per series are drawn from the
+# hourly/daily/monthly rollup tables instead of the raw measurements.
+GRAPH_POINT_BUDGET = int(os.environ.get("GRAPH_POINT_BUDGET", 2000))
+# Traces still longer than the budget are downsampled before plotting:
+# "lttb" (keeps the line's shape), "minmax" (keeps every peak) or "none".
+GRAPH_DOWNSAMPLE = os.environ.get("GRAPH_DOWNSAMPLE", "lttb")
+# Line graphs with more points than this in total are drawn with WebGL
+# (Scattergl) instead of SVG, both server-rendered (services/backend/graph_traces.py)
+# and client-rendered on maptabs (static/js/seriesBinary.js).
+GRAPH_WEBGL_POINTS = int(os.environ.get("GRAPH_WEBGL_POINTS", 5000))
+
+# Rendered graph fragments (services/fragment_cache.py). GRAPH_FRAGMENT_CACHE
+# picks the backend: "locmem" (per process, the default), "file:<directory>" or
+# "db:<table>" (in db.sqlite3; run `manage.py createcachetable` first) to share
+# fragments between worker processes.
+GRAPH_FRAGMENT_CACHE = os.environ.get("GRAPH_FRAGMENT_CACHE", "locmem")
+GRAPH_FRAGMENT_CACHE_ALIAS = "graph_fragments"
+GRAPH_FRAGMENT_CACHE_TTL = int(os.environ.get("GRAPH_FRAGMENT_CACHE_TTL", 24 * 3600))
+_fragment_kind, _, _fragment_location = GRAPH_FRAGMENT_CACHE.partition(":")
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    GRAPH_FRAGMENT_CACHE_ALIAS: {
+        'BACKEND': {
+            'file': 'django.core.cache.backends.filebased.FileBasedCache',
+            'db': 'django.core.cache.backends.db.DatabaseCache',
+        }.get(_fragment_kind, 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': _fragment_location or {
+            'file': str(BASE_DIR / 'graph_fragment_cache'),
+            'db': 'graph_fragment_cache',
+        }.get(_fragment_kind, 'graph-fragments'),
+        'TIMEOUT': GRAPH_FRAGMENT_CACHE_TTL,
+        'OPTIONS': {'MAX_ENTRIES': 500},
+    },
+}
+
+# Under ASGI (uvicorn/daphne config.asgi:application) set ASYNC_VIEWS=1 to route
+# the graph and data endpoints to services/async_views.py, which runs their
+# SQLite/NumPy work on a pool of ASYNC_EXECUTOR_WORKERS threads.
+ASYNC_VIEWS = os.environ.get("ASYNC_VIEWS", "0").lower() in ("1", "true", "yes")
+ASYNC_EXECUTOR_WORKERS = int(os.environ.get("ASYNC_EXECUTOR_WORKERS", 4))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.1/ref/settings/#default-auto-field
 
@@ -19,6 +19,15 @@ from django.urls import path
 from services.views import health, interactiveMap, customnoaagraph, customshadehillgraph, customgauge, customcocograph, customgaugegraph, customdam, customdamgraph, test, custommesonet, custommesonetgraph, tabs, tabstest, maptabs, homepage, forecast, about, register, signup, signin, signout, generate_maptab_graph
 from django.contrib.staticfiles.urls import staticfiles_urlpatterns
 from services.views import favorites, login, contactus
+from services import api, export
+from django.conf import settings
+
+api_series = api.series
+if settings.ASYNC_VIEWS:
+    # ASGI: graph and data endpoints run off the event loop (services/async_views.py)
+    from services.async_views import customgaugegraph, customdamgraph, customcocograph, customnoaagraph, custommesonetgraph, customshadehillgraph, generate_maptab_graph
+    from services.async_views import series as api_series
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('customgaugegraph/', customgaugegraph),
@@ -38,6 +47,9 @@ urlpatterns = [
 #    path('tabstest/', tabstest),
     path('maptabs/', maptabs),
     path('generate_maptab_graph/', generate_maptab_graph),
+    path('api/v1/series', api_series, name='api-series'),
+    path('api/v1/export', export.export, name='api-export'),
+    path('api/v1/tile', api.tile, name='api-tile'),
     path('', homepage),
     path('forecast/', forecast),
     path('about/', about),
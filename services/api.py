@@ -0,0 +1,361 @@
+"""
+api.py
+Read API for raw time series, separate from the Plotly HTML views.
+
+    GET /api/v1/series?location=Bismarck&column=discharge&start=2024-01-01&end=2024-02-01
+                      [&table=gauge][&resolution=auto|raw|hourly|daily|monthly][&format=json|ndjson|binary]
+
+`json` returns one columnar object; `ndjson` streams a header line followed by
+one `[t, v]` row per line, for large raw ranges. With resolution=raw the rows
+are read from the database cursor as they are sent, never loaded as a whole,
+so the header's `count` is null. `t` is milliseconds since the epoch of the
+stored wall-clock time (read as UTC, as in the columnar archive).
+
+`binary` (application/octet-stream) skips number formatting on both ends:
+
+    uint32 LE  n            length of the JSON header that follows
+    n bytes    header       the json header fields, space-padded so the arrays start 8-byte aligned
+    count * 8  t            float64 LE, milliseconds since the epoch
+    count * 8  v            float64 LE, NaN for gaps
+
+so a browser can wrap the arrays in Float64Arrays without copying or parsing
+(static/js/seriesBinary.js). Times are float64 rather than int64 because
+Plotly and JavaScript numbers take them directly; milliseconds stay exact.
+
+The header's `fields` names the arrays in order. /api/v1/tile serves one tile
+of the zoom pyramid (tiles.py) in the same layout, with fields t, v, min, max
+and count, for graphs that fetch finer detail as the user zooms.
+
+Responses are gzip- or brotli-compressed when the client accepts it and carry
+a strong ETag derived from the series watermark (see series_cache.watermark),
+so a browser can revalidate with If-None-Match and get a 304 until new data is
+ingested for that series.
+"""
+
+import gzip
+import hashlib
+import json
+import math
+import sqlite3
+import struct
+import zlib
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+
+from config import settings
+from services import views
+from services.backend import latest_values, query_engine, rollups, series_cache, snapshots, tiles
+from services.backend.datasources.config import LOCATION_TO_TABLE, SQL_CONVERSION, TABLE_SCHEMAS
+
+try:
+    import brotli
+except ImportError:  # optional; responses fall back to gzip
+    brotli = None
+
+API_VERSION = "v1"
+RESOLUTIONS = ("auto", "raw") + rollups.RESOLUTIONS
+FORMATS = ("json", "ndjson", "binary")
+NDJSON_CHUNK_ROWS = 10000
+DEFAULT_WINDOW_DAYS = 30
+# pandas' datetime64[ns] range, less a day either side for the local-time conversion of bounds
+MIN_EPOCH = math.ceil(pd.Timestamp.min.timestamp()) + 86400
+MAX_EPOCH = math.floor(pd.Timestamp.max.timestamp()) - 86400
+
+
+class BadRequest(ValueError):
+    pass
+
+
+def _date(seconds) -> str:
+    return str(pd.Timestamp(seconds, unit="s").date())
+
+
+def _parse_time(value, name):
+    """
+    Accept epoch seconds or an ISO date/datetime; return epoch seconds or None.
+    Raises BadRequest for anything else, including inf/nan and times outside
+    the datetime64[ns] range the series are read into.
+    """
+    if value in (None, ""):
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            when = datetime.fromisoformat(value)
+        except ValueError:
+            raise BadRequest(f"'{name}' must be epoch seconds or an ISO date/datetime")
+        try:
+            seconds = when.timestamp()
+        except (ValueError, OverflowError, OSError):
+            seconds = math.nan  # too far out for the platform's local time; rejected below
+    if not math.isfinite(seconds) or not MIN_EPOCH <= seconds <= MAX_EPOCH:
+        raise BadRequest(f"'{name}' must be a time between {_date(MIN_EPOCH)} and {_date(MAX_EPOCH)}")
+    return int(seconds)
+
+
+def _series_ref(conn, query) -> tuple:
+    """Validate the query string's (table, location, column)."""
+    location = views._normalize_posted_location(query.get("location", ""))
+    if not location:
+        raise BadRequest("'location' is required")
+    table = query.get("table") or LOCATION_TO_TABLE.get(location)
+    if table not in TABLE_SCHEMAS:
+        raise BadRequest(f"unknown table '{table}'")
+    column = query.get("column", "")
+    column = SQL_CONVERSION.get(column, column)
+    if column not in query_engine.table_meta(conn, table).value_columns:
+        raise BadRequest(f"unknown column '{column}' for table '{table}'")
+    return table, location, column
+
+
+def _series_params(conn, query) -> dict:
+    """Validate the query string into (table, location, column, window, resolution)."""
+    table, location, column = _series_ref(conn, query)
+    resolution = query.get("resolution", "auto")
+    if resolution not in RESOLUTIONS:
+        raise BadRequest(f"'resolution' must be one of {', '.join(RESOLUTIONS)}")
+
+    start, end = _parse_time(query.get("start"), "start"), _parse_time(query.get("end"), "end")
+    if end is None:
+        entry = latest_values.get_latest(conn, table, location, column)
+        end_dt = datetime.fromisoformat(entry["ts"]) if entry else datetime.now()
+        end = int(end_dt.timestamp())
+    if start is None:
+        start = max(end - DEFAULT_WINDOW_DAYS * 86400, MIN_EPOCH)
+    if start > end:
+        raise BadRequest("'start' is after 'end'")
+    return {"table": table, "location": location, "column": column,
+            "start": start, "end": end, "resolution": resolution}
+
+
+def load_series(conn, p) -> tuple:
+    """Return (times datetime64[ns], values float64, summary) for validated params `p`."""
+    if p["resolution"] == "auto":
+        times, values, summary = views._load_series_many(
+            conn, [(p["table"], p["location"], p["column"], p["start"], p["end"])])[0]
+        return np.asarray(times, dtype="datetime64[ns]"), np.asarray(values, dtype=np.float64), summary
+    if p["resolution"] == "raw":
+        times, values = query_engine.fetch_series(conn, p["table"], p["location"], p["column"], p["start"], p["end"])
+        return times, values, None
+    buckets = rollups.query_rollup(conn, p["table"], p["location"], p["column"], p["start"], p["end"], p["resolution"])
+    if buckets.empty:
+        return np.empty(0, dtype="datetime64[ns]"), np.empty(0, dtype=np.float64), None
+    summary = rollups.summarize(conn, p["table"], p["location"], p["column"], p["start"], p["end"])
+    return (buckets["datetime"].to_numpy(dtype="datetime64[ns]"),
+            buckets["mean"].to_numpy(dtype=np.float64), summary)
+
+
+def series_etag(mark, p, fmt: str, encoding: str):
+    """Strong ETag for one representation of a series, or None without a watermark."""
+    if mark is None:
+        return None
+    key = json.dumps([API_VERSION, mark, p, fmt, getattr(settings, "GRAPH_POINT_BUDGET", 2000),
+                      getattr(settings, "GRAPH_DOWNSAMPLE", "lttb")], sort_keys=True, default=str)
+    suffix = {"br": "-br", "gzip": "-gz"}.get(encoding, "")
+    return f'"{hashlib.sha1(key.encode()).hexdigest()}{suffix}"'
+
+
+def _etag_matches(request, etag) -> bool:
+    header = request.headers.get("If-None-Match", "")
+    if not etag or not header:
+        return False
+    return header.strip() == "*" or etag in [t.strip() for t in header.split(",")]
+
+
+def choose_encoding(request) -> str:
+    accepted = {e.split(";")[0].strip() for e in request.headers.get("Accept-Encoding", "").split(",")}
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return "identity"
+
+
+def _compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body)
+    if encoding == "gzip":
+        return gzip.compress(body)
+    return body
+
+
+def _compress_stream(chunks, encoding: str):
+    """Compress an iterator of byte chunks incrementally."""
+    if encoding == "identity":
+        yield from chunks
+        return
+    comp = brotli.Compressor() if encoding == "br" else zlib.compressobj(wbits=31)  # 31: gzip container
+    for chunk in chunks:
+        out = comp.process(chunk) if encoding == "br" else comp.compress(chunk)
+        if out:
+            yield out
+    yield comp.finish() if encoding == "br" else comp.flush()
+
+
+def finish_response(response, etag, encoding: str):
+    if etag:
+        response["ETag"] = etag
+    if encoding != "identity":
+        response["Content-Encoding"] = encoding
+    response["Vary"] = "Accept-Encoding"
+    response["Cache-Control"] = "no-cache"  # always revalidate; 304s make that cheap
+    return response
+
+
+def _epoch_ms(times) -> np.ndarray:
+    return np.asarray(times, dtype="datetime64[ms]").astype(np.int64)
+
+
+def _header(p, count, summary) -> dict:
+    return {
+        "version": API_VERSION, "table": p["table"], "location": p["location"], "column": p["column"],
+        "resolution": p["resolution"], "start": p["start"], "end": p["end"], "count": None if count is None else int(count),
+        "summary": summary,
+    }
+
+
+def _ndjson_chunks(header, t_ms, values):
+    yield (json.dumps(dict(header, fields=["t", "v"])) + "\n").encode()
+    for i in range(0, len(t_ms), NDJSON_CHUNK_ROWS):
+        rows = zip(t_ms[i:i + NDJSON_CHUNK_ROWS].tolist(), values[i:i + NDJSON_CHUNK_ROWS].tolist())
+        yield "".join(f"[{t},{json.dumps(v) if v == v else 'null'}]\n" for t, v in rows).encode()
+
+
+def _ndjson_raw_chunks(header, p):
+    """
+    NDJSON for resolution=raw, read from the cursor NDJSON_CHUNK_ROWS at a time
+    (query_engine.iter_rows) as it is sent instead of loaded first. Gaps are
+    skipped and a repeated timestamp keeps its last value, as in fetch_series.
+    """
+    yield (json.dumps(dict(header, fields=["t", "v"])) + "\n").encode()
+    conn = snapshots.connect()
+    try:
+        held_t, held_v = np.empty(0, dtype=np.int64), np.empty(0)
+        for chunk in query_engine.iter_rows(conn, p["table"], p["location"], [p["column"]], p["start"], p["end"],
+                                            NDJSON_CHUNK_ROWS):
+            times = pd.to_datetime([row[0] for row in chunk], format="ISO8601", errors="coerce").to_numpy("datetime64[ms]")
+            values = pd.to_numeric(pd.Series([row[1] for row in chunk]), errors="coerce").to_numpy(np.float64)
+            keep = ~np.isnat(times) & ~np.isnan(values)
+            t_ms = np.concatenate([held_t, times[keep].astype(np.int64)])
+            v = np.concatenate([held_v, values[keep]])
+            # the last row is held back: the next chunk may repeat its timestamp
+            last = np.append(t_ms[1:] != t_ms[:-1], False)
+            held_t, held_v = t_ms[-1:], v[-1:]
+            rows = zip(t_ms[last].tolist(), v[last].tolist())
+            out = "".join(f"[{t},{json.dumps(x)}]\n" for t, x in rows)
+            if out:
+                yield out.encode()
+        if len(held_t):
+            yield f"[{int(held_t[0])},{json.dumps(float(held_v[0]))}]\n".encode()
+    finally:
+        conn.close()
+
+
+def _binary_payload(header, arrays: dict) -> bytes:
+    """The format=binary layout: header, then each of `arrays` as float64 LE, in order."""
+    meta = json.dumps(dict(header, fields=list(arrays), dtype="<f8"), separators=(",", ":")).encode()
+    meta += b" " * (-(4 + len(meta)) % 8)
+    return b"".join([struct.pack("<I", len(meta)), meta,
+                     *(np.asarray(a, dtype="<f8").tobytes() for a in arrays.values())])
+
+
+@require_GET
+def series(request):
+    fmt = request.GET.get("format")
+    if fmt is None:
+        fmt = "ndjson" if "application/x-ndjson" in request.headers.get("Accept", "") else "json"
+    if fmt not in FORMATS:
+        return JsonResponse({"error": f"'format' must be one of {', '.join(FORMATS)}"}, status=400)
+
+    conn = snapshots.connect()
+    try:
+        try:
+            p = _series_params(conn, request.GET)
+        except BadRequest as e:
+            return JsonResponse({"error": str(e)}, status=400)
+        except sqlite3.Error as e:
+            return JsonResponse({"error": f"series unavailable: {e}"}, status=404)
+
+        encoding = choose_encoding(request)
+        mark = series_cache.watermark(conn, p["table"], p["location"], p["column"])
+        etag = series_etag(mark, p, fmt, encoding)
+        if _etag_matches(request, etag):
+            return finish_response(HttpResponseNotModified(), etag, "identity")
+
+        if fmt == "ndjson" and p["resolution"] == "raw":
+            # streamed as read, so the row count isn't known up front
+            response = StreamingHttpResponse(_compress_stream(_ndjson_raw_chunks(_header(p, None, None), p), encoding),
+                                             content_type="application/x-ndjson")
+            return finish_response(response, etag, encoding)
+        times, values, summary = load_series(conn, p)
+    finally:
+        conn.close()
+
+    header = _header(p, len(times), summary)
+    t_ms = _epoch_ms(times)
+    if fmt == "ndjson":
+        response = StreamingHttpResponse(_compress_stream(_ndjson_chunks(header, t_ms, values), encoding),
+                                         content_type="application/x-ndjson")
+    elif fmt == "binary":
+        response = HttpResponse(_compress(_binary_payload(header, {"t": t_ms, "v": values}), encoding),
+                                content_type="application/octet-stream")
+    else:
+        # NaN isn't valid JSON; gaps are null
+        body = dict(header, t=t_ms.tolist(), v=[None if np.isnan(v) else v for v in values.tolist()])
+        payload = json.dumps(body, separators=(",", ":")).encode()
+        response = HttpResponse(_compress(payload, encoding), content_type="application/json")
+    return finish_response(response, etag, encoding)
+
+
+@require_GET
+def tile(request):
+    """
+    GET /api/v1/tile?location=Oahe&column=elevation&z=8&i=1234[&table=dam]
+
+    One tile of the zoom pyramid (see tiles.py) in the format=binary layout,
+    with fields t, v, min, max, count. A tile outside the representable time
+    range or, when the catalog knows them, the series' first and last
+    readings is a 400.
+    """
+    conn = snapshots.connect()
+    try:
+        try:
+            table, location, column = _series_ref(conn, request.GET)
+            z, i = int(request.GET.get("z", "")), int(request.GET.get("i", ""))
+        except BadRequest as e:
+            return JsonResponse({"error": str(e)}, status=400)
+        except ValueError:
+            return JsonResponse({"error": "'z' and 'i' must be integers"}, status=400)
+        except sqlite3.Error as e:
+            return JsonResponse({"error": f"series unavailable: {e}"}, status=404)
+        if not 0 <= z <= tiles.MAX_LEVEL:
+            return JsonResponse({"error": f"'z' must be between 0 and {tiles.MAX_LEVEL}"}, status=400)
+        valid = tiles.valid_tiles(z)
+        if i not in valid:
+            return JsonResponse({"error": f"'i' must be between {valid.start} and {valid.stop - 1} at level {z}"},
+                                status=400)
+        held = tiles.data_tiles(conn, table, location, column, z)
+        if held is not None and i not in held:
+            extent = f"tiles {held.start} to {held.stop - 1}" if held else "no tiles"
+            return JsonResponse({"error": f"tile {i} is outside the series' data ({extent} at level {z})"},
+                                status=400)
+
+        p = {"table": table, "location": location, "column": column, "z": z, "i": i}
+        encoding = choose_encoding(request)
+        mark = series_cache.watermark(conn, table, location, column)
+        etag = series_etag(mark, p, "tile", encoding)
+        if _etag_matches(request, etag):
+            return finish_response(HttpResponseNotModified(), etag, "identity")
+        data, _ = tiles.get(conn, table, location, column, z, i)
+    finally:
+        conn.close()
+
+    header = dict(p, version=API_VERSION, count=len(data["t"]), bucket_ms=tiles.bucket_seconds(z) * 1000,
+                  span_ms=tiles.span_seconds(z) * 1000, source=tiles.source_for(z))
+    response = HttpResponse(_compress(_binary_payload(header, data), encoding), content_type="application/octet-stream")
+    return finish_response(response, etag, encoding)
@@ -0,0 +1,12 @@
+from django.apps import AppConfig
+
+
+class ServicesConfig(AppConfig):
+    name = "services"
+
+    def ready(self):
+        # static/js/plotly.min.js is generated, not committed: write it on the
+        # first start (or collectstatic) of a fresh checkout
+        from services.backend import plotly_assets
+        if not plotly_assets.bundle_path().exists():
+            plotly_assets.write_bundle()
@@ -0,0 +1,150 @@
+"""
+async_views.py
+Async variants of the graph and data endpoints, for ASGI deployments.
+
+The sync views do their SQLite, pandas and Plotly work in the request thread,
+so a few slow multi-year graphs can tie up every worker. These wrappers keep
+the event loop free:
+
+- The view's work runs through sync_to_async (thread_sensitive=False) on a
+  bounded thread pool (ASYNC_EXECUTOR_WORKERS), so slow requests queue for a
+  thread instead of piling onto the server. Workers close stale database
+  connections before and after each view, as Django does around a request.
+- Graph views render per request, since their pages carry per-user content
+  (login state, CSRF tokens, cookies); the series and fragment loading under
+  them is already shared between concurrent requests (singleflight groups in
+  views.py). Identical /api/v1/series JSON requests, which depend on nothing
+  but their parameters, await the same computation and get their own copy of
+  its response.
+- When a client disconnects, Django cancels its view. Once every request
+  waiting on a computation is gone, the computation is cancelled too: its
+  SQLite statements are interrupted (see cancellation.py) and it stops at the
+  next check, freeing the thread.
+
+urls.py routes to these when settings.ASYNC_VIEWS is on.
+"""
+
+import asyncio
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.http import HttpResponse
+
+from config import settings
+from services import api, views
+from services.backend import cancellation
+
+executor = ThreadPoolExecutor(max_workers=getattr(settings, "ASYNC_EXECUTOR_WORKERS", 4),
+                              thread_name_prefix="graph-worker")
+
+# event loop -> {key: _Flight}; futures belong to the loop that created them
+_inflight = weakref.WeakKeyDictionary()
+
+_counts = {"started": 0, "joined": 0, "cancelled": 0}
+
+
+class _Flight:
+    def __init__(self, future, scope):
+        self.future = future
+        self.scope = scope
+        self.waiters = 0
+
+
+def _run(scope, fn, args):
+    close_old_connections()
+    try:
+        with cancellation.scope(scope):
+            cancellation.check()
+            return fn(*args)
+    finally:
+        close_old_connections()
+
+
+_run_async = sync_to_async(_run, thread_sensitive=False, executor=executor)
+
+
+def _forget(key, flight, inflight):
+    def done(future):
+        if inflight.get(key) is flight:
+            del inflight[key]
+        if not future.cancelled():
+            future.exception()  # retrieved, even if every waiter has gone
+    return done
+
+
+async def coalesced(key, fn, *args):
+    """
+    Run fn(*args) on a worker thread, or join the identical computation (same
+    `key`) already in flight. Cancelling the last waiter cancels the work.
+    """
+    loop = asyncio.get_running_loop()
+    inflight = _inflight.setdefault(loop, {})
+    flight = inflight.get(key)
+    if flight is None:
+        scope = cancellation.Scope()
+        flight = _Flight(asyncio.ensure_future(_run_async(scope, fn, args)), scope)
+        flight.future.add_done_callback(_forget(key, flight, inflight))
+        inflight[key] = flight
+        _counts["started"] += 1
+    else:
+        _counts["joined"] += 1
+    flight.waiters += 1
+    try:
+        return await asyncio.shield(flight.future)
+    finally:
+        flight.waiters -= 1
+        if flight.waiters == 0 and not flight.future.done():
+            # nobody is left to send the result to
+            flight.scope.cancel()
+            _counts["cancelled"] += 1
+            if inflight.get(key) is flight:
+                del inflight[key]
+
+
+def _copy_response(response):
+    """A private copy of a shared response, so middleware can't leak between requests."""
+    copy = HttpResponse(response.content, status=response.status_code)
+    for header, value in response.items():
+        copy[header] = value
+    for name, morsel in response.cookies.items():
+        copy.cookies[name] = morsel.copy()
+    return copy
+
+
+async def run(fn, *args):
+    """Run fn(*args) on a worker thread for this request alone; cancelling it cancels the work."""
+    return await coalesced(object(), fn, *args)
+
+
+def _graph_view(endpoint, view):
+    async def graph_view(request):
+        return await run(view, request)
+    graph_view.__name__ = graph_view.__qualname__ = endpoint
+    graph_view.__doc__ = f"Async {endpoint}: runs views.{endpoint} off the event loop."
+    return graph_view
+
+
+customgaugegraph = _graph_view("customgaugegraph", views.customgaugegraph)
+customdamgraph = _graph_view("customdamgraph", views.customdamgraph)
+custommesonetgraph = _graph_view("custommesonetgraph", views.custommesonetgraph)
+customcocograph = _graph_view("customcocograph", views.customcocograph)
+customshadehillgraph = _graph_view("customshadehillgraph", views.customshadehillgraph)
+customnoaagraph = _graph_view("customnoaagraph", views.customnoaagraph)
+generate_maptab_graph = _graph_view("generate_maptab_graph", views.generate_maptab_graph)
+
+
+async def series(request):
+    """Async /api/v1/series. NDJSON streams are per request; JSON bodies are coalesced."""
+    fmt = request.GET.get("format")
+    if fmt == "ndjson" or (fmt is None and "application/x-ndjson" in request.headers.get("Accept", "")):
+        return await run(api.series, request)
+    params = tuple(sorted((k, tuple(v)) for k, v in request.GET.lists()))
+    key = ("series", request.method, params, api.choose_encoding(request),
+           request.headers.get("If-None-Match", ""), request.headers.get("Accept", ""))
+    return _copy_response(await coalesced(key, api.series, request))
+
+
+def stats() -> dict:
+    return dict(_counts, inflight=sum(len(v) for v in _inflight.values()))
@@ -0,0 +1,165 @@
+"""
+blocks.py
+Compressed time-series blocks (Gorilla-style) for closed time ranges.
+
+A block holds up to BLOCK_POINTS (time, value) pairs:
+
+- timestamps (int64 epoch seconds) are stored as delta-of-deltas, which are
+  all zero for a fixed cadence;
+- values are stored either as deltas of fixed-point integers, when every value
+  is exactly a decimal with at most MAX_DECIMALS places (typical of gauge and
+  mesonet readings), or as the XOR of each float64 with its predecessor,
+  byte-shuffled so the mostly-zero high bytes line up.
+
+Both streams are narrowed to the smallest integer width that fits and then
+DEFLATE-compressed. That stands in for Gorilla's bit-level control codes, so
+encoding and decoding are whole-array NumPy operations. A series file is a
+plain concatenation of blocks; each block header carries its time range, so
+readers decode only the blocks that overlap a window.
+"""
+
+import struct
+import zlib
+
+import numpy as np
+
+MAGIC = b"TSB1"
+BLOCK_POINTS = 4096
+MAX_DECIMALS = 6
+
+CODEC_XOR = 0
+CODEC_DECIMAL = 1
+
+# magic, count, first_ts, last_ts, first_delta, ts_width, value_codec, value_width, scale,
+# ts payload length, value payload length
+HEADER = struct.Struct("<4sIqqqBBBBII")
+
+
+def _narrow(arr: np.ndarray) -> np.ndarray:
+    """Return `arr` (int64) cast to the smallest signed integer dtype that holds it."""
+    if arr.size == 0:
+        return arr.astype(np.int8)
+    lo, hi = int(arr.min()), int(arr.max())
+    for dtype in (np.int8, np.int16, np.int32):
+        info = np.iinfo(dtype)
+        if info.min <= lo and hi <= info.max:
+            return arr.astype(dtype)
+    return arr
+
+
+def _widen(buf: bytes, width: int) -> np.ndarray:
+    dtype = {1: np.int8, 2: np.int16, 4: np.int32, 8: np.int64}[width]
+    return np.frombuffer(buf, dtype=dtype).astype(np.int64)
+
+
+def _decimal_scale(values: np.ndarray):
+    """Return the smallest k <= MAX_DECIMALS with values exactly k-place decimals, or None."""
+    if not np.all(np.isfinite(values)):
+        return None
+    for k in range(MAX_DECIMALS + 1):
+        factor = 10.0 ** k
+        scaled = np.round(values * factor)
+        if np.abs(scaled).max(initial=0) >= 2 ** 53:
+            return None
+        if np.array_equal(scaled / factor, values):
+            return k
+    return None
+
+
+def encode_block(times: np.ndarray, values: np.ndarray) -> bytes:
+    """Encode one block. `times` are int64 epoch seconds (ascending), `values` float64."""
+    times = np.asarray(times, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
+    n = len(times)
+    if n == 0 or n != len(values):
+        raise ValueError("encode_block needs matching, non-empty time and value arrays")
+
+    deltas = np.diff(times)
+    first_delta = int(deltas[0]) if n > 1 else 0
+    dod = _narrow(np.diff(deltas))
+    ts_payload = zlib.compress(dod.tobytes())
+
+    scale = _decimal_scale(values)
+    if scale is not None:
+        ints = np.round(values * 10.0 ** scale).astype(np.int64)
+        vals = _narrow(np.diff(ints, prepend=np.int64(0)))
+        codec, width, raw = CODEC_DECIMAL, vals.itemsize, vals.tobytes()
+    else:
+        bits = values.view(np.uint64)
+        xored = bits ^ np.concatenate(([np.uint64(0)], bits[:-1]))
+        shuffled = xored.view(np.uint8).reshape(n, 8).T
+        codec, width, scale, raw = CODEC_XOR, 8, 0, np.ascontiguousarray(shuffled).tobytes()
+    value_payload = zlib.compress(raw)
+
+    header = HEADER.pack(
+        MAGIC, n, int(times[0]), int(times[-1]), first_delta,
+        dod.itemsize, codec, width, scale, len(ts_payload), len(value_payload),
+    )
+    return header + ts_payload + value_payload
+
+
+def read_header(buf, offset: int = 0) -> dict:
+    """Parse the block header at `offset`. Adds 'size', the block's total length in bytes."""
+    (magic, count, first_ts, last_ts, first_delta, ts_width, codec, width, scale,
+     ts_len, value_len) = HEADER.unpack_from(buf, offset)
+    if magic != MAGIC:
+        raise ValueError(f"Not a time-series block at offset {offset}")
+    return {
+        "count": count, "first_ts": first_ts, "last_ts": last_ts, "first_delta": first_delta,
+        "ts_width": ts_width, "codec": codec, "width": width, "scale": scale,
+        "ts_len": ts_len, "value_len": value_len, "size": HEADER.size + ts_len + value_len,
+    }
+
+
+def decode_block(buf, offset: int = 0) -> tuple:
+    """Decode the block at `offset` into (times int64, values float64) arrays."""
+    h = read_header(buf, offset)
+    n = h["count"]
+    start = offset + HEADER.size
+    ts_raw = zlib.decompress(buf[start:start + h["ts_len"]])
+    start += h["ts_len"]
+    value_raw = zlib.decompress(buf[start:start + h["value_len"]])
+
+    times = np.empty(n, dtype=np.int64)
+    times[0] = h["first_ts"]
+    if n > 1:
+        deltas = np.cumsum(np.concatenate(([h["first_delta"]], _widen(ts_raw, h["ts_width"]))))
+        times[1:] = h["first_ts"] + np.cumsum(deltas)
+
+    if h["codec"] == CODEC_DECIMAL:
+        values = np.cumsum(_widen(value_raw, h["width"])) / 10.0 ** h["scale"]
+    else:
+        xored = np.frombuffer(value_raw, dtype=np.uint8).reshape(8, n).T.copy().view(np.uint64).ravel()
+        values = np.bitwise_xor.accumulate(xored).view(np.float64)
+    return times, values
+
+
+def encode_series(times: np.ndarray, values: np.ndarray, block_points: int = BLOCK_POINTS) -> bytes:
+    """Encode a whole series as consecutive blocks of at most `block_points` points."""
+    return b"".join(
+        encode_block(times[i:i + block_points], values[i:i + block_points])
+        for i in range(0, len(times), block_points)
+    )
+
+
+def decode_series(buf, start: int = None, end: int = None) -> tuple:
+    """
+    Decode a concatenation of blocks into (times, values), skipping blocks that
+    lie entirely outside [start, end) (epoch seconds) and trimming the rest.
+    """
+    times_parts, value_parts = [], []
+    offset = 0
+    while offset < len(buf):
+        h = read_header(buf, offset)
+        if (start is None or h["last_ts"] >= start) and (end is None or h["first_ts"] < end):
+            t, v = decode_block(buf, offset)
+            times_parts.append(t)
+            value_parts.append(v)
+        offset += h["size"]
+    if not times_parts:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+    times = np.concatenate(times_parts)
+    values = np.concatenate(value_parts)
+    lo = 0 if start is None else int(np.searchsorted(times, start, side="left"))
+    hi = len(times) if end is None else int(np.searchsorted(times, end, side="left"))
+    return times[lo:hi], values[lo:hi]
@@ -0,0 +1,73 @@
+"""
+cancellation.py
+Cooperative cancellation of request work running in a worker thread.
+
+A thread running on behalf of a request enters a `Scope`. SQLite
+connections opened while it is active (snapshots.connect registers them) are
+tracked, and `Scope.cancel()`, called from any thread, interrupts their
+running statements, which then fail with sqlite3.OperationalError
+("interrupted"). Long Python loops can call `check()` between steps to stop
+early. Outside a scope both are no-ops.
+"""
+
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+_local = threading.local()
+
+
+class Cancelled(Exception):
+    pass
+
+
+class Scope:
+    def __init__(self):
+        self.cancelled = threading.Event()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def track(self, conn):
+        with self._lock:
+            self._connections.append(conn)
+        if self.cancelled.is_set():
+            conn.interrupt()
+        return conn
+
+    def cancel(self):
+        self.cancelled.set()
+        with self._lock:
+            connections = list(self._connections)
+        for conn in connections:
+            try:
+                conn.interrupt()
+            except sqlite3.ProgrammingError:
+                pass  # already closed
+
+
+def current():
+    return getattr(_local, "scope", None)
+
+
+@contextmanager
+def scope(s: Scope):
+    """Run the body of the with block inside `s` on this thread."""
+    previous = current()
+    _local.scope = s
+    try:
+        yield s
+    finally:
+        _local.scope = previous
+
+
+def track(conn):
+    """Register `conn` with the current scope, if any. Returns it."""
+    s = current()
+    return s.track(conn) if s is not None else conn
+
+
+def check():
+    """Raise Cancelled if the current scope has been cancelled."""
+    s = current()
+    if s is not None and s.cancelled.is_set():
+        raise Cancelled()
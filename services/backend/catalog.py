@@ -0,0 +1,170 @@
+"""
+catalog.py
+Per-series catalog: one row per (table, location, column) with row count,
+non-null count, first/last timestamp holding a value, and last update time.
+
+The write path refreshes the catalog from the monthly rollups right after the
+rollups themselves, so pages that need to know which series exist and how far
+they extend can read a handful of rows instead of scanning measurement tables.
+
+`python -m services.backend.catalog [--skip-rollups]` backfills the rollups,
+the catalog and latest values for a database that already holds measurements.
+"""
+
+import logging
+import sqlite3
+import sys
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+CATALOG_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS series_catalog(
+        tbl TEXT NOT NULL,
+        location TEXT NOT NULL,
+        col TEXT NOT NULL,
+        row_count INTEGER NOT NULL,
+        non_null_count INTEGER NOT NULL,
+        min_ts TEXT,
+        max_ts TEXT,
+        updated_at TEXT NOT NULL,
+        PRIMARY KEY(tbl, location, col)
+    ) WITHOUT ROWID
+"""
+
+
+def ensure_catalog_table(cursor):
+    """Create the catalog table if it doesn't exist."""
+    cursor.execute(CATALOG_SCHEMA)
+
+
+def _now() -> str:
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def refresh_catalog(cursor, table: str, location: str):
+    """
+    Recompute the catalog rows for (table, location) from rollup_monthly.
+    Must run after the rollups for the same write have been refreshed. Does not
+    commit.
+    """
+    cursor.execute(
+        """
+        INSERT OR REPLACE INTO series_catalog
+            (tbl, location, col, row_count, non_null_count, min_ts, max_ts, updated_at)
+        SELECT tbl, location, col, SUM(row_count), SUM(value_count),
+               MIN(first_ts), MAX(last_ts), ?
+        FROM rollup_monthly
+        WHERE tbl = ? AND location = ?
+        GROUP BY col
+        """,
+        (_now(), table, location),
+    )
+
+
+def rebuild_catalog(conn):
+    """Rebuild the whole catalog from rollup_monthly. Run after rebuild_rollups."""
+    cursor = conn.cursor()
+    ensure_catalog_table(cursor)
+    cursor.execute("DELETE FROM series_catalog")
+    cursor.execute(
+        """
+        INSERT INTO series_catalog
+            (tbl, location, col, row_count, non_null_count, min_ts, max_ts, updated_at)
+        SELECT tbl, location, col, SUM(row_count), SUM(value_count),
+               MIN(first_ts), MAX(last_ts), ?
+        FROM rollup_monthly
+        GROUP BY tbl, location, col
+        """,
+        (_now(),),
+    )
+    conn.commit()
+    logger.info(f"Rebuilt series catalog ({cursor.rowcount} series)")
+
+
+def list_series(conn, table: str = None, location: str = None) -> list:
+    """
+    Return catalog rows as dicts with keys tbl, location, col, row_count,
+    non_null_count, min_ts, max_ts, updated_at, optionally filtered by table and
+    location. Raises sqlite3.Error if the catalog table has not been created.
+    """
+    clauses, params = [], []
+    if table is not None:
+        clauses.append("tbl = ?")
+        params.append(table)
+    if location is not None:
+        clauses.append("location = ?")
+        params.append(location)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT tbl, location, col, row_count, non_null_count, min_ts, max_ts, updated_at "
+        f"FROM series_catalog {where} ORDER BY tbl, location, col",
+        params,
+    )
+    names = [d[0] for d in cur.description]
+    return [dict(zip(names, row)) for row in cur.fetchall()]
+
+
+def locations_by_table(conn) -> dict:
+    """
+    Return {table: [locations]} for every table with cataloged series, or an
+    empty dict if the catalog is missing or empty.
+    """
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT DISTINCT tbl, location FROM series_catalog ORDER BY tbl, location")
+        rows = cur.fetchall()
+    except sqlite3.Error:
+        return {}
+    out = {}
+    for tbl, location in rows:
+        out.setdefault(tbl, []).append(location)
+    return out
+
+
+def state(conn) -> tuple:
+    """
+    Return (watermark, last_updated) for the whole catalog: a string that
+    changes whenever any series is refreshed, and the newest updated_at. Both
+    are None if the catalog is missing or empty.
+    """
+    try:
+        row = conn.execute(
+            "SELECT COUNT(*), MAX(updated_at), SUM(row_count), SUM(non_null_count) FROM series_catalog"
+        ).fetchone()
+    except sqlite3.Error:
+        return None, None
+    if not row[0]:
+        return None, None
+    return "|".join(str(v) for v in row), row[1]
+
+
+def last_updated(conn, series):
+    """Newest updated_at among the (table, location, column) `series`, or None if none are cataloged."""
+    newest = None
+    try:
+        for table, location, column in set(series):
+            row = conn.execute(
+                "SELECT updated_at FROM series_catalog WHERE tbl = ? AND location = ? AND col = ?",
+                (table, location, column),
+            ).fetchone()
+            if row and (newest is None or row[0] > newest):
+                newest = row[0]
+    except sqlite3.Error:
+        return None
+    return newest
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    from services.backend.datasources.config import DB_PATH
+    from services.backend.latest_values import rebuild_latest
+    from services.backend.rollups import rebuild_rollups
+
+    conn = sqlite3.connect(DB_PATH)
+    if "--skip-rollups" not in sys.argv:
+        rebuild_rollups(conn)
+    rebuild_catalog(conn)
+    rebuild_latest(conn)
+    conn.close()
@@ -0,0 +1,190 @@
+"""
+changelog.py
+Append-only change log of writes to the measurement tables.
+
+Every write path records one compact row per (table, location, column) it
+touched: the time range written, the number of rows and the batch it belongs
+to. Records are appended in the writer's transaction (via
+sqlclasses.refresh_derived_tables), so a change is visible exactly when the data
+is.
+
+Downstream jobs read the log as named consumers. Each consumer keeps a cursor
+(the last change id it has processed) in `change_log_cursors`:
+
+    changes = changelog.read_changes(conn, "custom_graph")
+    if changes is None:        # new consumer: do a full rebuild
+        ...
+    else:
+        for (tbl, loc, col), span in changelog.summarize(changes).items(): ...
+    changelog.advance(conn, "custom_graph", head)
+
+`head` should be taken before doing the work, so changes that land meanwhile
+are seen on the next run.
+"""
+
+import os
+import sqlite3
+from datetime import datetime
+
+from services.backend.datasources.config import DB_PATH
+
+CHANGELOG_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS change_log(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        batch_id TEXT NOT NULL,
+        tbl TEXT NOT NULL,
+        location TEXT NOT NULL,
+        col TEXT,
+        min_ts TEXT NOT NULL,
+        max_ts TEXT NOT NULL,
+        row_count INTEGER NOT NULL,
+        logged_at TEXT NOT NULL
+    )
+    """,
+    # per-series watermark lookups (series_cache) read MAX(id) for one series
+    "CREATE INDEX IF NOT EXISTS change_log_series ON change_log(tbl, location, col, id)",
+    """
+    CREATE TABLE IF NOT EXISTS change_log_cursors(
+        consumer TEXT PRIMARY KEY,
+        last_id INTEGER NOT NULL,
+        updated_at TEXT NOT NULL
+    )
+    """,
+)
+
+# Batch id stamped on every record; one per process unless begin_batch is called.
+_batch = f"{datetime.now().strftime('%Y%m%d%H%M%S')}-{os.getpid()}"
+
+
+def ensure_changelog_tables(cursor):
+    """Create the change log and cursor tables if they don't exist."""
+    for sql in CHANGELOG_SCHEMA:
+        cursor.execute(sql)
+
+
+def begin_batch(label: str = "batch") -> str:
+    """Start a new batch; subsequent records carry the returned id."""
+    global _batch
+    _batch = f"{label}-{datetime.now().strftime('%Y%m%d%H%M%S%f')}-{os.getpid()}"
+    return _batch
+
+
+def record(cursor, table: str, location: str, times, columns=None):
+    """
+    Append change records for a write of `times` ('YYYY-MM-DD HH:MM:SS'
+    strings) to `table` for `location`. One row per column in `columns`; a
+    single row with col NULL ("any column") when the columns aren't known.
+    Does not commit.
+    """
+    times = [str(t) for t in times if t is not None]
+    if not times:
+        return
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    lo, hi, n = min(times), max(times), len(times)
+    cursor.executemany(
+        "INSERT INTO change_log (batch_id, tbl, location, col, min_ts, max_ts, row_count, logged_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        [(_batch, table, location, col, lo, hi, n, now) for col in (sorted(set(columns)) if columns else [None])],
+    )
+
+
+def head(conn) -> int:
+    """Id of the newest change (0 if the log is empty)."""
+    cursor = conn.cursor()
+    ensure_changelog_tables(cursor)
+    cursor.execute("SELECT COALESCE(MAX(id), 0) FROM change_log")
+    return cursor.fetchone()[0]
+
+
+def get_cursor(conn, consumer: str):
+    """Last change id processed by `consumer`, or None for a new consumer."""
+    cursor = conn.cursor()
+    ensure_changelog_tables(cursor)
+    cursor.execute("SELECT last_id FROM change_log_cursors WHERE consumer = ?", (consumer,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def read_changes(conn, consumer: str, upto: int = None, table: str = None):
+    """
+    Change records after `consumer`'s cursor (and at or before `upto` when
+    given), oldest first, as dicts. Returns None if the consumer has no cursor
+    yet, meaning it has to start from a full rebuild.
+    """
+    last = get_cursor(conn, consumer)
+    if last is None:
+        return None
+    sql = ("SELECT id, batch_id, tbl, location, col, min_ts, max_ts, row_count, logged_at "
+           "FROM change_log WHERE id > ?")
+    params = [last]
+    if upto is not None:
+        sql += " AND id <= ?"
+        params.append(upto)
+    if table is not None:
+        sql += " AND tbl = ?"
+        params.append(table)
+    cursor = conn.cursor()
+    cursor.execute(sql + " ORDER BY id", params)
+    keys = [d[0] for d in cursor.description]
+    return [dict(zip(keys, row)) for row in cursor.fetchall()]
+
+
+def summarize(changes) -> dict:
+    """
+    Collapse change records into {(tbl, location, col): {"min_ts", "max_ts",
+    "row_count"}}. col is None for records that didn't name their columns.
+    """
+    out = {}
+    for c in changes or ():
+        key = (c["tbl"], c["location"], c["col"])
+        span = out.get(key)
+        if span is None:
+            out[key] = {"min_ts": c["min_ts"], "max_ts": c["max_ts"], "row_count": c["row_count"]}
+        else:
+            span["min_ts"] = min(span["min_ts"], c["min_ts"])
+            span["max_ts"] = max(span["max_ts"], c["max_ts"])
+            span["row_count"] += c["row_count"]
+    return out
+
+
+def touches(summary: dict, table: str, location: str = None, column: str = None) -> bool:
+    """Whether a summary covers the series; None arguments match anything."""
+    for tbl, loc, col in summary:
+        if (tbl == table and (location is None or loc == location)
+                and (column is None or col is None or col == column)):
+            return True
+    return False
+
+
+def advance(conn, consumer: str, last_id: int):
+    """Move `consumer`'s cursor to `last_id` and commit."""
+    cursor = conn.cursor()
+    ensure_changelog_tables(cursor)
+    cursor.execute(
+        "INSERT OR REPLACE INTO change_log_cursors (consumer, last_id, updated_at) VALUES (?, ?, ?)",
+        (consumer, last_id, datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
+    )
+    conn.commit()
+
+
+def prune(conn) -> int:
+    """Delete changes every registered consumer has processed. Returns the count."""
+    cursor = conn.cursor()
+    ensure_changelog_tables(cursor)
+    cursor.execute("SELECT MIN(last_id) FROM change_log_cursors")
+    low = cursor.fetchone()[0]
+    if low is None:
+        return 0
+    cursor.execute("DELETE FROM change_log WHERE id <= ?", (low,))
+    conn.commit()
+    return cursor.rowcount
+
+
+if __name__ == "__main__":
+    conn = sqlite3.connect(DB_PATH)
+    print(f"change_log head: {head(conn)}")
+    cur = conn.execute("SELECT consumer, last_id, updated_at FROM change_log_cursors ORDER BY consumer")
+    for consumer, last_id, updated_at in cur.fetchall():
+        print(f"  {consumer}: {last_id} (updated {updated_at})")
+    conn.close()
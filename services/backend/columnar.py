@@ -0,0 +1,190 @@
+"""
+columnar.py
+Columnar archive of closed periods as memory-mapped NumPy arrays.
+
+Each series (table, location, column) is stored under
+{COLUMNAR_DIR}/{table}/{location}/ as two contiguous arrays written with np.save:
+
+    {column}.times.npy   int64 seconds since the epoch of the stored timestamp
+                         (the wall-clock string read as UTC, so it round-trips
+                         exactly and can be viewed as datetime64[s])
+    {column}.values.npy  float64 values, non-null readings only
+
+plus {column}.json recording the cutoff (`until`, exclusive), the export time
+and the series watermark read before the rows were (series_cache.watermark).
+Only rows before the cutoff are archived, so the files never change once a
+period is closed unless older data is backfilled, which moves the watermark
+and `export_all` picks up.
+
+With COLUMNAR_FORMAT = "blocks" the two arrays are replaced by a single
+compressed {column}.blk (see blocks.py), which is an order of magnitude smaller
+for regular sensor series but is decoded rather than memory-mapped.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from services.backend import blocks, partitions, series_cache
+from services.backend.datasources.config import COLUMNAR_DIR, COLUMNAR_FORMAT, DB_PATH
+
+logger = logging.getLogger(__name__)
+
+
+def _series_dir(table: str, location: str) -> str:
+    safe = "".join(c if c.isalnum() or c in ("-", "_") else "_" for c in location)
+    return os.path.join(COLUMNAR_DIR, table, safe)
+
+
+def _paths(table: str, location: str, column: str) -> tuple:
+    base = os.path.join(_series_dir(table, location), column)
+    return base + ".times.npy", base + ".values.npy", base + ".json", base + ".blk"
+
+
+def read_meta(table: str, location: str, column: str):
+    """Return the sidecar metadata for an archived series, or None."""
+    try:
+        with open(_paths(table, location, column)[2]) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def to_epoch(ts) -> np.ndarray:
+    """Convert timestamp strings (or datetimes) to int64 seconds, read as UTC."""
+    return pd.to_datetime(pd.Series(ts), errors="coerce").to_numpy("datetime64[s]").astype(np.int64)
+
+
+def _read_rows(conn, table: str, location: str, column: str, until: str) -> pd.DataFrame:
+    if partitions.enabled():
+        df = partitions.read_window(conn, table, "0000", until, where="location = ?", params=(location,))
+        df = df.loc[df["datetime"] < until, ["datetime", column]]
+    else:
+        df = pd.read_sql_query(
+            f'SELECT datetime, "{column}" FROM "{table}" WHERE location = ? AND datetime < ? ORDER BY datetime',
+            conn,
+            params=(location, until),
+        )
+    return df.dropna()
+
+
+def export_series(conn, table: str, location: str, column: str, until: str, watermark: str = None) -> int:
+    """
+    Write the archive for one series with all non-null rows before `until`
+    ('YYYY-MM-DD HH:MM:SS'). `watermark`, read before the rows, is recorded so
+    export_all can tell whether the series has changed since. Files are
+    replaced atomically. Returns the row count.
+    """
+    df = _read_rows(conn, table, location, column, until)
+    times = to_epoch(df["datetime"])
+    values = df[column].to_numpy(dtype=np.float64)
+    keep = times != np.iinfo(np.int64).min  # drop unparseable timestamps (NaT)
+    times, values = times[keep], values[keep]
+    order = np.argsort(times, kind="stable")
+    times, values = times[order], values[order]
+
+    os.makedirs(_series_dir(table, location), exist_ok=True)
+    times_path, values_path, meta_path, blocks_path = _paths(table, location, column)
+    if COLUMNAR_FORMAT == "blocks":
+        outputs = ((blocks_path, blocks.encode_series(times, values)),)
+        stale = (times_path, values_path)
+    else:
+        outputs = ((times_path, times), (values_path, values))
+        stale = (blocks_path,)
+    for path, data in outputs:
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            if isinstance(data, bytes):
+                f.write(data)
+            else:
+                np.save(f, np.ascontiguousarray(data))
+        os.replace(tmp, path)
+    for path in stale:
+        if os.path.exists(path):
+            os.remove(path)
+    meta = {"until": until, "rows": int(len(times)), "format": COLUMNAR_FORMAT, "watermark": watermark,
+            "exported_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+    with open(meta_path + ".tmp", "w") as f:
+        json.dump(meta, f)
+    os.replace(meta_path + ".tmp", meta_path)
+    return len(times)
+
+
+def export_all(conn, until: str = None):
+    """
+    Archive every cataloged series up to `until` (default: the partition hot
+    boundary, i.e. the start of the current hot window). Series whose archive
+    already covers `until` and whose watermark is the one recorded at the last
+    export are skipped.
+
+    The watermark is compared for equality rather than the catalog's
+    updated_at against the export time: both have one-second resolution, so a
+    write committed in the same second as an export, after its rows were read,
+    would otherwise count as archived.
+    """
+    until = until or partitions.hot_boundary()
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT tbl, location, col, updated_at, row_count, non_null_count, max_ts FROM series_catalog "
+        "WHERE non_null_count > 0 AND min_ts < ?",
+        (until,),
+    )
+    exported = 0
+    for table, location, column, *entry in cur.fetchall():
+        # without a change log, the catalog entry is the best watermark available
+        mark = (series_cache.watermark(conn, table, location, column)
+                or "|".join(str(v) for v in entry))
+        meta = read_meta(table, location, column)
+        if (meta and meta["until"] == until and meta.get("format", "npy") == COLUMNAR_FORMAT
+                and meta.get("watermark") == mark):
+            continue
+        try:
+            rows = export_series(conn, table, location, column, until, mark)
+        except (sqlite3.Error, OSError, KeyError) as e:
+            logger.warning(f"Columnar export failed for {table}/{location}/{column}: {e}")
+            continue
+        exported += 1
+        logger.info(f"Archived {rows} rows of {table}/{location}/{column} to {COLUMNAR_DIR}")
+    return exported
+
+
+def load_series(table: str, location: str, column: str, start=None, end=None):
+    """
+    Return (times, values) for an archived series restricted to
+    start <= time < end when given (datetimes or timestamp strings). `times` is
+    int64 seconds; use `times.view("datetime64[s]")` for a datetime view.
+
+    .npy archives come back as read-only views into memory-mapped files;
+    compressed archives are decoded, skipping blocks outside the window.
+    Returns None if the series hasn't been archived.
+    """
+    times_path, values_path, _, blocks_path = _paths(table, location, column)
+    start_e = None if start is None else int(to_epoch([start])[0])
+    end_e = None if end is None else int(to_epoch([end])[0])
+    if os.path.exists(blocks_path):
+        try:
+            with open(blocks_path, "rb") as f:
+                return blocks.decode_series(f.read(), start_e, end_e)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read {blocks_path}: {e}")
+            return None
+    try:
+        times = np.load(times_path, mmap_mode="r")
+        values = np.load(values_path, mmap_mode="r")
+    except (OSError, ValueError):
+        return None
+    lo = 0 if start_e is None else int(np.searchsorted(times, start_e, side="left"))
+    hi = len(times) if end_e is None else int(np.searchsorted(times, end_e, side="left"))
+    return times[lo:hi], values[lo:hi]
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    conn = sqlite3.connect(DB_PATH)
+    export_all(conn)
+    conn.close()
@@ -9,10 +9,26 @@ import pandas as pd
 import matplotlib.pyplot as plt
 from datetime import datetime
 import os
+import re
 import sys
 import pathlib
 import shutil
 
+try:
+    from services.backend import changelog, graph_manifest, latest_values, partitions, plotly_assets, query_engine
+    from services.backend.datasources.config import TABLE_SCHEMAS
+except ImportError:  # run as a standalone script outside the project
+    changelog = graph_manifest = latest_values = partitions = plotly_assets = query_engine = None
+    TABLE_SCHEMAS = None
+
+# Tables kept next to the measurements (rollups, catalog, change log, narrow
+# store); never graphed. Only consulted when TABLE_SCHEMAS isn't importable.
+DERIVED_TABLE_PREFIXES = ("sqlite_", "rollup_", "series_catalog", "latest_values", "change_log",
+                          "series", "observations", "narrow_columns")
+
+# change-log consumer name used to regenerate only the graphs whose data changed
+GRAPH_CONSUMER = "custom_graph"
+
 # --- CONFIG ---
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 
@@ -97,9 +113,13 @@ else:
 # -----------------------
 
 def list_tables(conn):
+    """Measurement tables in the database, including those the narrow store replaces with views."""
     cur = conn.cursor()
-    cur.execute("SELECT name FROM sqlite_master WHERE type='table';")
-    return [r[0] for r in cur.fetchall()]
+    cur.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'view') ORDER BY name;")
+    names = [r[0] for r in cur.fetchall()]
+    if TABLE_SCHEMAS is not None:
+        return [n for n in names if n in TABLE_SCHEMAS]
+    return [n for n in names if not n.startswith(DERIVED_TABLE_PREFIXES)]
 
 def list_columns(conn, table):
     cur = conn.cursor()
@@ -116,7 +136,14 @@ def detect_time_format(df):
     except (ValueError, TypeError):
         return 'string'
 
-def query_data(conn, table, start_epoch, end_epoch):
+def query_data(conn, table, start_epoch, end_epoch, locations=None, columns=None):
+    """
+    Rows of `table` between two epoch-second bounds with datetime parsed.
+    Delegates to query_engine, which pushes the optional `locations` and
+    `columns` filters into SQL; the inline version is only used standalone.
+    """
+    if query_engine:
+        return query_engine.fetch(conn, table, locations, columns, start_epoch, end_epoch)
     df = pd.read_sql_query(f"SELECT * FROM {table} LIMIT 1;", conn)
     fmt = detect_time_format(df)
 
@@ -127,12 +154,19 @@ def query_data(conn, table, start_epoch, end_epoch):
     else:
         start_dt = datetime.fromtimestamp(start_epoch).strftime("%Y-%m-%d %H:%M:%S")
         end_dt = datetime.fromtimestamp(end_epoch).strftime("%Y-%m-%d %H:%M:%S")
-        query = f"SELECT * FROM {table} WHERE datetime BETWEEN ? AND ?"
-        df = pd.read_sql_query(query, conn, params=(start_dt, end_dt))
+        if partitions and partitions.enabled():
+            df = partitions.read_window(conn, table, start_dt, end_dt)
+        else:
+            query = f"SELECT * FROM {table} WHERE datetime BETWEEN ? AND ?"
+            df = pd.read_sql_query(query, conn, params=(start_dt, end_dt))
         df['datetime'] = pd.to_datetime(df['datetime'], errors='coerce')
 
     return df
 
+def _plotlyjs_src():
+    """<script> source for standalone Plotly files: the shared static bundle, or the CDN."""
+    return plotly_assets.script_src() if plotly_assets is not None else "cdn"
+
 def export_interactive_html_plotly(df, datetime_col, value_col, out_path):
     """
     Create an interactive HTML plot using Plotly and save as a standalone file.
@@ -150,8 +184,8 @@ def export_interactive_html_plotly(df, datetime_col, value_col, out_path):
 
     fig = px.line(dff, x=datetime_col, y=value_col, title=f"{value_col} over time")
     fig.update_layout(autosize=True, margin=dict(l=40, r=20, t=50, b=40))
-    # write standalone html (include plotly.js from CDN)
-    fig.write_html(out_path, full_html=True, include_plotlyjs="cdn")
+    # standalone html loading the shared static plotly.js (CDN if it hasn't been written)
+    fig.write_html(out_path, full_html=True, include_plotlyjs=_plotlyjs_src())
     return out_path
 
 def export_interactive_html_mpld3(fig, out_path):
@@ -176,6 +210,19 @@ def ensure_graphs_dir():
 def _safe_name(s: str) -> str:
     return "".join(c if c.isalnum() or c in ("-", "_") else "_" for c in s).strip("_")
 
+def _remove_graphs(out_dir, table: str, column: str):
+    """Delete the cached graphs written by main() for (table, column), any location."""
+    pattern = re.compile(
+        rf"{re.escape(_safe_name(table))}__(?:.+__)?{re.escape(_safe_name(column))}__"
+        rf"(?:series\d+__)?\d{{8}}_\d{{8}}_interactive\.html"
+    )
+    for fname in os.listdir(out_dir):
+        if pattern.fullmatch(fname):
+            try:
+                os.remove(os.path.join(out_dir, fname))
+            except OSError as e:
+                print(f"Warning: unable to remove {fname}: {e}")
+
 def _prepare_df_for_plot(df: pd.DataFrame, datetime_col: str, value_col: str) -> pd.DataFrame:
     """
     Normalize and clean dataframe for plotting:
@@ -288,7 +335,7 @@ def save_interactive(df, table, column):
         import plotly.express as px
         fig = px.line(dff, x='datetime', y=column, title=f"{column} - {table}")
         fig.update_layout(autosize=True, margin=dict(l=40, r=20, t=50, b=40))
-        fig.write_html(out_path, full_html=True, include_plotlyjs="cdn")
+        fig.write_html(out_path, full_html=True, include_plotlyjs=_plotlyjs_src())
         print(f"Wrote interactive Plotly HTML -> {out_path}")
         return out_path
     except Exception:
@@ -348,15 +395,20 @@ def get_latest_datetime(conn, table: str, column: str):
     """
     Return the most recent datetime (as a datetime.datetime) for rows where `column` is not NULL,
     or None if no values exist. Handles epoch and string datetime formats.
+
+    The latest_values table is consulted first; the table is only scanned when
+    it has no entry for this table/column.
     """
     cur = conn.cursor()
     fmt = get_time_format(conn, table)
     try:
-        cur.execute(f'SELECT datetime FROM "{table}" WHERE "{column}" IS NOT NULL ORDER BY datetime DESC LIMIT 1')
-        row = cur.fetchone()
-        if not row or row[0] is None:
-            return None
-        ts = row[0]
+        ts = latest_values.latest_ts(conn, table, column) if latest_values else None
+        if ts is None:
+            cur.execute(f'SELECT datetime FROM "{table}" WHERE "{column}" IS NOT NULL ORDER BY datetime DESC LIMIT 1')
+            row = cur.fetchone()
+            if not row or row[0] is None:
+                return None
+            ts = row[0]
         if fmt == "epoch":
             try:
                 return datetime.fromtimestamp(int(ts))
@@ -376,11 +428,14 @@ def get_latest_datetime(conn, table: str, column: str):
         return None
 
 
-def main():
+def main(full: bool = False):
     """
     Generate interactive Plotly HTML for every table/column in the database.
     For tables that include a 'location' column, produce one HTML file per (location, column).
     Otherwise produce one file per (table, column).
+
+    After the first run only the (table, column) pairs with entries in the change
+    log since the previous run are regenerated; pass full=True to rebuild everything.
     """
     if not DB_PATH:
         print("[custom_graph] ERROR: DB_PATH is not set. "
@@ -398,21 +453,38 @@ def main():
 
     out_dir = ensure_graphs_dir()
 
-    # Clear existing cached graphs before generation
-    try:
-        for fname in os.listdir(out_dir):
-            fpath = os.path.join(out_dir, fname)
-            try:
-                if os.path.isdir(fpath):
-                    shutil.rmtree(fpath)
-                else:
-                    os.remove(fpath)
-            except Exception as e:
-                print(f"Warning: unable to remove {fpath}: {e}")
-    except Exception as e:
-        print(f"Warning clearing graphs directory {out_dir}: {e}")
+    # Work out what changed since the last run; None means regenerate everything
+    changed = None
+    head = None
+    if changelog:
+        try:
+            head = changelog.head(conn)
+            changes = None if full else changelog.read_changes(conn, GRAPH_CONSUMER, upto=head)
+            changed = None if changes is None else changelog.summarize(changes)
+        except sqlite3.Error as e:
+            print(f"Warning: change log unavailable, regenerating all graphs: {e}")
+            head = None
+    if changed is not None and not changed:
+        print("No measurement changes since the last run; graphs are up to date.")
+        conn.close()
+        return
 
-    tables = list_tables(conn)
+    # Clear existing cached graphs before a full generation
+    if changed is None:
+        try:
+            for fname in os.listdir(out_dir):
+                fpath = os.path.join(out_dir, fname)
+                try:
+                    if os.path.isdir(fpath):
+                        shutil.rmtree(fpath)
+                    else:
+                        os.remove(fpath)
+                except Exception as e:
+                    print(f"Warning: unable to remove {fpath}: {e}")
+        except Exception as e:
+            print(f"Warning clearing graphs directory {out_dir}: {e}")
+
+    tables = list_tables(conn) if changed is None else sorted({tbl for tbl, _, _ in changed})
     if not tables:
         print("\nERROR: No tables found in this database!")
         conn.close()
@@ -438,6 +510,12 @@ def main():
         ignored = {"datetime", "location", "rowid", "id"}
         data_columns = [c for c in columns if c.lower() not in ignored]
 
+        if changed is not None:
+            # incremental run: only the columns with logged changes, replacing their old graphs
+            data_columns = [c for c in data_columns if changelog.touches(changed, table, column=c)]
+            for c in data_columns:
+                _remove_graphs(out_dir, table, c)
+
         if not data_columns:
             print(f"No data columns found in table {table}, skipping.")
             total_skipped += 1
@@ -455,7 +533,7 @@ def main():
             start_epoch = int(start_dt.timestamp())
             end_epoch = int(end_dt.timestamp())
             try:
-                df = query_data(conn, table, start_epoch, end_epoch)
+                df = query_data(conn, table, start_epoch, end_epoch, columns=[column])
             except Exception as e:
                 print(f"Query failed for {table}/{column} ({start_dt} -> {end_dt}): {e}")
                 df = pd.DataFrame()
@@ -479,7 +557,7 @@ def main():
                     start_epoch = int(start_dt.timestamp())
                     end_epoch = int(end_dt.timestamp())
                     try:
-                        df = query_data(conn, table, start_epoch, end_epoch)
+                        df = query_data(conn, table, start_epoch, end_epoch, columns=[column])
                         if column in df.columns:
                             cols_keep = ["datetime", column] + (["location"] if "location" in df.columns else [])
                             df = df.loc[:, [c for c in cols_keep if c in df.columns]]
@@ -621,8 +699,13 @@ def main():
                         print(f"Fallback also failed for {table}/{column}: {e2}")
                         total_skipped += 1
 
+    if graph_manifest:
+        # one re-index covers everything written and removed above
+        graph_manifest.rebuild(out_dir)
+    if head is not None:
+        changelog.advance(conn, GRAPH_CONSUMER, head)
     conn.close()
     print(f"\nDone. Saved: {total_saved} interactive files. Skipped: {total_skipped}. Outputs in: {out_dir}")
 
 if __name__ == "__main__":
-    main()
+    main(full="--full" in sys.argv)
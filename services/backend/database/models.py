@@ -11,6 +11,9 @@ import numpy as np
 import tbats as tb
 import matplotlib as mpl
 from sqlclasses import dictpull
+import sqlite3
+from services.backend import columnar, partitions
+from services.backend.datasources.config import DB_PATH, SQL_CONVERSION
 import time as t
 import email.utils as eu
 import copy
@@ -30,10 +33,35 @@ import win32job
 from keras.utils import plot_model
 
 
-#Function to get all data for a variable, returned as two lists, a time and a value.
+#Function to get all data for a variable, returned as two NumPy arrays, a time (datetime64[s]) and a value.
+#Closed periods come straight from the memory-mapped columnar archive (no copy); only rows
+#newer than the archive cutoff are read through SQLite.
 def getData(location: str, variable: str, table: str) -> tuple:
-    start = datetime.date.fromtisoformat('1900-01-01').isoformat()
-    return dictpull(location,variable,table,start,datetime.today())
+    column = SQL_CONVERSION.get(variable, variable)
+    archived = columnar.load_series(table, location, column)
+    until = (columnar.read_meta(table, location, column) or {}).get('until', '1900-01-01')
+
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        if partitions.enabled():
+            tail = partitions.read_window(conn, table, until, '9999', where='location = ?', params=(location,))
+        else:
+            tail = pd.read_sql_query(f'SELECT datetime, "{column}" FROM "{table}" WHERE location = ? AND datetime >= ? ORDER BY datetime',
+                                     conn, params=(location, until))
+    finally:
+        conn.close()
+    tail = tail.loc[tail['datetime'] >= until, ['datetime', column]].dropna()
+    tail_times = columnar.to_epoch(tail['datetime'])
+    tail_values = tail[column].to_numpy(dtype=np.float64)
+
+    if archived is None:
+        times, values = tail_times, tail_values
+    elif len(tail_times):
+        times = np.concatenate([archived[0], tail_times])
+        values = np.concatenate([archived[1], tail_values])
+    else:
+        times, values = archived
+    return times.view('datetime64[s]'), values
 
 
     
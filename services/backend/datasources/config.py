@@ -442,6 +442,37 @@ DEFAULT_DB_PATH = BASE_DIR / "Measurements.db"
 
 DB_PATH = os.environ.get("MEASUREMENTS_DB_PATH", str(DEFAULT_DB_PATH))
 
+# Storage layout: "single" keeps all history in DB_PATH; "partitioned" keeps the
+# most recent PARTITION_HOT_YEARS calendar years in DB_PATH and moves older rows
+# into one SQLite file per table per year under SHARD_DIR.
+STORAGE_MODE = os.environ.get("MEASUREMENTS_STORAGE_MODE", "single")
+SHARD_DIR = os.environ.get("MEASUREMENTS_SHARD_DIR", str(Path(DB_PATH).resolve().parent / "shards"))
+PARTITION_HOT_YEARS = int(os.environ.get("MEASUREMENTS_HOT_YEARS", 1))
+
+# Columnar archive of closed periods: per-series .npy time/value arrays that can
+# be memory-mapped. Refreshed after each pull when MEASUREMENTS_COLUMNAR_ARCHIVE=1.
+COLUMNAR_DIR = os.environ.get("MEASUREMENTS_COLUMNAR_DIR", str(Path(DB_PATH).resolve().parent / "columnar"))
+COLUMNAR_ARCHIVE = os.environ.get("MEASUREMENTS_COLUMNAR_ARCHIVE", "0") == "1"
+# "npy" (memory-mapped, zero-copy reads) or "blocks" (compressed, see blocks.py)
+COLUMNAR_FORMAT = os.environ.get("MEASUREMENTS_COLUMNAR_FORMAT", "npy")
+
+# Read-only replica for the web tier: after each ingestion cycle a consistent copy
+# of DB_PATH is published under SNAPSHOT_DIR and views read from it instead.
+READ_REPLICA = os.environ.get("MEASUREMENTS_READ_REPLICA", "0") == "1"
+SNAPSHOT_DIR = os.environ.get("MEASUREMENTS_SNAPSHOT_DIR", str(Path(DB_PATH).resolve().parent / "snapshots"))
+SNAPSHOT_KEEP = int(os.environ.get("MEASUREMENTS_SNAPSHOT_KEEP", 2))
+
+# Series result cache for the graph views (see series_cache.py). The backend is
+# "local" (per-process LRU) or "django:<alias>" to share entries across workers
+# through a Django cache such as memcached or redis.
+SERIES_CACHE_BACKEND = os.environ.get("SERIES_CACHE_BACKEND", "local")
+SERIES_CACHE_MAX_BYTES = int(os.environ.get("SERIES_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+
+# Zoom tiles (see tiles.py), cached like series: "local" or "django:<alias>",
+# e.g. a file-based Django cache to keep them on disk across restarts.
+TILE_CACHE_BACKEND = os.environ.get("TILE_CACHE_BACKEND", "local")
+TILE_CACHE_MAX_BYTES = int(os.environ.get("TILE_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+
 LOCATION_TO_TABLE = {}
 
 # Fill in the location to table mapping
@@ -7,7 +7,7 @@ import io
 import sqlite3
 
 from services.backend.datasources.base2 import DataSource
-from services.backend.sqlclasses import _get_db_connection
+from services.backend.sqlclasses import _get_db_connection, refresh_derived_tables
 
 
 class NDGISWaterChem(DataSource):
@@ -274,6 +274,15 @@ class NDGISWaterChem(DataSource):
                 
                 sql = f"INSERT OR REPLACE INTO water_quality ({', '.join(columns)}) VALUES ({', '.join(placeholders)})"
                 cursor.execute(sql, values)
+
+            # Group written timestamps per station so each gets one derived-table refresh
+            written = {}
+            for data in self.processed:
+                times, params = written.setdefault(data['location'], ([], set()))
+                times.append(data['datetime'])
+                params.update(data['parameters'].keys())
+            for location, (times, params) in written.items():
+                refresh_derived_tables(cursor, "water_quality", location, times, params)
             
             conn.commit()
             print(f"Successfully stored {len(self.processed)} water quality records.")
@@ -4,7 +4,7 @@ from services.backend.datasources.utils import DataParser
 from services.backend.datasources.utils import DateHelper
 from services.backend.datasources.config import SHADEHILL_DATASETS
 import sqlite3
-from services.backend.sqlclasses import SQL_CONVERSION
+from services.backend.sqlclasses import SQL_CONVERSION, refresh_derived_tables
 
 class ShadehillDataSource(DataSource):
     """
@@ -145,6 +145,7 @@ class ShadehillDataSource(DataSource):
             
             # Get all unique timestamps
             timestamps = sorted(all_data.keys())
+            written_fields = set()
             
             for timestamp in timestamps:
                 datasets = all_data[timestamp]
@@ -163,6 +164,7 @@ class ShadehillDataSource(DataSource):
                             sql_field = SQL_CONVERSION.get(dataset_name)
                             if sql_field:
                                 update_fields.append(f"{sql_field} = ?")
+                                written_fields.add(sql_field)
                                 update_values.append(value)
                     
                     if update_fields:
@@ -181,6 +183,7 @@ class ShadehillDataSource(DataSource):
                             sql_field = SQL_CONVERSION.get(dataset_name)
                             if sql_field:
                                 fields.append(sql_field)
+                                written_fields.add(sql_field)
                                 values.append(value)
                                 placeholders.append('?')
                     
@@ -188,6 +191,7 @@ class ShadehillDataSource(DataSource):
                         sql = f"INSERT INTO shadehill ({', '.join(fields)}) VALUES ({', '.join(placeholders)})"
                         cursor.execute(sql, values)
             
+            refresh_derived_tables(cursor, "shadehill", location, timestamps, written_fields)
             conn.commit()
             print(f"Successfully stored {len(timestamps)} records with all datasets")
             
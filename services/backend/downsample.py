@@ -0,0 +1,86 @@
+"""
+downsample.py
+Reduce a time series to a fixed number of points for plotting.
+
+Two methods, both returning the indexes of the points to keep (ascending), so
+times and values stay paired and every kept point is a real reading:
+
+- "lttb": Largest-Triangle-Three-Buckets. Keeps the first and last point and,
+  from each of the buckets in between, the point forming the largest triangle
+  with the previously kept point and the average of the next bucket. Preserves
+  the visual shape of the line.
+- "minmax": the minimum and maximum of each bucket. Preserves every peak and
+  trough, which is what matters for flood stages and outages.
+
+Input arrays must already be clean (no NaN/NaT) and sorted by time.
+"""
+
+import numpy as np
+
+METHODS = ("lttb", "minmax")
+
+
+def _as_float(times: np.ndarray) -> np.ndarray:
+    times = np.asarray(times)
+    if np.issubdtype(times.dtype, np.datetime64):
+        times = times.astype("datetime64[ns]").view(np.int64)
+    return times.astype(np.float64)
+
+
+def lttb_indices(times, values, n: int) -> np.ndarray:
+    """Indexes of the `n` points LTTB keeps (all points if there are no more than n)."""
+    size = len(values)
+    if n >= size or n < 3:
+        return np.arange(size)
+    x = _as_float(times)
+    y = np.asarray(values, dtype=np.float64)
+    # bucket edges for the size - 2 interior points, split into n - 2 buckets
+    edges = (np.arange(n - 1) * (size - 2) / (n - 2)).astype(np.int64) + 1
+    edges[-1] = size - 1
+    keep = np.empty(n, dtype=np.int64)
+    keep[0], keep[-1] = 0, size - 1
+    a = 0
+    for i in range(n - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nxt_lo, nxt_hi = hi, edges[i + 2] if i + 2 < len(edges) else size
+        if nxt_hi <= nxt_lo:
+            nxt_lo, nxt_hi = size - 1, size
+        avg_x = x[nxt_lo:nxt_hi].mean()
+        avg_y = y[nxt_lo:nxt_hi].mean()
+        # twice the triangle area; the constant factor doesn't change the argmax
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(area))
+        keep[i + 1] = a
+    return keep
+
+
+def minmax_indices(times, values, n: int) -> np.ndarray:
+    """Indexes of the per-bucket minimum and maximum over (n - 2) // 2 buckets, plus both ends."""
+    size = len(values)
+    if n >= size or n < 4:
+        return np.arange(size)
+    buckets = (n - 2) // 2
+    y = np.asarray(values, dtype=np.float64)
+    ids = np.arange(size) * buckets // size
+    # sort by bucket, then value: the first entry of each bucket is its minimum, the last its maximum
+    order = np.lexsort((y, ids))
+    starts = np.searchsorted(ids, np.arange(buckets), side="left")
+    ends = np.append(starts[1:], size) - 1
+    keep = np.concatenate(([0, size - 1], order[starts], order[ends]))
+    return np.unique(keep)
+
+
+def downsample(times, values, n: int, method: str = "lttb") -> tuple:
+    """
+    Return (times, values) reduced to at most `n` points with `method`
+    ("lttb", "minmax" or "none"). Series already within `n` are returned as is.
+    """
+    if method == "none" or n <= 0 or len(values) <= n:
+        return times, values
+    if method == "minmax":
+        idx = minmax_indices(times, values, n)
+    elif method == "lttb":
+        idx = lttb_indices(times, values, n)
+    else:
+        raise ValueError(f"Unknown downsampling method '{method}'; expected one of {METHODS}")
+    return np.asarray(times)[idx], np.asarray(values)[idx]
@@ -0,0 +1,207 @@
+"""
+graph_manifest.py
+Index of the generated graph files in static/graphs.
+
+The graph generators record every file they write here, keyed by file name,
+with the location and metric it shows and the last date it covers:
+
+    {"version": 1, "graphs": {"dam__Oahe__elevation__20240101_20240131_interactive.html":
+                              {"location": "Oahe", "metric": "Elevation", "latest": "2024-01-31"}}}
+
+Pages look graphs up by location in an in-memory index built from that file
+instead of listing and parsing the directory on every request. The index is
+reloaded when the manifest's mtime changes. If the graphs directory changed
+after the manifest was written (files copied in or deleted by hand), or there
+is no manifest yet, it is rebuilt from one directory scan.
+
+The manifest sits next to the graphs directory, not in it, so writing it
+doesn't touch the directory's mtime. It is generated state and not committed
+(see .gitignore); a checkout without one rebuilds it on first use.
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+
+from services.backend.datasources.config import BASE_DIR
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+GRAPHS_DIR = BASE_DIR / "static" / "graphs"
+MANIFEST_PATH = BASE_DIR / "static" / "graphs_manifest.json"
+
+_lock = threading.Lock()
+# (manifest mtime_ns, graphs dir mtime_ns) the loaded index corresponds to
+_loaded = {"stamp": None, "graphs": {}, "by_location": {}, "memo": {}}
+
+
+def norm(s) -> str:
+    """Location/metric key: lower case, letters and digits only."""
+    return re.sub(r"[^0-9a-z]", "", (s or "").lower())
+
+
+def parse_filename(fn: str):
+    """
+    Return (location, metric, latest 'YYYY-MM-DD' or None) for a graph file
+    name, or None if the location can't be told from it. Handles both the
+    custom_graph pattern `table__Location__metric__YYYYMMDD_YYYYMMDD_interactive`
+    and createCustom's `<Metric> at <Location>`.
+    """
+    if not fn.lower().endswith(".html"):
+        return None
+    stem = fn[:-5]
+    if "__" in stem:
+        parts = stem.split("__")
+        if len(parts) < 3:
+            return None
+        location = parts[1].replace("_", " ").strip()
+        metric = parts[2].replace("_", " ").strip()
+    else:
+        atm = re.split(r"\s+at\s+", stem, flags=re.IGNORECASE)
+        if len(atm) < 2:
+            return None
+        location = atm[-1].replace("_", " ").strip()
+        metric = " at ".join(atm[:-1]).replace("_", " ").strip()
+
+    latest = None
+    m = re.search(r"(\d{6,8})_(\d{6,8})_interactive", fn)
+    if m:
+        end = m.group(2)
+        if len(end) == 8:
+            latest = f"{end[0:4]}-{end[4:6]}-{end[6:8]}"
+    else:
+        m2 = re.search(r"(\d{8})_interactive", fn)
+        if m2:
+            d = m2.group(1)
+            latest = f"{d[0:4]}-{d[4:6]}-{d[6:8]}"
+    return location, metric.title(), latest
+
+
+def _entry(fn: str):
+    parsed = parse_filename(fn)
+    if parsed is None:
+        return None
+    location, metric, latest = parsed
+    return {"location": location, "metric": metric, "latest": latest}
+
+
+def _read():
+    try:
+        with open(MANIFEST_PATH, encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if data.get("version") != MANIFEST_VERSION:
+        return None
+    return data.get("graphs", {})
+
+
+def _write(graphs: dict):
+    tmp = f"{MANIFEST_PATH}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"version": MANIFEST_VERSION, "graphs": graphs}, f, sort_keys=True)
+    os.replace(tmp, MANIFEST_PATH)
+
+
+def rebuild(graphs_dir=None) -> dict:
+    """Re-index every file in the graphs directory and write the manifest."""
+    graphs_dir = graphs_dir or GRAPHS_DIR
+    try:
+        files = os.listdir(graphs_dir)
+    except OSError:
+        files = []
+    graphs = {}
+    for fn in files:
+        entry = _entry(fn)
+        if entry is not None:
+            graphs[fn] = entry
+    try:
+        _write(graphs)
+    except OSError as e:
+        # read-only static dir: serve the scan, it'll be repeated next time
+        logger.warning(f"Unable to write {MANIFEST_PATH}: {e}")
+    return graphs
+
+
+def add(path):
+    """Record a graph file the caller has just written."""
+    fn = os.path.basename(str(path))
+    entry = _entry(fn)
+    if entry is None:
+        return
+    with _lock:
+        graphs = _read()
+        if graphs is None:
+            graphs = rebuild(os.path.dirname(str(path)) or GRAPHS_DIR)
+        graphs[fn] = entry
+        _write(graphs)
+
+
+def _mtime_ns(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _index():
+    """The loaded index, reloaded or rebuilt if the manifest or directory changed."""
+    stamp = (_mtime_ns(MANIFEST_PATH), _mtime_ns(GRAPHS_DIR))
+    if stamp == _loaded["stamp"]:
+        return _loaded
+    with _lock:
+        graphs = _read() if stamp[0] is not None else None
+        # >=: a directory change in the same mtime tick as the last write may be newer
+        if graphs is None or (stamp[1] is not None and stamp[1] >= stamp[0]):
+            graphs = rebuild()
+            stamp = (_mtime_ns(MANIFEST_PATH), _mtime_ns(GRAPHS_DIR))
+        by_location = {}
+        for fn in sorted(graphs):
+            e = graphs[fn]
+            metric = by_location.setdefault(norm(e["location"]), {}).setdefault(
+                e["metric"], {"files": [], "latest": None})
+            metric["files"].append(fn)
+            if e["latest"] and (metric["latest"] is None or e["latest"] > metric["latest"]):
+                metric["latest"] = e["latest"]
+        _loaded.update(stamp=stamp, graphs=graphs, by_location=by_location, memo={})
+    return _loaded
+
+
+def for_location(location) -> dict:
+    """{metric: {"files": [...], "latest": date or None}} for one location ({} if none)."""
+    return _index()["by_location"].get(norm(location), {})
+
+
+def files_matching(places) -> dict:
+    """
+    {place: sorted file names whose name contains the place}, computed once
+    per manifest change for a given list of places.
+    """
+    index = _index()
+    key = ("matching", tuple(places))
+    if key not in index["memo"]:
+        out = {}
+        for fn in sorted(index["graphs"]):
+            fn_norm = norm(fn)
+            for place in places:
+                if norm(place) in fn_norm:
+                    out.setdefault(place, []).append(fn)
+        index["memo"][key] = out
+    return index["memo"][key]
+
+
+def stamp() -> tuple:
+    """(manifest mtime_ns, graphs directory mtime_ns) of the loaded index; changes with the graphs."""
+    return _index()["stamp"]
+
+
+def stats() -> dict:
+    return {"graphs": len(_index()["graphs"]), "locations": len(_loaded["by_location"]),
+            "manifest": str(MANIFEST_PATH)}
+
+
+if __name__ == "__main__":
+    print(f"Indexed {len(rebuild())} graphs -> {MANIFEST_PATH}")
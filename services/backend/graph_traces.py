@@ -0,0 +1,38 @@
+"""
+graph_traces.py
+Line traces for any number of series, SVG or WebGL by size.
+
+SVG (go.Scatter) keeps one DOM node per point, so a dense multi-site,
+multi-year comparison can freeze the browser tab. Past settings.GRAPH_WEBGL_POINTS
+points in total, line_traces() builds go.Scattergl traces instead, which
+draw on a canvas and stay interactive. The whole figure switches at once so
+every trace is drawn by the same renderer.
+
+    traces = graph_traces.line_traces([{"x": times, "y": values, "name": site}, ...])
+"""
+
+import plotly.graph_objs as go
+
+from config import settings
+
+
+def trace_type(total_points: int, threshold: int = None):
+    """go.Scattergl above the threshold (settings.GRAPH_WEBGL_POINTS by default), else go.Scatter."""
+    threshold = getattr(settings, "GRAPH_WEBGL_POINTS", 5000) if threshold is None else threshold
+    return go.Scattergl if total_points > threshold else go.Scatter
+
+
+def line_traces(series, colors=None, threshold: int = None) -> list:
+    """
+    One trace per dict of trace properties in `series` (at least x and y),
+    drawn as lines. `colors`, if given, is cycled over the traces.
+    """
+    series = list(series)
+    trace = trace_type(sum(len(s["y"]) for s in series), threshold)
+    traces = []
+    for i, props in enumerate(series):
+        props = dict({"mode": "lines"}, **props)
+        if colors:
+            props.setdefault("marker", dict(color=colors[i % len(colors)]))
+        traces.append(trace(**props))
+    return traces
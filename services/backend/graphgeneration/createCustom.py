@@ -1,5 +1,10 @@
+import os
+
 import plotly.graph_objs as go
 import plotly.offline
+
+from services.backend import graph_manifest, graph_traces, plotly_assets, stats
+from services.backend.datasources.config import BASE_DIR
 import numpy as np
 
 #dictionary to check if any location in locations list matches one of these
@@ -43,32 +48,21 @@ colors = ['rgb(2, 35, 82)', 'rgb(247, 100, 40)', 'rgb(209, 167, 2)','rgb(3, 111,
         ]
 
 def createExcel(locations, times, datalist):
+    # for downloads use /api/v1/export (services/export.py), which streams from the database
     import xlsxwriter
-    workbook = xlsxwriter.Workbook('map\static\customdata\customsheet.xlsx')
+    file_name = BASE_DIR / "static" / "customdata" / "customsheet.xlsx"
+    os.makedirs(file_name.parent, exist_ok=True)
+    workbook = xlsxwriter.Workbook(str(file_name), {"constant_memory": True})
     worksheet = workbook.add_worksheet()
 
-    Length = len(locations)
-    ColumnHeaders = ["Time", ]
-
-    for i in range(0,Length):
-        ColumnHeaders.append(str(locations[i]))
-
-    for i in range(0, Length + 1):
-        worksheet.write(0, i, ColumnHeaders[i])
-
-    listy = [times, ]
-    for item in range(0, len(datalist)):
-        listy.append(datalist[item])
-
-    for i in range(0, len(times)):
-        for j in range(0, Length + 1):
-            worksheet.write(i + 1, j, listy[j][i])
+    worksheet.write_row(0, 0, ["Time", *(str(location) for location in locations)])
+    for i, row in enumerate(zip(times, *datalist)):
+        worksheet.write_row(i + 1, 0, row)
     workbook.close()
 
 def customGraph(times, locations, datalist, data2see, cache):
     
-    index = 0
-    traces = [0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0]
+    traces = []
     ylabels = []
 
     datasetdict = {"relativeHumidity": "Relative Humidity",
@@ -82,11 +76,11 @@ def customGraph(times, locations, datalist, data2see, cache):
     except:
         pass
 
-    for i in locations:
-        trace, ylabel = makeTrace(times, locations[index], datalist[index], data2see, index, colors)
-        traces[index] = trace
+    for index, location in enumerate(locations):
+        trace, ylabel = makeTrace(times, location, datalist[index], data2see, index, colors)
+        traces.append(trace)
         ylabels.append(ylabel)
-        index += 1
+    index = len(traces)
 
 
     title = data2see + " at " 
@@ -104,32 +98,26 @@ def customGraph(times, locations, datalist, data2see, cache):
     return plot
 
 def makeTrace(times, location, graphdata, data2graph, index, colors):
+    # trace properties; makeGraph picks SVG or WebGL once it knows the total size
 
     ylabel = (f'{data2graph} in {location}')
     if "_" in data2graph:
         data2graph = data2graph.split("_")
         data2graph = data2graph[0] + " " + data2graph[1]
-    trace = go.Scatter(
+    trace = dict(
                         x = times,
                         y = graphdata,
                         mode = "lines",
                         name = f"{data2graph} in {location}",
-                        marker = dict(color = colors[index]),
+                        marker = dict(color = colors[index % len(colors)]),
                         text = ylabel)
 
     return trace, ylabel
 
 def makeGraph(traces, title, ylabels, index, colors, data2see, locations, cache):
 
-    tracelist = [traces[0], [traces[0], traces[1]], [traces[0], traces[1], traces[2]], [traces[0], traces[1], traces[2], traces[3]],
-                 [traces[0], traces[1], traces[2], traces[3], traces[4]], [traces[0], traces[1], traces[2], traces[3], traces[4], traces[5]],
-                 [traces[0], traces[1], traces[2], traces[3], traces[4], traces[5], traces[6]], [traces[0], traces[1], traces[2], traces[3], traces[4], traces[5], traces[6], traces[7]],
-                 [traces[0], traces[1], traces[2], traces[3], traces[4], traces[5], traces[6], traces[7], traces[8]],
-                 [traces[0], traces[1], traces[2], traces[3], traces[4], traces[5], traces[6], traces[7], traces[8], traces[9]],
-                 [traces[0], traces[1], traces[2], traces[3], traces[4], traces[5], traces[6], traces[7], traces[8], traces[9], traces[10]],
-                 [traces[0], traces[1], traces[2], traces[3], traces[4], traces[5], traces[6], traces[7], traces[8], traces[9], traces[10], traces[11]],
-                 [traces[0], traces[1], traces[2], traces[3], traces[4], traces[5], traces[6], traces[7], traces[8], traces[9], traces[10], traces[11], traces[12]]
-                 ]
+    # any number of traces; Scattergl past settings.GRAPH_WEBGL_POINTS points in total
+    data = graph_traces.line_traces(traces[:index])
 
     for location in locations:        
         if dam_dict.get(location, 0) != 0:
@@ -139,88 +127,33 @@ def makeGraph(traces, title, ylabels, index, colors, data2see, locations, cache)
         else:
              ylabel = data2see
 
-    for i in range(index):
-        if index == 1:
-                    layout = dict(title = {"text": title,'y':0.9,'x':0.5,'xanchor': 'center','yanchor': 'top'},
-                      xaxis = dict(title = 'Time',
-                showspikes=True,
-                spikethickness=2,
-                spikedash="dot",
-                spikecolor="purple",
-                spikemode="across"),
-                      yaxis = dict(title = ylabel))
-                    data = tracelist[i]
-
-        elif (i == 0) and (index != 1):
-                    layout = dict(
-            title = {"text": title,'y':0.9,'x':0.5,'xanchor': 'center','yanchor': 'top'},
-            xaxis = dict(title= 'Months',
+    layout = dict(title = {"text": title,'y':0.9,'x':0.5,'xanchor': 'center','yanchor': 'top'},
+                  xaxis = dict(title = 'Time' if index == 1 else 'Months',
                 showspikes=True,
                 spikethickness=2,
                 spikedash="dot",
                 spikecolor="purple",
                 spikemode="across"),
-            yaxis = dict(title = ylabel))
-                    
-        else:
-                    layout.update (dict(yaxis = dict(title = ylabel, 
-                          overlaying = 'y', 
-                          side = 'left',titlefont=dict(color= 'black'), tickfont=dict(color= 'black'))
-                         ))
-                    data = tracelist[i]
+                  yaxis = dict(title = ylabel))
 
     if cache == 0:
-        plot = plotly.offline.plot({"data": data, "layout": layout}, output_type = 'div')
+        plot = plotly_assets.to_div({"data": data, "layout": layout})
         return plot
     else:
         file_name = f'./static/graphs/{title}.html'
-        plotly.offline.plot({"data": data, "layout": layout}, filename = file_name, auto_open=False)
+        plotly_assets.write_html({"data": data, "layout": layout}, file_name)
+        graph_manifest.add(file_name)
 
 def makeTable(graphdata, title):
-    statistics_list = [[], [], [], [], [], []]
-    custom_height = 50
-    
-    listy = []
-
-    for i in range(len(graphdata)):
-        listy.append([])
-        for j in range(len(graphdata[i])):
-            if type(graphdata[i][j]) == float:
-                listy[i].append(graphdata[i][j])
-
-    for i in range(len(listy)):
-
-        # Mean
-        cur_mean = np.around(np.mean(listy[i]), 3)
-        statistics_list[0].append(cur_mean)
-
-        # Standard Deviation
-        cur_sd = np.around(np.std(listy[i]), 3)
-        statistics_list[1].append(cur_sd)
-
-        # Median
-        cur_median = np.around(np.median(listy[i]), 3)
-        statistics_list[2].append(cur_median)
-
-        # Minimum
-        cur_minimum = np.around(np.min(listy[i]), 3)
-        statistics_list[3].append(cur_minimum)
-
-        # Maximum
-        cur_maximum = np.around(np.max(listy[i]), 3)
-        statistics_list[4].append(cur_maximum)
-
-        # Range
-        cur_range = np.around(cur_maximum - cur_minimum, 3)
-        statistics_list[5].append(cur_range)
-
-        custom_height += 25
+    rows = [stats.table_row(summary) for summary in stats.describe_many(graphdata)]
+    statistics_list = [[row[field] for row in rows] for field in stats.FIELDS]
+    custom_height = 50 + 25 * len(rows)
 
     data = go.Figure(
         data=[go.Table(
             header=dict(values=['Mean', 'SD', 'Median', 'Minimum', 'Maximum', 'Range']),
             cells=dict(values=statistics_list),
-            cells_font=dict(color=[colors[0:len(listy)]])
+            cells_font=dict(color=[colors[0:len(rows)]])
         )]
     )
 
@@ -228,8 +161,9 @@ def makeTable(graphdata, title):
                        height=custom_height)
 
     if title == 0:
-        plot = plotly.offline.plot({'data': data}, output_type = 'div')
+        plot = plotly_assets.to_div({'data': data})
         return plot
     else:
         file_name = f'./static/graphs/{title}.html'
-        plotly.offline.plot({"data": data}, filename = file_name, auto_open=False)
+        plotly_assets.write_html({"data": data}, file_name)
+        graph_manifest.add(file_name)
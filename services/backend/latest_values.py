@@ -0,0 +1,147 @@
+"""
+latest_values.py
+Newest value per series, kept in `latest_values` for "current conditions" lookups.
+
+One row per (table, location, column) with the timestamp and value of the most
+recent non-null reading. The write path refreshes it after the series catalog:
+the catalog already knows the last timestamp holding a value, so each column
+costs one primary-key lookup into the measurement table.
+"""
+
+import logging
+import sqlite3
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+LATEST_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS latest_values(
+        tbl TEXT NOT NULL,
+        location TEXT NOT NULL,
+        col TEXT NOT NULL,
+        ts TEXT NOT NULL,
+        value REAL,
+        updated_at TEXT NOT NULL,
+        PRIMARY KEY(tbl, location, col)
+    ) WITHOUT ROWID
+"""
+
+
+def ensure_latest_table(cursor):
+    """Create the latest_values table if it doesn't exist."""
+    cursor.execute(LATEST_SCHEMA)
+
+
+def refresh_latest(cursor, table: str, location: str, source: str = None):
+    """
+    Recompute latest_values for (table, location) from series_catalog. Must run
+    after the catalog for the same write has been refreshed. Values are read
+    from `source` (defaults to `table`). Does not commit.
+    """
+    source = source or f'"{table}"'
+    cursor.execute(
+        "SELECT col, max_ts FROM series_catalog WHERE tbl = ? AND location = ?",
+        (table, location),
+    )
+    series = cursor.fetchall()
+    cursor.execute(
+        "SELECT col, ts FROM latest_values WHERE tbl = ? AND location = ?",
+        (table, location),
+    )
+    stored = dict(cursor.fetchall())
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    for column, max_ts in series:
+        if max_ts is None:
+            cursor.execute(
+                "DELETE FROM latest_values WHERE tbl = ? AND location = ? AND col = ?",
+                (table, location, column),
+            )
+            continue
+        cursor.execute(
+            f'SELECT "{column}" FROM {source} WHERE location = ? AND datetime = ?',
+            (location, max_ts),
+        )
+        row = cursor.fetchone()
+        if row is None and max_ts == stored.get(column):
+            # row lives in a yearly shard that isn't attached; keep the stored value
+            continue
+        cursor.execute(
+            "INSERT OR REPLACE INTO latest_values (tbl, location, col, ts, value, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (table, location, column, max_ts, row[0] if row else None, now),
+        )
+
+
+def rebuild_latest(conn):
+    """Rebuild latest_values for every cataloged series. Run after rebuild_catalog."""
+    cursor = conn.cursor()
+    ensure_latest_table(cursor)
+    cursor.execute("DELETE FROM latest_values")
+    cursor.execute("SELECT DISTINCT tbl, location FROM series_catalog")
+    for table, location in cursor.fetchall():
+        refresh_latest(cursor, table, location)
+    conn.commit()
+    logger.info("Rebuilt latest values")
+
+
+def get_latest(conn, table: str, location: str, column: str):
+    """
+    Return {'ts': str, 'value': float} for the newest reading of one series, or
+    None if it has no entry (or the table hasn't been created).
+    """
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            "SELECT ts, value FROM latest_values WHERE tbl = ? AND location = ? AND col = ?",
+            (table, location, column),
+        )
+        row = cur.fetchone()
+    except sqlite3.Error:
+        return None
+    return {"ts": row[0], "value": row[1]} if row else None
+
+
+def get_latest_bulk(conn, table: str = None, location: str = None) -> dict:
+    """
+    Return {(table, location, column): {'ts': str, 'value': float}} for every
+    series, optionally restricted to one table and/or location. Empty if the
+    table hasn't been created.
+    """
+    clauses, params = [], []
+    if table is not None:
+        clauses.append("tbl = ?")
+        params.append(table)
+    if location is not None:
+        clauses.append("location = ?")
+        params.append(location)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    try:
+        cur = conn.cursor()
+        cur.execute(f"SELECT tbl, location, col, ts, value FROM latest_values {where}", params)
+        rows = cur.fetchall()
+    except sqlite3.Error:
+        return {}
+    return {(t, l, c): {"ts": ts, "value": v} for t, l, c, ts, v in rows}
+
+
+def latest_ts(conn, table: str, column: str):
+    """
+    Return the newest timestamp string for table/column across all locations, or
+    None if there is no entry.
+    """
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT MAX(ts) FROM latest_values WHERE tbl = ? AND col = ?", (table, column))
+        row = cur.fetchone()
+    except sqlite3.Error:
+        return None
+    return row[0] if row else None
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    from services.backend.datasources.config import DB_PATH
+
+    conn = sqlite3.connect(DB_PATH)
+    rebuild_latest(conn)
+    conn.close()
@@ -0,0 +1,227 @@
+"""
+narrow.py
+Narrow observation store for the "narrow" storage mode.
+
+Every (source table, location, column) gets an integer id in `series`, and each
+reading is one row of `observations(series_id, ts, value)`, a WITHOUT ROWID
+table clustered on (series_id, ts). Reading one series over a window is then a
+single contiguous primary-key range scan, NULLs take no space, and adding a
+metric is an insert into `narrow_columns` rather than an ALTER TABLE.
+
+The wide tables named in TABLE_SCHEMAS are kept as views that pivot the
+observations back into (location, datetime, col1, col2, ...) rows. INSTEAD OF
+triggers on those views route INSERT, UPDATE and DELETE into the narrow tables,
+so existing readers and writers keep working unchanged. Unlike a wide-table
+INSERT OR REPLACE, inserting a row leaves columns it doesn't mention intact.
+"""
+
+import logging
+import re
+import sqlite3
+
+from services.backend.datasources.config import DB_PATH, STORAGE_MODE, TABLE_SCHEMAS
+
+logger = logging.getLogger(__name__)
+
+NARROW_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS series(
+        id INTEGER PRIMARY KEY,
+        source TEXT NOT NULL,
+        location TEXT NOT NULL,
+        col TEXT NOT NULL,
+        UNIQUE(source, location, col)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS observations(
+        series_id INTEGER NOT NULL,
+        ts TEXT NOT NULL,
+        value REAL,
+        PRIMARY KEY(series_id, ts)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS narrow_columns(
+        source TEXT NOT NULL,
+        col TEXT NOT NULL,
+        PRIMARY KEY(source, col)
+    )
+    """,
+)
+
+KEY_COLUMNS = ("location", "datetime")
+
+
+def enabled() -> bool:
+    return STORAGE_MODE == "narrow"
+
+
+def _lit(s: str) -> str:
+    return "'" + s.replace("'", "''") + "'"
+
+
+def schema_columns(table: str) -> list:
+    """Value columns declared for `table` in TABLE_SCHEMAS."""
+    body = TABLE_SCHEMAS[table].split("(", 1)[1]
+    cols = []
+    for line in body.splitlines():
+        m = re.match(r"\s*\"?(\w+)\"?\s+(REAL|TEXT|INTEGER|NUMERIC)", line, flags=re.IGNORECASE)
+        if m and m.group(1).lower() not in KEY_COLUMNS:
+            cols.append(m.group(1))
+    return cols
+
+
+def _object_type(cursor, name: str):
+    cursor.execute("SELECT type FROM sqlite_master WHERE name = ?", (name,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def _registered_columns(cursor, table: str) -> list:
+    cursor.execute("SELECT col FROM narrow_columns WHERE source = ? ORDER BY rowid", (table,))
+    return [r[0] for r in cursor.fetchall()]
+
+
+def _view_sql(table: str, columns: list) -> str:
+    pivots = "".join(
+        f',\n            MAX(CASE WHEN s.col = {_lit(c)} THEN o.value END) AS "{c}"' for c in columns
+    )
+    return f"""
+        CREATE VIEW "{table}" AS
+        SELECT s.location AS location, o.ts AS datetime{pivots}
+        FROM observations o JOIN series s ON s.id = o.series_id
+        WHERE s.source = {_lit(table)}
+        GROUP BY s.location, o.ts
+    """
+
+
+def _series_id(table: str, location: str, column: str) -> str:
+    return (
+        f"SELECT id FROM series WHERE source = {_lit(table)} "
+        f"AND location = {location} AND col = {_lit(column)}"
+    )
+
+
+def _register(table: str, column: str, guard: str) -> str:
+    # Plain INSERT ... WHERE NOT EXISTS: an outer INSERT OR REPLACE overrides the
+    # conflict policy of statements in the trigger body, and REPLACE on `series`
+    # would renumber the series and orphan its observations.
+    return (
+        f"INSERT INTO series(source, location, col) SELECT {_lit(table)}, NEW.location, {_lit(column)} "
+        f"WHERE {guard} AND NOT EXISTS ({_series_id(table, 'NEW.location', column)});"
+    )
+
+
+def _trigger_sql(table: str, columns: list) -> list:
+    insert_body, update_body = [], []
+    for c in columns:
+        new, old = f'NEW."{c}"', f'OLD."{c}"'
+        insert_body += [
+            _register(table, c, f"{new} IS NOT NULL"),
+            f"INSERT OR REPLACE INTO observations(series_id, ts, value) "
+            f"SELECT id, NEW.datetime, {new} FROM ({_series_id(table, 'NEW.location', c)}) WHERE {new} IS NOT NULL;",
+        ]
+        update_body += [
+            _register(table, c, f"{new} IS NOT NULL"),
+            f"INSERT OR REPLACE INTO observations(series_id, ts, value) "
+            f"SELECT id, NEW.datetime, {new} FROM ({_series_id(table, 'NEW.location', c)}) "
+            f"WHERE {new} IS NOT NULL AND {new} IS NOT {old};",
+            f"DELETE FROM observations WHERE {new} IS NULL AND {old} IS NOT NULL AND ts = OLD.datetime "
+            f"AND series_id = ({_series_id(table, 'OLD.location', c)});",
+        ]
+    noop = ["SELECT 1;"]
+    return [
+        f'CREATE TRIGGER "{table}_insert" INSTEAD OF INSERT ON "{table}" BEGIN\n'
+        + "\n".join(insert_body or noop) + "\nEND",
+        f'CREATE TRIGGER "{table}_update" INSTEAD OF UPDATE ON "{table}" BEGIN\n'
+        + "\n".join(update_body or noop) + "\nEND",
+        f'CREATE TRIGGER "{table}_delete" INSTEAD OF DELETE ON "{table}" BEGIN\n'
+        f"DELETE FROM observations WHERE ts = OLD.datetime AND series_id IN "
+        f"(SELECT id FROM series WHERE source = {_lit(table)} AND location = OLD.location);\nEND",
+    ]
+
+
+def _create_view(cursor, table: str):
+    """(Re)create the compatibility view and its triggers for `table`."""
+    cursor.execute(f'DROP VIEW IF EXISTS "{table}"')
+    columns = _registered_columns(cursor, table)
+    cursor.execute(_view_sql(table, columns))
+    for sql in _trigger_sql(table, columns):
+        cursor.execute(sql)
+
+
+def _migrate_wide_table(cursor, table: str):
+    """Copy a wide table's non-null values into observations, then drop it."""
+    cursor.execute(f'PRAGMA table_info("{table}")')
+    columns = [r[1] for r in cursor.fetchall() if r[1].lower() not in KEY_COLUMNS]
+    for c in columns:
+        cursor.execute("INSERT OR IGNORE INTO narrow_columns(source, col) VALUES (?, ?)", (table, c))
+        cursor.execute(
+            f'INSERT OR IGNORE INTO series(source, location, col) '
+            f'SELECT DISTINCT ?, location, ? FROM "{table}" WHERE "{c}" IS NOT NULL AND location IS NOT NULL',
+            (table, c),
+        )
+        cursor.execute(
+            f'INSERT OR REPLACE INTO observations(series_id, ts, value) '
+            f'SELECT s.id, t.datetime, t."{c}" FROM "{table}" t '
+            f'JOIN series s ON s.source = ? AND s.location = t.location AND s.col = ? '
+            f'WHERE t."{c}" IS NOT NULL AND t.datetime IS NOT NULL',
+            (table, c),
+        )
+    cursor.execute(f'DROP TABLE "{table}"')
+
+
+def ensure_schema(conn):
+    """
+    Create the narrow tables, migrate any wide tables still present, and create
+    the compatibility views. Safe to run on every connection.
+    """
+    cursor = conn.cursor()
+    for sql in NARROW_SCHEMA:
+        cursor.execute(sql)
+    for table in TABLE_SCHEMAS:
+        for c in schema_columns(table):
+            cursor.execute("INSERT OR IGNORE INTO narrow_columns(source, col) VALUES (?, ?)", (table, c))
+        kind = _object_type(cursor, table)
+        if kind == "table":
+            logger.info(f"Migrating wide table '{table}' into the narrow observation store")
+            _migrate_wide_table(cursor, table)
+            kind = None
+        if kind is None:
+            _create_view(cursor, table)
+    conn.commit()
+
+
+def ensure_column(cursor, table: str, column: str):
+    """Add `column` to the compatibility view for `table` (the narrow ALTER TABLE)."""
+    for sql in NARROW_SCHEMA:
+        cursor.execute(sql)
+    cursor.execute("SELECT 1 FROM narrow_columns WHERE source = ? AND col = ?", (table, column))
+    if cursor.fetchone() and _object_type(cursor, table) == "view":
+        return
+    cursor.execute("INSERT OR IGNORE INTO narrow_columns(source, col) VALUES (?, ?)", (table, column))
+    _create_view(cursor, table)
+
+
+def read_series(conn, table: str, location: str, column: str, start_ts: str, end_ts: str) -> tuple:
+    """
+    Return (times, values) lists for one series with start_ts <= ts <= end_ts,
+    read with one range scan on the observations primary key.
+    """
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT o.ts, o.value FROM observations o "
+        "WHERE o.series_id = (SELECT id FROM series WHERE source = ? AND location = ? AND col = ?) "
+        "AND o.ts BETWEEN ? AND ? ORDER BY o.ts",
+        (table, location, column, start_ts, end_ts),
+    )
+    rows = cur.fetchall()
+    return [r[0] for r in rows], [r[1] for r in rows]
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    conn = sqlite3.connect(DB_PATH)
+    ensure_schema(conn)
+    conn.close()
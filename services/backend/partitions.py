@@ -0,0 +1,227 @@
+"""
+partitions.py
+Yearly shard files for the "partitioned" storage mode.
+
+Ingestion keeps writing to the tables in Measurements.db, which only holds the
+most recent PARTITION_HOT_YEARS calendar years. `archive` moves older rows into
+one SQLite file per table per year ({SHARD_DIR}/{table}_{year}.db), so the hot
+file stays small no matter how much history is retained. `read_window` is the
+read-side router: it ATTACHes only the shards overlapping the requested window.
+"""
+
+import glob
+import logging
+import os
+import re
+import sqlite3
+from datetime import datetime
+
+import pandas as pd
+
+from services.backend import catalog, latest_values, rollups
+from services.backend.datasources.config import (
+    DB_PATH,
+    PARTITION_HOT_YEARS,
+    SHARD_DIR,
+    STORAGE_MODE,
+    TABLE_SCHEMAS,
+)
+
+logger = logging.getLogger(__name__)
+
+# Shards attached at once by read_window; SQLite allows 10 attachments by default.
+ATTACH_BATCH = 8
+
+SOURCE_VIEW = "_partition_source"
+
+
+def enabled() -> bool:
+    return STORAGE_MODE == "partitioned"
+
+
+def hot_boundary() -> str:
+    """Timestamp string before which rows belong in yearly shards."""
+    year = datetime.now().year - PARTITION_HOT_YEARS + 1
+    return f"{year:04d}-01-01 00:00:00"
+
+
+def shard_path(table: str, year) -> str:
+    return os.path.join(SHARD_DIR, f"{table}_{int(year):04d}.db")
+
+
+def shard_years(table: str) -> list:
+    """Years for which a shard file exists for `table`, ascending."""
+    years = []
+    for path in glob.glob(os.path.join(SHARD_DIR, f"{table}_*.db")):
+        m = re.fullmatch(rf"{re.escape(table)}_(\d{{4}})\.db", os.path.basename(path))
+        if m:
+            years.append(int(m.group(1)))
+    return sorted(years)
+
+
+def _columns(conn, schema: str, table: str) -> list:
+    return [r[1] for r in conn.execute(f'PRAGMA {schema}.table_info("{table}")').fetchall()]
+
+
+def _ensure_shard_table(conn, alias: str, table: str, columns: list):
+    """Create `table` in the attached shard and add any columns it is missing."""
+    schema = re.sub(
+        r"CREATE TABLE IF NOT EXISTS\s+\"?(\w+)\"?",
+        rf'CREATE TABLE IF NOT EXISTS {alias}."\1"',
+        TABLE_SCHEMAS[table],
+        count=1,
+    )
+    conn.execute(schema)
+    existing = set(_columns(conn, alias, table))
+    for col in columns:
+        if col not in existing:
+            conn.execute(f'ALTER TABLE {alias}."{table}" ADD COLUMN "{col}" REAL')
+
+
+def archive(conn, tables=None):
+    """
+    Move rows older than hot_boundary() from the main tables into their yearly
+    shards, then recompute rollups, catalog and latest values for the moved
+    ranges. Must be called outside a transaction (ATTACH/DETACH need that).
+    """
+    os.makedirs(SHARD_DIR, exist_ok=True)
+    boundary = hot_boundary()
+    cur = conn.cursor()
+    for table in tables or TABLE_SCHEMAS.keys():
+        try:
+            cur.execute(
+                f'SELECT DISTINCT substr(datetime, 1, 4) FROM "{table}" WHERE datetime < ?',
+                (boundary,),
+            )
+            years = sorted(int(r[0]) for r in cur.fetchall() if r[0] and r[0].isdigit())
+        except sqlite3.Error as e:
+            logger.warning(f"Skipping archive for {table}: {e}")
+            continue
+        columns = _columns(conn, "main", table)
+        col_list = ", ".join(f'"{c}"' for c in columns)
+        for year in years:
+            lo, hi = f"{year:04d}-01-01", f"{year + 1:04d}-01-01"
+            conn.execute("ATTACH DATABASE ? AS shard", (shard_path(table, year),))
+            try:
+                _ensure_shard_table(conn, "shard", table, columns)
+                cur.execute(
+                    f'SELECT location, MIN(datetime), MAX(datetime) FROM main."{table}" '
+                    f"WHERE datetime >= ? AND datetime < ? GROUP BY location",
+                    (lo, hi),
+                )
+                spans = cur.fetchall()
+                cur.execute(
+                    f'INSERT OR REPLACE INTO shard."{table}" ({col_list}) '
+                    f'SELECT {col_list} FROM main."{table}" WHERE datetime >= ? AND datetime < ?',
+                    (lo, hi),
+                )
+                cur.execute(f'DELETE FROM main."{table}" WHERE datetime >= ? AND datetime < ?', (lo, hi))
+
+                # Backfilled rows may have landed in main after the year was archived;
+                # rebuild the derived tables for the moved ranges from main + shard.
+                cur.execute(
+                    f"CREATE TEMP VIEW {SOURCE_VIEW} AS "
+                    f'SELECT {col_list} FROM main."{table}" UNION ALL SELECT {col_list} FROM shard."{table}"'
+                )
+                for location, first, last in spans:
+                    if location is None or first is None:
+                        continue
+                    rollups.refresh_rollups(cur, table, location, first, last, source=SOURCE_VIEW)
+                    catalog.refresh_catalog(cur, table, location)
+                    latest_values.refresh_latest(cur, table, location, source=SOURCE_VIEW)
+                conn.commit()
+                logger.info(f"Archived {table} {year} ({len(spans)} locations) to {shard_path(table, year)}")
+            except sqlite3.Error as e:
+                conn.rollback()
+                logger.error(f"Archive of {table} {year} failed: {e}")
+            finally:
+                cur.execute(f"DROP VIEW IF EXISTS temp.{SOURCE_VIEW}")
+                conn.execute("DETACH DATABASE shard")
+
+
+def _window_sql(conn, schema: str, table: str, where: str = "", columns=None) -> str:
+    extra = f" AND ({where})" if where else ""
+    if columns:
+        present = set(_columns(conn, schema, table))
+        select = ", ".join(f'"{c}"' if c in present else f'NULL AS "{c}"' for c in columns)
+    else:
+        select = "*"
+    return f'SELECT {select} FROM {schema}."{table}" WHERE datetime BETWEEN ? AND ?{extra}'
+
+
+def read_window(conn, table: str, start_ts: str, end_ts: str, where: str = "", params=(), columns=None) -> pd.DataFrame:
+    """
+    Return all rows of `table` with start_ts <= datetime <= end_ts from the main
+    file and every shard whose year overlaps the window. `where` is an optional
+    extra condition (e.g. "location = ?") with its `params`; `columns` limits the
+    columns read (shards missing one of them yield NULLs).
+    """
+    args = (start_ts, end_ts, *params)
+
+    def query(schema):
+        return _window_sql(conn, schema, table, where, columns)
+
+    frames = [pd.read_sql_query(query("main"), conn, params=args)]
+    if str(start_ts) < hot_boundary():
+        years = [y for y in shard_years(table) if int(str(start_ts)[:4]) <= y <= int(str(end_ts)[:4])]
+        for i in range(0, len(years), ATTACH_BATCH):
+            batch = years[i:i + ATTACH_BATCH]
+            aliases = []
+            try:
+                for year in batch:
+                    alias = f"shard_{year}"
+                    conn.execute(f"ATTACH DATABASE ? AS {alias}", (shard_path(table, year),))
+                    aliases.append(alias)
+                for alias in aliases:
+                    frames.append(pd.read_sql_query(query(alias), conn, params=args))
+            finally:
+                for alias in aliases:
+                    conn.execute(f"DETACH DATABASE {alias}")
+
+    frames = [f for f in frames if not f.empty]
+    if not frames:
+        return pd.read_sql_query(query("main") + " LIMIT 0", conn, params=args)
+    if len(frames) == 1:
+        return frames[0]
+    return pd.concat(frames, ignore_index=True).sort_values("datetime", kind="stable").reset_index(drop=True)
+
+
+def iter_window(conn, table: str, start_ts: str, end_ts: str, where: str = "", params=(), columns=None,
+                chunk_rows: int = 10000):
+    """
+    Like read_window, but yield the rows as lists of at most `chunk_rows`
+    tuples straight from the cursor, so the window is never held in memory.
+    Overlapping shards are read oldest first, one attached at a time, then the
+    main file; each source is ordered by datetime.
+    """
+    args = (start_ts, end_ts, *params)
+
+    def rows(schema):
+        cur = conn.execute(_window_sql(conn, schema, table, where, columns) + " ORDER BY datetime", args)
+        try:
+            while True:
+                chunk = cur.fetchmany(chunk_rows)
+                if not chunk:
+                    return
+                yield chunk
+        finally:
+            cur.close()  # an unfinished statement would keep a shard from detaching
+
+    if str(start_ts) < hot_boundary():
+        for year in shard_years(table):
+            if not int(str(start_ts)[:4]) <= year <= int(str(end_ts)[:4]):
+                continue
+            alias = f"shard_{year}"
+            conn.execute(f"ATTACH DATABASE ? AS {alias}", (shard_path(table, year),))
+            try:
+                yield from rows(alias)
+            finally:
+                conn.execute(f"DETACH DATABASE {alias}")
+    yield from rows("main")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    conn = sqlite3.connect(DB_PATH)
+    archive(conn)
+    conn.close()
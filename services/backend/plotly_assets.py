@@ -0,0 +1,88 @@
+"""
+plotly_assets.py
+Serve plotly.js once, as a static asset, instead of inside every graph.
+
+`plotly.offline.plot` embeds the whole plotly.js bundle (several MB) in every
+div and file it writes unless told otherwise. The bundle is kept at
+static/js/plotly.min.js, where collectstatic fingerprints it and WhiteNoise
+serves it with a far-future cache header, and graphs only carry their figure
+JSON:
+
+- `to_div(figure)` for views; the page template loads the bundle with
+  {% static 'js/plotly.min.js' %}.
+- `write_html(figure, path)` for standalone files in static/graphs, which
+  reference the bundle by its fingerprinted URL (see `script_src`).
+
+The bundle comes from the installed plotly package, so it always matches the
+Python side, and is not committed (see .gitignore). The services app writes it
+when Django starts without one, so runserver and collectstatic on a fresh
+checkout pick it up. After upgrading plotly run
+
+    python -m services.backend.plotly_assets
+
+and then collectstatic.
+"""
+
+import json
+import os
+
+import plotly.offline
+
+from services.backend.datasources.config import BASE_DIR
+
+PLOTLY_JS = "js/plotly.min.js"
+STATIC_DIR = BASE_DIR / "static"
+# written by ManifestStaticFilesStorage during collectstatic
+STATIC_MANIFEST = BASE_DIR / "staticfiles" / "staticfiles.json"
+STATIC_URL = "/static/"
+
+
+def bundle_path():
+    return STATIC_DIR / PLOTLY_JS
+
+
+def write_bundle(force: bool = False) -> bool:
+    """Write the installed plotly.js bundle to static/js. Returns True if the file changed."""
+    path = bundle_path()
+    js = plotly.offline.get_plotlyjs()
+    if not force and path.exists() and path.stat().st_size == len(js.encode("utf-8")):
+        return False
+    os.makedirs(path.parent, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(js, encoding="utf-8")
+    os.replace(tmp, path)
+    return True
+
+
+def script_src() -> str:
+    """
+    URL for the plotly.js <script> of standalone graph files: the fingerprinted
+    name from the collectstatic manifest when there is one, else the plain
+    static path, else the CDN if the bundle hasn't been written at all.
+    """
+    try:
+        with open(STATIC_MANIFEST, encoding="utf-8") as f:
+            hashed = json.load(f).get("paths", {}).get(PLOTLY_JS)
+        if hashed:
+            return STATIC_URL + hashed
+    except (OSError, ValueError):
+        pass
+    if bundle_path().exists():
+        return STATIC_URL + PLOTLY_JS
+    return "cdn"
+
+
+def to_div(figure) -> str:
+    """Figure as an HTML div without plotly.js; the page must load the bundle."""
+    return plotly.offline.plot(figure, output_type="div", include_plotlyjs=False)
+
+
+def write_html(figure, path: str) -> str:
+    """Write `figure` as a standalone HTML file that loads the shared bundle."""
+    plotly.offline.plot(figure, filename=path, auto_open=False, include_plotlyjs=script_src())
+    return path
+
+
+if __name__ == "__main__":
+    changed = write_bundle()
+    print(f"{bundle_path()} {'written' if changed else 'up to date'} (plotly.js for plotly {plotly.__version__})")
@@ -0,0 +1,319 @@
+"""
+query_engine.py
+Window queries over the measurement tables with location and column pushdown.
+
+`fetch(conn, table, locations, columns, start, end)` selects only the requested
+locations and columns inside the window in SQL, so asking for one gauge and one
+metric reads one primary-key range instead of every site and column. Results
+come back typed: `datetime` as datetime64, numeric columns as float64.
+
+Table metadata (columns, declared types, whether datetime holds epoch seconds
+or text) is sniffed once per table and cached until the schema changes, rather
+than on every query. The storage mode is handled here too: partitioned tables go
+through the shard router and narrow tables read the observation store directly.
+"""
+
+import sqlite3
+from collections import namedtuple
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from services.backend import narrow, partitions
+
+KEY_COLUMNS = ("location", "datetime")
+NUMERIC_TYPES = ("REAL", "INT", "NUMERIC", "FLOAT", "DOUBLE")
+TS_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+TableMeta = namedtuple("TableMeta", "columns value_columns numeric has_location time_format is_view")
+
+# (database file, table) -> (schema_version, TableMeta)
+_meta_cache = {}
+
+
+def _db_file(conn) -> str:
+    for _, name, path in conn.execute("PRAGMA database_list").fetchall():
+        if name == "main":
+            return path or ""
+    return ""
+
+
+def _sniff_time_format(conn, table: str):
+    """'epoch' or 'string' from one stored datetime, or None if the table is empty."""
+    row = conn.execute(f'SELECT datetime FROM "{table}" WHERE datetime IS NOT NULL LIMIT 1').fetchone()
+    if row is None:
+        return None
+    try:
+        int(row[0])
+        return "epoch"
+    except (ValueError, TypeError):
+        return "string"
+
+
+def table_meta(conn, table: str) -> TableMeta:
+    """Return cached metadata for `table`, re-reading it after any schema change."""
+    version = conn.execute("PRAGMA schema_version").fetchone()[0]
+    key = (_db_file(conn), table)
+    cached = _meta_cache.get(key)
+    if cached and cached[0] == version:
+        return cached[1]
+
+    info = conn.execute(f'PRAGMA table_info("{table}")').fetchall()
+    if not info:
+        raise sqlite3.OperationalError(f"no such table: {table}")
+    kind = conn.execute("SELECT type FROM sqlite_master WHERE name = ?", (table,)).fetchone()
+    is_view = bool(kind and kind[0] == "view")
+    columns = [r[1] for r in info]
+    value_columns = [c for c in columns if c.lower() not in KEY_COLUMNS]
+    if is_view and narrow.enabled():
+        # pivoted from observations.value, which is REAL
+        numeric = set(value_columns)
+        time_format = "string"
+    else:
+        numeric = {r[1] for r in info if any(t in (r[2] or "").upper() for t in NUMERIC_TYPES)}
+        time_format = _sniff_time_format(conn, table)
+    meta = TableMeta(columns, value_columns, numeric, "location" in {c.lower() for c in columns},
+                     time_format or "string", is_view)
+    if key[0] and time_format is not None:
+        # in-memory databases share an empty path; an empty table may not stay text
+        _meta_cache[key] = (version, meta)
+    return meta
+
+
+def clear_cache():
+    _meta_cache.clear()
+
+
+def _bound(value, time_format: str):
+    """Convert a window bound (epoch seconds, datetime or timestamp string) to the table's format."""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        if time_format == "epoch":
+            return int(datetime.fromisoformat(value).timestamp())
+        return value
+    if isinstance(value, datetime):
+        return int(value.timestamp()) if time_format == "epoch" else value.strftime(TS_FORMAT)
+    # epoch seconds; text tables hold local wall-clock time
+    return int(value) if time_format == "epoch" else datetime.fromtimestamp(value).strftime(TS_FORMAT)
+
+
+def _in_clause(column: str, values) -> str:
+    return f"{column} IN ({', '.join('?' * len(values))})"
+
+
+def _fetch_narrow(conn, table: str, locations, columns, lo, hi) -> pd.DataFrame:
+    sql = ("SELECT s.location, s.col, o.ts, o.value FROM series s "
+           "JOIN observations o ON o.series_id = s.id WHERE s.source = ?")
+    params = [table]
+    if locations:
+        sql += " AND " + _in_clause("s.location", locations)
+        params += locations
+    sql += " AND " + _in_clause("s.col", columns)
+    params += columns
+    if lo is not None:
+        sql += " AND o.ts >= ?"
+        params.append(lo)
+    if hi is not None:
+        sql += " AND o.ts <= ?"
+        params.append(hi)
+    raw = pd.read_sql_query(sql, conn, params=params)
+    if raw.empty:
+        return pd.DataFrame(columns=["location", "datetime", *columns])
+    df = raw.pivot_table(index=["location", "ts"], columns="col", values="value", aggfunc="first")
+    df = df.reset_index().rename(columns={"ts": "datetime"})
+    df.columns.name = None
+    for c in columns:
+        if c not in df.columns:
+            df[c] = np.nan
+    return df[["location", "datetime", *columns]]
+
+
+def fetch(conn, table: str, locations=None, columns=None, start=None, end=None) -> pd.DataFrame:
+    """
+    Return rows of `table` with start <= datetime <= end (either bound may be
+    None) for the given locations (a name or list; None for all) and columns
+    (None for all value columns). Columns the table doesn't have are left out.
+
+    The frame has `location` (if the table has one), `datetime` as datetime64 and
+    the requested columns, numeric ones as float64, ordered by location and time.
+    """
+    meta = table_meta(conn, table)
+    if isinstance(locations, str):
+        locations = [locations]
+    locations = list(locations) if locations and meta.has_location else None
+    wanted = [c for c in (columns or meta.value_columns) if c in meta.value_columns]
+    lo, hi = _bound(start, meta.time_format), _bound(end, meta.time_format)
+    keys = ["location", "datetime"] if meta.has_location else ["datetime"]
+
+    if not wanted:
+        df = pd.DataFrame(columns=keys)
+    elif meta.is_view and narrow.enabled():
+        df = _fetch_narrow(conn, table, locations, wanted, lo, hi)
+    else:
+        where, params = [], []
+        if locations:
+            where.append(_in_clause("location", locations))
+            params += locations
+        if partitions.enabled() and meta.time_format == "string":
+            df = partitions.read_window(conn, table, lo or "0000", hi or "9999", where=" AND ".join(where),
+                                        params=params, columns=keys + wanted)
+            df = df.sort_values(keys, kind="stable").reset_index(drop=True)
+        else:
+            if lo is not None:
+                where.append("datetime >= ?")
+                params.append(lo)
+            if hi is not None:
+                where.append("datetime <= ?")
+                params.append(hi)
+            select = ", ".join(f'"{c}"' for c in keys + wanted)
+            sql = f'SELECT {select} FROM "{table}"'
+            if where:
+                sql += " WHERE " + " AND ".join(where)
+            df = pd.read_sql_query(sql + f" ORDER BY {', '.join(keys)}", conn, params=params)
+
+    if meta.time_format == "epoch":
+        df["datetime"] = pd.to_datetime(df["datetime"], unit="s", errors="coerce")
+    else:
+        df["datetime"] = pd.to_datetime(df["datetime"], format="ISO8601", errors="coerce")
+    for c in wanted:
+        if c in meta.numeric:
+            df[c] = pd.to_numeric(df[c], errors="coerce").astype("float64")
+    return df
+
+
+def _epoch_text(value):
+    """Epoch seconds as a TS_FORMAT string, read as UTC like fetch() does."""
+    try:
+        return datetime.fromtimestamp(int(value), timezone.utc).strftime(TS_FORMAT)
+    except (TypeError, ValueError, OverflowError):
+        return value
+
+
+def iter_rows(conn, table: str, location, columns, start=None, end=None, chunk_rows: int = 10000):
+    """
+    Yield one location's (datetime, *columns) rows over the window as lists of
+    at most `chunk_rows` tuples, ascending, read from the cursor with
+    fetchmany instead of into a DataFrame, for exports of any length.
+    `datetime` is a TS_FORMAT string; values are as stored (None for gaps).
+    Columns the table doesn't have are left out, as in fetch().
+    """
+    meta = table_meta(conn, table)
+    wanted = [c for c in columns if c in meta.value_columns]
+    lo, hi = _bound(start, meta.time_format), _bound(end, meta.time_format)
+    where, params = [], []
+    if meta.has_location and location is not None:
+        where.append("location = ?")
+        params.append(location)
+
+    if partitions.enabled() and meta.time_format == "string":
+        chunks = partitions.iter_window(conn, table, lo or "0000", hi or "9999", where=" AND ".join(where),
+                                        params=params, columns=["datetime", *wanted], chunk_rows=chunk_rows)
+    else:
+        if lo is not None:
+            where.append("datetime >= ?")
+            params.append(lo)
+        if hi is not None:
+            where.append("datetime <= ?")
+            params.append(hi)
+        select = ", ".join(f'"{c}"' for c in ["datetime", *wanted])
+        sql = f'SELECT {select} FROM "{table}"'
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        chunks = _cursor_chunks(conn, sql + " ORDER BY datetime", params, chunk_rows)
+
+    for chunk in chunks:
+        if meta.time_format == "epoch":
+            chunk = [(_epoch_text(row[0]), *row[1:]) for row in chunk]
+        yield chunk
+
+
+def _cursor_chunks(conn, sql: str, params, chunk_rows: int):
+    cur = conn.execute(sql, params)
+    try:
+        while True:
+            chunk = cur.fetchmany(chunk_rows)
+            if not chunk:
+                return
+            yield chunk
+    finally:
+        cur.close()
+
+
+def _clean_series(times, values) -> tuple:
+    """Drop NaT/NaN, sort and keep the last value for repeated timestamps."""
+    times = np.asarray(times, dtype="datetime64[ns]")
+    values = pd.to_numeric(pd.Series(values), errors="coerce").to_numpy(dtype=np.float64)
+    keep = ~np.isnat(times) & ~np.isnan(values)
+    times, values = times[keep], values[keep]
+    if len(times) > 1 and not np.all(times[1:] > times[:-1]):
+        order = np.argsort(times, kind="stable")
+        times, values = times[order], values[order]
+        last = np.append(times[1:] != times[:-1], True)
+        times, values = times[last], values[last]
+    return times, values
+
+
+def _empty_series() -> tuple:
+    return np.empty(0, dtype="datetime64[ns]"), np.empty(0, dtype=np.float64)
+
+
+def fetch_series(conn, table: str, location: str, column: str, start=None, end=None) -> tuple:
+    """
+    Return (times, values) NumPy arrays (datetime64[ns], float64) for one
+    series over the window: non-null values only, ascending, one per timestamp.
+    """
+    df = fetch(conn, table, location, [column], start, end)
+    if column not in df.columns:
+        return _empty_series()
+    return _clean_series(df["datetime"], df[column])
+
+
+def _as_datetime64(bound, time_format: str):
+    """A bound already in the table's format, as datetime64 comparable with fetched times."""
+    if bound is None:
+        return None
+    if time_format == "epoch":
+        return np.datetime64(int(bound), "s")
+    return np.datetime64(pd.Timestamp(bound))
+
+
+def fetch_many(conn, table: str, column: str, windows: dict) -> dict:
+    """
+    Fetch one column for several locations in a single statement. `windows`
+    maps location -> (start, end). The union of the windows is read with
+    location IN (...), split by location with a groupby and trimmed to each
+    location's own window. Returns {location: (times, values)} as fetch_series
+    would, with empty arrays for locations without data.
+    """
+    out = {loc: _empty_series() for loc in windows}
+    if not windows:
+        return out
+    meta = table_meta(conn, table)
+    bounds = {loc: (_bound(s, meta.time_format), _bound(e, meta.time_format)) for loc, (s, e) in windows.items()}
+    starts = [b[0] for b in bounds.values()]
+    ends = [b[1] for b in bounds.values()]
+    start = None if None in starts else min(starts)
+    end = None if None in ends else max(ends)
+
+    df = fetch(conn, table, list(windows), [column], start, end)
+    if column not in df.columns or df.empty:
+        return out
+    if "location" in df.columns:
+        groups = df.groupby("location", sort=False)
+    else:
+        # no location column: every location sees the whole table, as query_data did
+        groups = [(loc, df) for loc in windows]
+    for loc, group in groups:
+        if loc not in bounds:
+            continue
+        times, values = _clean_series(group["datetime"], group[column])
+        lo, hi = (_as_datetime64(b, meta.time_format) for b in bounds[loc])
+        mask = np.ones(len(times), dtype=bool)
+        if lo is not None:
+            mask &= times >= lo
+        if hi is not None:
+            mask &= times <= hi
+        out[loc] = (times[mask], values[mask])
+    return out
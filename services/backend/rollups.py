@@ -0,0 +1,328 @@
+"""
+rollups.py
+Hourly, daily and monthly aggregate tables kept next to the measurement tables.
+
+Each rollup row holds count/min/max/sum/sum-of-squares for one
+(table, location, column, bucket), so long-window graphs and statistics can be
+answered from a few hundred pre-aggregated rows instead of every raw reading.
+The write path calls `refresh_rollups` inside its own transaction; only the
+buckets touched by that write are recomputed.
+"""
+
+import logging
+import math
+import sqlite3
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+RESOLUTIONS = ("hourly", "daily", "monthly")
+
+# Approximate bucket widths, used to estimate how many points a window needs.
+BUCKET_SECONDS = {
+    "hourly": 3600,
+    "daily": 86400,
+    "monthly": 30 * 86400,
+}
+
+# strftime patterns mapping a timestamp onto the start of its bucket.
+BUCKET_FORMATS = {
+    "hourly": "%Y-%m-%d %H:00:00",
+    "daily": "%Y-%m-%d 00:00:00",
+    "monthly": "%Y-%m-01 00:00:00",
+}
+
+ROLLUP_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS rollup_{resolution}(
+        tbl TEXT NOT NULL,
+        location TEXT NOT NULL,
+        col TEXT NOT NULL,
+        bucket TEXT NOT NULL,
+        row_count INTEGER NOT NULL,
+        value_count INTEGER NOT NULL,
+        min_value REAL,
+        max_value REAL,
+        sum_value REAL,
+        sumsq_value REAL,
+        first_ts TEXT,
+        last_ts TEXT,
+        PRIMARY KEY(tbl, location, col, bucket)
+    ) WITHOUT ROWID
+"""
+
+# Columns of a measurement table that are keys rather than data.
+NON_DATA_COLUMNS = {"datetime", "location", "rowid", "id"}
+
+
+def ensure_rollup_tables(cursor):
+    """Create the rollup tables if they don't exist."""
+    for resolution in RESOLUTIONS:
+        cursor.execute(ROLLUP_SCHEMA.format(resolution=resolution))
+
+
+def data_columns(cursor, table: str) -> list:
+    """Return the value columns of a measurement table."""
+    cursor.execute(f'PRAGMA table_info("{table}")')
+    return [r[1] for r in cursor.fetchall() if r[1].lower() not in NON_DATA_COLUMNS]
+
+
+def parse_ts(ts) -> datetime:
+    """Parse a stored timestamp string into a naive datetime."""
+    dt = datetime.fromisoformat(str(ts).replace("Z", "+00:00"))
+    return dt.replace(tzinfo=None)
+
+
+def bucket_start(dt: datetime, resolution: str) -> datetime:
+    """Floor a datetime to the start of its bucket."""
+    if resolution == "hourly":
+        return dt.replace(minute=0, second=0, microsecond=0)
+    if resolution == "daily":
+        return dt.replace(hour=0, minute=0, second=0, microsecond=0)
+    return dt.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def next_bucket(dt: datetime, resolution: str) -> datetime:
+    """Return the start of the bucket following the one starting at `dt`."""
+    if resolution == "hourly":
+        return dt + timedelta(hours=1)
+    if resolution == "daily":
+        return dt + timedelta(days=1)
+    return (dt + timedelta(days=32)).replace(day=1)
+
+
+def bucket_bounds(start_ts, end_ts, resolution: str) -> tuple:
+    """
+    Return the half-open [lo, hi) range of bucket starts, as timestamp strings,
+    covering every bucket that contains a timestamp between start_ts and end_ts.
+    """
+    lo = bucket_start(parse_ts(start_ts), resolution)
+    hi = next_bucket(bucket_start(parse_ts(end_ts), resolution), resolution)
+    fmt = "%Y-%m-%d %H:%M:%S"
+    return lo.strftime(fmt), hi.strftime(fmt)
+
+
+def _refresh_hourly(cursor, table: str, location: str, column: str, lo: str, hi: str, source: str):
+    # buckets whose raw rows are gone must not survive the refresh
+    cursor.execute(
+        "DELETE FROM rollup_hourly WHERE tbl = ? AND location = ? AND col = ? AND bucket >= ? AND bucket < ?",
+        (table, location, column, lo, hi),
+    )
+    # Rows are selected by the bucket they land in, not by comparing raw text,
+    # so 'T'-separated or seconds-less timestamps (Shadehill's 'YYYY-MM-DD 00:00')
+    # are refreshed exactly when their bucket is deleted. The date-only bounds
+    # just narrow the scan to whole days around [lo, hi) for the index.
+    cursor.execute(
+        f"""
+        INSERT OR REPLACE INTO rollup_hourly
+            (tbl, location, col, bucket, row_count, value_count, min_value, max_value,
+             sum_value, sumsq_value, first_ts, last_ts)
+        SELECT ?, location, ?, strftime('{BUCKET_FORMATS["hourly"]}', datetime) AS b,
+               COUNT(*), COUNT("{column}"), MIN("{column}"), MAX("{column}"),
+               SUM("{column}"), SUM("{column}" * "{column}"),
+               MIN(CASE WHEN "{column}" IS NOT NULL THEN datetime END),
+               MAX(CASE WHEN "{column}" IS NOT NULL THEN datetime END)
+        FROM {source}
+        WHERE location = ? AND datetime >= ? AND datetime < date(?, '+1 day')
+        GROUP BY b
+        HAVING b >= ? AND b < ?
+        """,
+        (table, column, location, lo[:10], hi[:10], lo, hi),
+    )
+
+
+def _refresh_from_child(cursor, table: str, location: str, child: str, parent: str, lo: str, hi: str):
+    cursor.execute(
+        f"DELETE FROM rollup_{parent} WHERE tbl = ? AND location = ? AND bucket >= ? AND bucket < ?",
+        (table, location, lo, hi),
+    )
+    cursor.execute(
+        f"""
+        INSERT OR REPLACE INTO rollup_{parent}
+            (tbl, location, col, bucket, row_count, value_count, min_value, max_value,
+             sum_value, sumsq_value, first_ts, last_ts)
+        SELECT tbl, location, col, strftime('{BUCKET_FORMATS[parent]}', bucket) AS b,
+               SUM(row_count), SUM(value_count), MIN(min_value), MAX(max_value),
+               SUM(sum_value), SUM(sumsq_value), MIN(first_ts), MAX(last_ts)
+        FROM rollup_{child}
+        WHERE tbl = ? AND location = ? AND bucket >= ? AND bucket < ?
+        GROUP BY col, b
+        """,
+        (table, location, lo, hi),
+    )
+
+
+def refresh_rollups(cursor, table: str, location: str, start_ts, end_ts, source: str = None):
+    """
+    Recompute every rollup bucket for (table, location) that overlaps the written
+    range start_ts..end_ts ('YYYY-MM-DD HH:MM:SS' strings).
+
+    Hourly buckets are rebuilt from the raw rows in `source` (defaults to `table`),
+    daily from hourly and monthly from daily, so the work is proportional to the
+    size of the write rather than the history. All value columns are refreshed,
+    since INSERT OR REPLACE on one column can clear the others in the same rows.
+    The buckets in the range are deleted before being recomputed, so a bucket
+    whose rows were deleted disappears instead of keeping its old aggregates.
+    Does not commit: callers run this inside the transaction that wrote the rows.
+    """
+    source = source or table
+    lo, hi = bucket_bounds(start_ts, end_ts, "hourly")
+    for column in data_columns(cursor, table):
+        _refresh_hourly(cursor, table, location, column, lo, hi, source)
+
+    for child, parent in (("hourly", "daily"), ("daily", "monthly")):
+        lo, hi = bucket_bounds(start_ts, end_ts, parent)
+        _refresh_from_child(cursor, table, location, child, parent, lo, hi)
+
+
+def rebuild_rollups(conn, tables=None):
+    """
+    Rebuild all rollups from scratch for the given measurement tables (all tables
+    from TABLE_SCHEMAS by default). Use once to backfill an existing database.
+    """
+    from services.backend.datasources.config import TABLE_SCHEMAS
+
+    cursor = conn.cursor()
+    ensure_rollup_tables(cursor)
+    for table in tables or TABLE_SCHEMAS.keys():
+        try:
+            cursor.execute(
+                f'SELECT location, MIN(datetime), MAX(datetime) FROM "{table}" GROUP BY location'
+            )
+            spans = cursor.fetchall()
+        except sqlite3.Error as e:
+            logger.warning(f"Skipping rollups for {table}: {e}")
+            continue
+        for resolution in RESOLUTIONS:
+            cursor.execute(f"DELETE FROM rollup_{resolution} WHERE tbl = ?", (table,))
+        for location, first, last in spans:
+            if location is None or first is None:
+                continue
+            try:
+                refresh_rollups(cursor, table, location, first, last)
+            except ValueError as e:
+                logger.warning(f"Skipping rollups for {table}/{location}: {e}")
+        conn.commit()
+        logger.info(f"Rebuilt rollups for {table} ({len(spans)} locations)")
+
+
+def _epoch_to_ts(epoch: int) -> str:
+    # Matches custom_graph.query_data, which compares against local-time strings.
+    return datetime.fromtimestamp(epoch).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def choose_resolution(start_epoch: int, end_epoch: int, max_points: int) -> str:
+    """
+    Return the finest rollup resolution whose bucket count over the window fits
+    within max_points, or the coarsest resolution if none does.
+    """
+    span = max(end_epoch - start_epoch, 0)
+    for resolution in RESOLUTIONS:
+        if span / BUCKET_SECONDS[resolution] <= max_points:
+            return resolution
+    return RESOLUTIONS[-1]
+
+
+def estimate_points(conn, table: str, location: str, column: str, start_epoch: int, end_epoch: int) -> int:
+    """
+    Estimate the number of non-null raw values in the window from the daily
+    rollups (exact for day-aligned windows). Raises sqlite3.Error if the rollup
+    tables have not been created.
+    """
+    lo, hi = bucket_bounds(_epoch_to_ts(start_epoch), _epoch_to_ts(end_epoch), "daily")
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT COALESCE(SUM(value_count), 0) FROM rollup_daily "
+        "WHERE tbl = ? AND location = ? AND col = ? AND bucket >= ? AND bucket < ?",
+        (table, location, column, lo, hi),
+    )
+    return int(cur.fetchone()[0])
+
+
+def _read_buckets(conn, table: str, location: str, column: str, start_epoch: int, end_epoch: int,
+                  resolution: str) -> pd.DataFrame:
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f"Unknown rollup resolution '{resolution}'")
+    lo, hi = bucket_bounds(_epoch_to_ts(start_epoch), _epoch_to_ts(end_epoch), resolution)
+    return pd.read_sql_query(
+        f"SELECT bucket AS datetime, value_count AS count, sum_value, sumsq_value, "
+        f"min_value AS min, max_value AS max FROM rollup_{resolution} "
+        f"WHERE tbl = ? AND location = ? AND col = ? AND bucket >= ? AND bucket < ? "
+        f"AND value_count > 0 ORDER BY bucket",
+        conn,
+        params=(table, location, column, lo, hi),
+    )
+
+
+def read_range(conn, table: str, location: str, column: str, lo: str, hi: str, resolution: str) -> pd.DataFrame:
+    """
+    Non-empty buckets with lo <= bucket start < hi (timestamp strings), in
+    order: bucket, value_count, sum_value, min_value, max_value.
+    """
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f"Unknown rollup resolution '{resolution}'")
+    return pd.read_sql_query(
+        f"SELECT bucket, value_count, sum_value, min_value, max_value FROM rollup_{resolution} "
+        f"WHERE tbl = ? AND location = ? AND col = ? AND bucket >= ? AND bucket < ? "
+        f"AND value_count > 0 ORDER BY bucket",
+        conn,
+        params=(table, location, column, lo, hi),
+    )
+
+
+def query_rollup(conn, table: str, location: str, column: str, start_epoch: int, end_epoch: int,
+                 resolution: str) -> pd.DataFrame:
+    """
+    Return one row per non-empty bucket in the window with columns
+    datetime, count, mean, sd, min, max. `datetime` is the bucket start.
+    """
+    df = _read_buckets(conn, table, location, column, start_epoch, end_epoch, resolution)
+    if df.empty:
+        return df
+    df["datetime"] = pd.to_datetime(df["datetime"], errors="coerce")
+    df["mean"] = df["sum_value"] / df["count"]
+    var = (df["sumsq_value"] / df["count"] - df["mean"] ** 2).clip(lower=0)
+    df["sd"] = var ** 0.5
+    return df[["datetime", "count", "mean", "sd", "min", "max"]]
+
+
+def summarize(conn, table: str, location: str, column: str, start_epoch: int, end_epoch: int,
+              resolution: str = "daily"):
+    """
+    Return summary statistics for the window computed from rollups, or None if
+    there is no data. Keys: count, mean, sd (population), median, min, max.
+
+    mean/sd/min/max are exact over whole buckets; `median` is approximated by
+    the count-weighted median of the bucket means, since rollups don't keep the
+    value distribution.
+    """
+    df = _read_buckets(conn, table, location, column, start_epoch, end_epoch, resolution)
+    if df.empty:
+        return None
+    count = int(df["count"].sum())
+    mean = df["sum_value"].sum() / count
+    sd = math.sqrt(max(df["sumsq_value"].sum() / count - mean * mean, 0.0)) if count > 1 else 0.0
+
+    bucket_means = df["sum_value"] / df["count"]
+    order = bucket_means.argsort().to_numpy()
+    weights = df["count"].to_numpy()[order].cumsum()
+    median = float(bucket_means.to_numpy()[order][weights >= count / 2.0][0])
+
+    return {
+        "count": count,
+        "mean": float(mean),
+        "sd": sd,
+        "median": median,
+        "min": float(df["min"].min()),
+        "max": float(df["max"].max()),
+    }
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    from services.backend.datasources.config import DB_PATH
+
+    conn = sqlite3.connect(DB_PATH)
+    rebuild_rollups(conn)
+    conn.close()
@@ -0,0 +1,168 @@
+"""
+series_cache.py
+Result cache for graph series, invalidated by ingestion watermarks.
+
+Entries are keyed by (table, location, column, window, resolution) and hold
+the plotted (times, values) arrays plus the rollup summary, if any. Each entry
+remembers the series watermark it was computed at: the catalog row (update
+time, row count, last timestamp) together with the newest change_log id for
+the series. A lookup reads the current watermark, which is one primary-key read
+in each table, and only returns an entry whose watermark still matches. Data
+stays cached for as long as the series doesn't change, and a write is visible
+on the next request, without a TTL.
+
+The in-process backend is an LRU bounded by SERIES_CACHE_MAX_BYTES of array
+data. With SERIES_CACHE_BACKEND = "django:<alias>" entries are also stored in
+that Django cache (memcached, redis, ...), so every worker can serve a series
+any of them has computed. The local LRU stays in front of it.
+"""
+
+import hashlib
+import logging
+import pickle
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from services.backend.datasources.config import SERIES_CACHE_BACKEND, SERIES_CACHE_MAX_BYTES
+
+logger = logging.getLogger(__name__)
+
+# per-entry bookkeeping added to the array sizes when charging the memory budget
+ENTRY_OVERHEAD = 512
+
+
+class LocalBackend:
+    """Thread-safe in-process LRU bounded by the total size of cached entries."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            self._entries.move_to_end(key)
+            return item[0]
+
+    def set(self, key, value, nbytes: int):
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            self._entries[key] = (value, nbytes)
+            self.size += nbytes
+            while self.size > self.max_bytes and self._entries:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.size -= evicted
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+class DjangoCacheBackend:
+    """Shared backend on top of a configured Django cache alias."""
+
+    def __init__(self, alias: str = "default"):
+        self.alias = alias
+
+    def _cache(self):
+        from django.core.cache import caches
+
+        return caches[self.alias]
+
+    @staticmethod
+    def _key(key) -> str:
+        return "series:" + hashlib.sha1(repr(key).encode()).hexdigest()
+
+    def get(self, key):
+        try:
+            raw = self._cache().get(self._key(key))
+        except Exception as e:
+            logger.warning(f"Shared cache get failed: {e}")
+            return None
+        return None if raw is None else pickle.loads(raw)
+
+    def set(self, key, value, nbytes: int):
+        try:
+            self._cache().set(self._key(key), pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), timeout=None)
+        except Exception as e:
+            logger.warning(f"Shared cache set failed: {e}")
+
+    def clear(self):
+        pass
+
+
+local = LocalBackend(SERIES_CACHE_MAX_BYTES)
+shared = (DjangoCacheBackend(SERIES_CACHE_BACKEND.split(":", 1)[1] or "default")
+          if SERIES_CACHE_BACKEND.startswith("django:") else None)
+
+_counts = {"hits": 0, "misses": 0}
+
+
+def watermark(conn, table: str, location: str, column: str):
+    """
+    Current ingestion watermark of a series, or None if it can't be read (the
+    catalog or change log doesn't exist in this database), in which case the
+    series must not be cached.
+    """
+    try:
+        row = conn.execute(
+            "SELECT (SELECT updated_at || '|' || row_count || '|' || IFNULL(max_ts, '') FROM series_catalog "
+            "        WHERE tbl = ? AND location = ? AND col = ?), "
+            "       (SELECT MAX(id) FROM change_log WHERE tbl = ? AND location = ? AND (col = ? OR col IS NULL))",
+            (table, location, column, table, location, column),
+        ).fetchone()
+    except sqlite3.Error:
+        return None
+    return f"{row[0]}#{row[1]}"
+
+
+def get(key, mark):
+    """Return the cached (times, values, summary) for `key` at watermark `mark`, or None."""
+    if mark is None:
+        return None
+    entry = local.get(key)
+    if (entry is None or entry[0] != mark) and shared is not None:
+        # another worker may already have recomputed it
+        entry = shared.get(key)
+        if entry is not None and entry[0] == mark:
+            local.set(key, entry, _nbytes(entry))
+    if entry is None or entry[0] != mark:
+        _counts["misses"] += 1
+        return None
+    _counts["hits"] += 1
+    return entry[1], entry[2], entry[3]
+
+
+def _nbytes(entry) -> int:
+    return entry[1].nbytes + entry[2].nbytes + ENTRY_OVERHEAD
+
+
+def put(key, mark, times, values, summary=None):
+    """Cache a series computed at watermark `mark`. Does nothing if `mark` is None."""
+    if mark is None:
+        return
+    entry = (mark, np.asarray(times, dtype="datetime64[ns]"), np.asarray(values, dtype=np.float64), summary)
+    local.set(key, entry, _nbytes(entry))
+    if shared is not None:
+        shared.set(key, entry, _nbytes(entry))
+
+
+def clear():
+    local.clear()
+
+
+def stats() -> dict:
+    return {"entries": len(local._entries), "bytes": local.size, "max_bytes": local.max_bytes,
+            "hits": _counts["hits"], "misses": _counts["misses"], "shared": shared.alias if shared else None}
@@ -0,0 +1,86 @@
+"""
+singleflight.py
+Collapse concurrent identical computations into one.
+
+    flights = singleflight.Group()
+    value = flights.do(key, compute)
+
+The first thread to ask for `key` runs `compute`; threads asking for the same
+key while it runs wait for it and get the same value instead of repeating
+the work. Nothing is kept once the call finishes, so this only dedupes work
+that overlaps in time; caching across requests is series_cache's job.
+
+A waiter whose leader fails (including a leader cancelled because its client
+went away) runs the computation itself rather than inheriting the error.
+Callers that need to split the leader and waiter sides, e.g. to batch several
+leaderships into one query, can use begin/finish/wait directly.
+"""
+
+import threading
+
+# seconds a waiter waits for a leader before computing on its own
+WAIT_TIMEOUT = 120
+
+
+class _Call:
+    __slots__ = ("event", "ok", "value", "waiters")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.ok = False
+        self.value = None
+        self.waiters = 0
+
+
+class Group:
+    def __init__(self, name: str = ""):
+        self.name = name
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.counts = {"leaders": 0, "shared": 0, "fallbacks": 0}
+
+    def begin(self, key):
+        """Return (call, leader). The leader must call finish(); others call wait()."""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                return call, False
+            call = self._calls[key] = _Call()
+            self.counts["leaders"] += 1
+            return call, True
+
+    def finish(self, key, call, value=None, ok=True):
+        """Publish the leader's outcome and release its waiters."""
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+        call.ok, call.value = ok, value
+        call.event.set()
+
+    def wait(self, call, timeout=WAIT_TIMEOUT):
+        """Wait for a leader. Returns (True, value), or (False, None) if it failed or timed out."""
+        if call.event.wait(timeout) and call.ok:
+            self.counts["shared"] += 1
+            return True, call.value
+        self.counts["fallbacks"] += 1
+        return False, None
+
+    def do(self, key, fn):
+        """Return fn(), shared with any concurrent call for the same key."""
+        call, leader = self.begin(key)
+        if not leader:
+            ok, value = self.wait(call)
+            return value if ok else fn()
+        try:
+            value = fn()
+        except BaseException:
+            self.finish(key, call, ok=False)
+            raise
+        self.finish(key, call, value)
+        return value
+
+    def stats(self) -> dict:
+        with self._lock:
+            inflight = len(self._calls)
+        return dict(self.counts, name=self.name, inflight=inflight)
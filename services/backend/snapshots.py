@@ -0,0 +1,98 @@
+"""
+snapshots.py
+Read-only snapshot replica of Measurements.db for the web tier.
+
+`publish` copies the live database with SQLite's online backup API into a new
+file under SNAPSHOT_DIR, then atomically repoints SNAPSHOT_DIR/CURRENT at it.
+`connect` opens whatever CURRENT names with immutable=1, so web requests never
+wait on ingestion locks and skip SQLite's locking and change detection entirely.
+Snapshots are never modified after publishing; older ones are pruned, keeping
+SNAPSHOT_KEEP so requests that already opened one can finish.
+"""
+
+import glob
+import logging
+import os
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+
+from services.backend import cancellation
+from services.backend.datasources.config import DB_PATH, READ_REPLICA, SNAPSHOT_DIR, SNAPSHOT_KEEP
+
+logger = logging.getLogger(__name__)
+
+POINTER = os.path.join(SNAPSHOT_DIR, "CURRENT")
+
+# (pointer mtime, snapshot path) so requests don't re-read CURRENT every time
+_current = (None, None)
+
+
+def publish(conn=None) -> str:
+    """
+    Publish a consistent copy of the database and make it current. Uses `conn`
+    as the backup source if given (it must not be mid-transaction), otherwise
+    opens DB_PATH. Returns the snapshot path.
+    """
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d%H%M%S%f")
+    path = os.path.join(SNAPSHOT_DIR, f"Measurements-{stamp}.db")
+
+    src = conn or sqlite3.connect(DB_PATH)
+    dst = sqlite3.connect(path)
+    try:
+        src.backup(dst)
+        # immutable readers can't use a WAL, so make sure the copy doesn't need one
+        dst.execute("PRAGMA journal_mode=DELETE")
+    finally:
+        dst.close()
+        if conn is None:
+            src.close()
+
+    tmp = POINTER + ".tmp"
+    with open(tmp, "w") as f:
+        f.write(os.path.basename(path))
+    os.replace(tmp, POINTER)
+    logger.info(f"Published read replica {path}")
+    _prune()
+    return path
+
+
+def _prune():
+    snapshots = sorted(glob.glob(os.path.join(SNAPSHOT_DIR, "Measurements-*.db")))
+    for old in snapshots[:-SNAPSHOT_KEEP]:
+        try:
+            os.remove(old)
+        except OSError:
+            # still open somewhere (Windows); try again after the next publish
+            pass
+
+
+def current_path():
+    """Path of the current snapshot, or None if none has been published."""
+    global _current
+    try:
+        mtime = os.stat(POINTER).st_mtime_ns
+    except OSError:
+        return None
+    if _current[0] != mtime:
+        with open(POINTER) as f:
+            _current = (mtime, os.path.join(SNAPSHOT_DIR, f.read().strip()))
+    return _current[1]
+
+
+def connect() -> sqlite3.Connection:
+    """
+    Open a connection for read-only web requests: the current snapshot with
+    immutable=1 when READ_REPLICA is on and one exists, otherwise DB_PATH.
+    The connection joins the thread's cancellation scope, if it has one.
+    """
+    path = current_path() if READ_REPLICA else None
+    if path and os.path.exists(path):
+        return cancellation.track(sqlite3.connect(Path(path).resolve().as_uri() + "?mode=ro&immutable=1", uri=True))
+    return cancellation.track(sqlite3.connect(DB_PATH))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    publish()
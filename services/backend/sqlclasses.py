@@ -2,6 +2,7 @@ import logging
 import sqlite3
 from datetime import datetime
 from services.backend.datasources.config import DB_PATH, LOCATION_TO_TABLE, SQL_CONVERSION, TABLE_SCHEMAS
+from services.backend import catalog, changelog, latest_values, narrow, partitions, rollups
 
 # Setup logging
 logging.basicConfig(
@@ -40,15 +41,77 @@ def _initialize_tables():
         logger.error("Cannot initialize tables without a database connection.")
         return
     try:
-        for table_name, schema in TABLE_SCHEMAS.items():
-            logger.debug(f"Ensuring table '{table_name}' exists.")
-            cursor.execute(schema)
+        if narrow.enabled():
+            # measurement tables are views over the narrow observation store
+            narrow.ensure_schema(conn)
+        else:
+            for table_name, schema in TABLE_SCHEMAS.items():
+                logger.debug(f"Ensuring table '{table_name}' exists.")
+                cursor.execute(schema)
+        rollups.ensure_rollup_tables(cursor)
+        catalog.ensure_catalog_table(cursor)
+        latest_values.ensure_latest_table(cursor)
+        changelog.ensure_changelog_tables(cursor)
         conn.commit()
         logger.info("Database tables initialized successfully.")
+        _check_derived_tables()
     except sqlite3.Error as e:
         logger.error(f"Error initializing tables: {e}")
         conn.rollback()  # Rollback changes on error
 
+
+def _check_derived_tables():
+    """
+    Warn if the database has measurements but no derived rows yet. The
+    backfill scans every measurement table, so it is left to the explicit
+    `python -m services.backend.catalog` rather than run on connect.
+    latest_values is built last, so it is the one checked.
+    """
+    cursor.execute("SELECT 1 FROM latest_values LIMIT 1")
+    if cursor.fetchone():
+        return
+    for table_name in TABLE_SCHEMAS:
+        cursor.execute(f'SELECT 1 FROM "{table_name}" LIMIT 1')
+        if cursor.fetchone():
+            logger.warning("Rollups, series catalog and latest values are empty; "
+                           "run `python -m services.backend.catalog` to backfill them from existing data.")
+            return
+
+
+def refresh_derived_tables(cursor, table: str, location: str, times, columns=None):
+    """
+    Bring the tables derived from raw measurements (rollups, series catalog,
+    latest values) up to date after a write of `times` to `table` for `location`,
+    and append the write to the change log. `columns` names the columns written,
+    if known.
+
+    Must be called with the writer's cursor before it commits, so the raw rows and
+    their aggregates land in the same transaction.
+    """
+    parsed = []
+    for t in times:
+        try:
+            rollups.parse_ts(t)
+            parsed.append(str(t))
+        except (TypeError, ValueError):
+            logger.warning(f"Timestamp '{t}' for {table}/{location} is not ISO formatted; left out of rollups.")
+    changelog.ensure_changelog_tables(cursor)
+    changelog.record(cursor, table, location, parsed, columns)
+    if partitions.enabled():
+        # Rows older than the hot window may have siblings in a yearly shard that
+        # isn't attached here; partitions.archive() refreshes those ranges.
+        boundary = partitions.hot_boundary()
+        parsed = [t for t in parsed if t >= boundary]
+    if not parsed:
+        return
+    rollups.ensure_rollup_tables(cursor)
+    rollups.refresh_rollups(cursor, table, location, min(parsed), max(parsed))
+    catalog.ensure_catalog_table(cursor)
+    catalog.refresh_catalog(cursor, table, location)
+    latest_values.ensure_latest_table(cursor)
+    latest_values.refresh_latest(cursor, table, location)
+
+
 def updateDictionary(
     times: list = None,
     values: list = None,
@@ -162,6 +225,7 @@ def updateDictionary(
         sql = f"INSERT OR REPLACE INTO {table_name} (location, datetime, {sql_field}) VALUES (?, ?, ?)"
 
         cursor.executemany(sql, data_to_insert)
+        refresh_derived_tables(cursor, table_name, location, [row[1] for row in data_to_insert], [sql_field])
         conn.commit()
         logger.info(
             f"Successfully updated {len(data_to_insert)} records in '{table_name}' for {location} - {dataset}."
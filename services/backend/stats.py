@@ -0,0 +1,89 @@
+"""
+stats.py
+Summary statistics for the stats tables under the graphs.
+
+describe_many() summarizes any number of series at once. Their values are
+concatenated into one float64 array with a series id per value, missing
+readings (None/NaN) are dropped, and every series' count, mean, sd, min, max
+and median come out of a few vectorized operations (bincount sums and one
+sort) instead of a Python pass per statistic per series.
+
+A summary is a dict with the keys rollups.summarize returns (count, mean,
+sd (population), median, min, max), or None for a series with no values, so
+windows served from the rollup tables can pass their rollup summary through
+unchanged and skip the raw values entirely.
+"""
+
+import numpy as np
+import pandas as pd
+
+FIELDS = ("mean", "sd", "median", "min", "max", "range")
+
+
+def as_array(values) -> np.ndarray:
+    """float64 array of `values`; None and anything non-numeric become NaN."""
+    try:
+        return np.asarray(values, dtype=np.float64).ravel()
+    except (TypeError, ValueError):
+        return pd.to_numeric(pd.Series(list(values), dtype=object), errors="coerce").to_numpy(np.float64)
+
+
+def describe_many(series, summaries=None) -> list:
+    """
+    Return a summary (or None) for each sequence of values in `series`.
+
+    Where `summaries[i]` is already known (e.g. from the rollups) it is
+    returned as is and series i isn't looked at.
+    """
+    summaries = list(summaries or [])
+    summaries += [None] * (len(series) - len(summaries))
+    todo = [i for i, summary in enumerate(summaries) if not summary]
+    if not todo:
+        return summaries
+
+    arrays = [as_array(series[i]) for i in todo]
+    values = np.concatenate(arrays) if arrays else np.empty(0)
+    ids = np.repeat(np.arange(len(arrays)), [len(a) for a in arrays])
+    keep = ~np.isnan(values)
+    values, ids = values[keep], ids[keep]
+
+    n = len(arrays)
+    counts = np.bincount(ids, minlength=n)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = np.bincount(ids, weights=values, minlength=n) / counts
+        # two passes for the variance: sumsq - mean^2 loses precision on
+        # large readings like elevations
+        sds = np.sqrt(np.bincount(ids, weights=(values - means[ids]) ** 2, minlength=n) / counts)
+
+    # ids are already grouped, so one sort by (id, value) orders every series
+    ordered = values[np.lexsort((values, ids))]
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    present = counts > 0
+    first, last = starts[present], (starts + counts - 1)[present]
+    lo, hi = (starts + (counts - 1) // 2)[present], (starts + counts // 2)[present]
+    mins = np.full(n, np.nan)
+    maxs = np.full(n, np.nan)
+    medians = np.full(n, np.nan)
+    mins[present], maxs[present] = ordered[first], ordered[last]
+    medians[present] = (ordered[lo] + ordered[hi]) / 2.0
+
+    for j, i in enumerate(todo):
+        if counts[j]:
+            summaries[i] = {"count": int(counts[j]), "mean": float(means[j]), "sd": float(sds[j]),
+                            "median": float(medians[j]), "min": float(mins[j]), "max": float(maxs[j])}
+    return summaries
+
+
+def describe(values):
+    """Summary of a single series, or None if it has no values."""
+    return describe_many([values])[0]
+
+
+def table_row(summary, digits: int = 3) -> dict:
+    """Rounded mean/sd/median/min/max/range for display ('' for each if `summary` is None)."""
+    if not summary:
+        return {field: "" for field in FIELDS}
+    mn, mx = round(summary["min"], digits), round(summary["max"], digits)
+    return {"mean": round(summary["mean"], digits), "sd": round(summary["sd"], digits),
+            "median": round(summary["median"], digits), "min": mn, "max": mx,
+            "range": round(mx - mn, digits)}
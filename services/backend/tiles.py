@@ -0,0 +1,183 @@
+"""
+tiles.py
+Multi-resolution tile pyramid for zoomable graphs.
+
+Level z splits time into buckets of BASE_BUCKET_SECONDS * 2**z and groups
+TILE_POINTS consecutive buckets into a tile, so tile (z, i) covers
+
+    [i * span(z), (i + 1) * span(z)),  span(z) = TILE_POINTS * bucket_seconds(z)
+
+seconds of stored wall-clock time read as UTC, as in /api/v1/series. Every
+tile has at most TILE_POINTS points whatever its level, and a graph showing a
+window of width w needs level_for(w) and the two to five tiles overlapping it.
+Zooming in fetches a few finer tiles for the visible range instead of the
+whole series.
+
+A tile holds, per non-empty bucket, its start `t` (ms), mean `v`, `min`,
+`max` and `count`. It is aggregated from the finest rollup table whose
+buckets are no wider than the tile's (monthly, daily, hourly), or from the raw
+readings below an hour or when the rollups don't exist. Monthly rollups are
+placed by their start, so tile buckets wider than a month may hold one or two.
+
+Tiles are cached like series (TILE_CACHE_BACKEND: per-process LRU, or a Django
+cache alias shared by the workers and possibly on disk) and remember the
+series watermark they were built at, so a tile is rebuilt once new data is
+ingested for its series.
+"""
+
+import sqlite3
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from services.backend import catalog, query_engine, rollups, series_cache
+from services.backend.datasources.config import TILE_CACHE_BACKEND, TILE_CACHE_MAX_BYTES
+
+TILE_POINTS = 256
+BASE_BUCKET_SECONDS = 60
+MAX_LEVEL = 20  # ~2-year buckets
+FIELDS = ("t", "v", "min", "max", "count")
+
+_EPOCH = datetime(1970, 1, 1)
+# tile bounds are formatted as datetimes, so a tile must lie inside their range
+MIN_SECONDS = int((datetime.min - _EPOCH).total_seconds())
+MAX_SECONDS = int((datetime.max - _EPOCH).total_seconds())
+
+local = series_cache.LocalBackend(TILE_CACHE_MAX_BYTES)
+shared = (series_cache.DjangoCacheBackend(TILE_CACHE_BACKEND.split(":", 1)[1] or "default")
+          if TILE_CACHE_BACKEND.startswith("django:") else None)
+
+_counts = {"hits": 0, "misses": 0}
+
+
+def bucket_seconds(z: int) -> int:
+    return BASE_BUCKET_SECONDS << z
+
+
+def span_seconds(z: int) -> int:
+    return TILE_POINTS * bucket_seconds(z)
+
+
+def level_for(window_seconds: float, points: int = 1000) -> int:
+    """Finest level showing `window_seconds` in no more than `points` buckets."""
+    for z in range(MAX_LEVEL + 1):
+        if window_seconds / bucket_seconds(z) <= points:
+            return z
+    return MAX_LEVEL
+
+
+def tiles_for(start: float, end: float, z: int) -> range:
+    """Indexes of the level-z tiles overlapping [start, end] (seconds)."""
+    span = span_seconds(z)
+    return range(int(start // span), int(end // span) + 1)
+
+
+def valid_tiles(z: int) -> range:
+    """Indexes of the level-z tiles that lie wholly inside the representable time range."""
+    span = span_seconds(z)
+    return range(-(-MIN_SECONDS // span), (MAX_SECONDS + 1) // span)
+
+
+def data_tiles(conn, table: str, location: str, column: str, z: int):
+    """
+    Indexes of the level-z tiles between the series' first and last cataloged
+    readings (empty if it has none), or None if the catalog can't tell.
+    """
+    try:
+        entry = next((e for e in catalog.list_series(conn, table, location) if e["col"] == column), None)
+    except sqlite3.Error:
+        return None
+    if entry is None:
+        return None
+    if not entry["min_ts"] or not entry["max_ts"]:
+        return range(0)
+    first, last = _seconds(pd.to_datetime([entry["min_ts"], entry["max_ts"]], format="ISO8601"))
+    return tiles_for(first, last, z)
+
+
+def source_for(z: int) -> str:
+    """Rollup resolution a level-z tile is aggregated from, or "raw"."""
+    for resolution in reversed(rollups.RESOLUTIONS):
+        if rollups.BUCKET_SECONDS[resolution] <= bucket_seconds(z):
+            return resolution
+    return "raw"
+
+
+def _ts(seconds: int) -> str:
+    return (_EPOCH + timedelta(seconds=int(seconds))).strftime(query_engine.TS_FORMAT)
+
+
+def _seconds(times) -> np.ndarray:
+    return np.asarray(times, dtype="datetime64[s]").astype(np.int64)
+
+
+def _empty() -> dict:
+    return {field: np.empty(0, dtype=np.float64) for field in FIELDS}
+
+
+def build(conn, table: str, location: str, column: str, z: int, i: int) -> dict:
+    """Aggregate tile (z, i) of a series. Returns {field: float64 array}."""
+    bucket, lo = bucket_seconds(z), i * span_seconds(z)
+    hi = lo + span_seconds(z)
+    source = source_for(z)
+    if source != "raw":
+        try:
+            df = rollups.read_range(conn, table, location, column, _ts(lo), _ts(hi), source)
+            secs = _seconds(pd.to_datetime(df["bucket"], format="ISO8601", errors="coerce"))
+            counts = df["value_count"].to_numpy(np.float64)
+            sums = df["sum_value"].to_numpy(np.float64)
+            mins, maxs = df["min_value"].to_numpy(np.float64), df["max_value"].to_numpy(np.float64)
+        except (sqlite3.Error, pd.errors.DatabaseError):
+            source = "raw"  # rollup tables not created in this database
+    if source == "raw":
+        times, values = query_engine.fetch_series(conn, table, location, column, _ts(lo), _ts(hi - 1))
+        secs = _seconds(times)
+        counts, sums, mins, maxs = np.ones(len(values)), values, values, values
+
+    keep = (secs >= lo) & (secs < hi)
+    if not keep.any():
+        return _empty()
+    secs, counts, sums, mins, maxs = secs[keep], counts[keep], sums[keep], mins[keep], maxs[keep]
+    slots = (secs - lo) // bucket
+    # sources are ordered by time, so each bucket's rows are contiguous
+    slots_u, starts = np.unique(slots, return_index=True)
+    n = np.add.reduceat(counts, starts)
+    return {
+        "t": ((lo + slots_u * bucket) * 1000).astype(np.float64),
+        "v": np.add.reduceat(sums, starts) / n,
+        "min": np.minimum.reduceat(mins, starts),
+        "max": np.maximum.reduceat(maxs, starts),
+        "count": n,
+    }
+
+
+def get(conn, table: str, location: str, column: str, z: int, i: int) -> tuple:
+    """Return (tile, watermark) for tile (z, i), from the cache when the series hasn't changed."""
+    key = ("tile", table, location, column, z, i)
+    mark = series_cache.watermark(conn, table, location, column)
+    if mark is not None:
+        entry = local.get(key)
+        if (entry is None or entry[0] != mark) and shared is not None:
+            entry = shared.get(key)
+            if entry is not None and entry[0] == mark:
+                local.set(key, entry, _nbytes(entry[1]))
+        if entry is not None and entry[0] == mark:
+            _counts["hits"] += 1
+            return entry[1], mark
+    _counts["misses"] += 1
+    tile = build(conn, table, location, column, z, i)
+    if mark is not None:
+        local.set(key, (mark, tile), _nbytes(tile))
+        if shared is not None:
+            shared.set(key, (mark, tile), _nbytes(tile))
+    return tile, mark
+
+
+def _nbytes(tile) -> int:
+    return sum(a.nbytes for a in tile.values()) + series_cache.ENTRY_OVERHEAD
+
+
+def stats() -> dict:
+    return {"entries": len(local._entries), "bytes": local.size, "max_bytes": local.max_bytes,
+            "hits": _counts["hits"], "misses": _counts["misses"], "shared": shared.alias if shared else None}
@@ -4,10 +4,17 @@ Pulls all new data via DataSourceManager and generates tables for each dataset/l
 """
 from services.backend.datasources.manager import DataSourceManager
 from services.backend.sqlclasses import _get_db_connection as get_connection
+from services.backend.sqlclasses import refresh_derived_tables
+from services.backend.latest_values import get_latest
+from services.backend import changelog, columnar, narrow, partitions, snapshots
+from services.backend.datasources.config import COLUMNAR_ARCHIVE, LOCATION_TO_TABLE, READ_REPLICA, SQL_CONVERSION
 import os
 import re
 import sqlite3
 
+# change-log consumer name; tables are only rebuilt for series written since the last run
+UPDATES_CONSUMER = "updates"
+
 # optional graph/table helper
 try:
     from services.backend.graphgeneration.createCustom import makeTable
@@ -25,6 +32,10 @@ def normalize_field(name: str) -> str:
 
 
 def ensure_table_and_column(curr: sqlite3.Cursor, table: str, column: str):
+    if narrow.enabled():
+        # new metrics are a row in narrow_columns, not an ALTER TABLE
+        narrow.ensure_column(curr, table, column)
+        return
     # ensure table exists
     curr.execute(
         f"""
@@ -52,6 +63,13 @@ def sql_store(conn: sqlite3.Connection, curr: sqlite3.Cursor, location: str, dat
     ensure_table_and_column(curr, table, field)
 
     for t, v in zip(times, values):
+        if narrow.enabled():
+            # the compatibility view's INSERT trigger upserts just this column
+            curr.execute(
+                f'INSERT INTO {table} (datetime, location, "{field}") VALUES (?, ?, ?)',
+                (t, location, v),
+            )
+            continue
         # insert row if missing
         curr.execute(
             f"INSERT OR IGNORE INTO {table} (datetime, location) VALUES (?, ?)",
@@ -62,6 +80,7 @@ def sql_store(conn: sqlite3.Connection, curr: sqlite3.Cursor, location: str, dat
             f'UPDATE {table} SET "{field}" = ? WHERE datetime = ? AND location = ?',
             (None if v is None else v, t, location),
         )
+    refresh_derived_tables(curr, table, location, list(times), [field])
     conn.commit()
 
 
@@ -88,6 +107,7 @@ def main(num_days: int = 30):
 
     # establish DB connection from project's sqlclasses
     conn, curr = get_connection()
+    changelog.begin_batch("updates")
 
     # Pull everything once via manager (manager should call each source.store internally)
     print(f"Pulling last {num_days} days from all sources...")
@@ -96,6 +116,12 @@ def main(num_days: int = 30):
     except Exception as e:
         print(f"Error during manager.pull_all_data: {e}")
 
+    # Series written since the last run; None on the first run (rebuild everything)
+    head = changelog.head(conn)
+    changed = changelog.read_changes(conn, UPDATES_CONSUMER, upto=head)
+    if changed is not None:
+        changed = changelog.summarize(changed)
+
     # After pulling/storing, iterate sources/locations and generate tables per dataset
     locations_map = manager.location_sets
     sources = list(manager.sources.keys())
@@ -117,7 +143,14 @@ def main(num_days: int = 30):
 
         for location in locs:
             print(f"Generating tables for {location} from source {source}...")
+            # sources write through updateDictionary into their own table
+            # (gauge, dam, ...), under the SQL_CONVERSION column name
+            table = LOCATION_TO_TABLE.get(location)
             for dataset in dataset_display:
+                if changed is not None and table is not None and not changelog.touches(
+                    changed, table, location, SQL_CONVERSION.get(dataset)
+                ):
+                    continue
                 times, values = dictpull(conn, curr, dataset, location)
                 if times and values:
                     # write table using helper if available, otherwise print a small summary
@@ -130,6 +163,18 @@ def main(num_days: int = 30):
                     else:
                         print(f"[TABLE] {title}  rows={len(times)}  sample_times={times[:3]} sample_values={values[:3]}")
 
+    changelog.advance(conn, UPDATES_CONSUMER, head)
+    changelog.prune(conn)
+
+    if partitions.enabled():
+        print("Archiving rows older than the hot window into yearly shards...")
+        partitions.archive(conn)
+    if COLUMNAR_ARCHIVE:
+        print("Refreshing columnar archive of closed periods...")
+        columnar.export_all(conn)
+    if READ_REPLICA:
+        snapshots.publish(conn)
+
     conn.close()
     print("All updates and table generation complete.")
 
@@ -137,18 +182,22 @@ def get_last_date(conn, table: str, location: str, column: str):
     """
     Return the most recent datetime for a given (table, location, column) as a datetime.datetime,
     or None if no value exists. Handles several common timestamp string formats safely.
+    Reads latest_values, falling back to MAX(datetime) over the table.
     """
     curr = conn.cursor()
     try:
-        curr.execute(
-            f"SELECT MAX(datetime) FROM {table} WHERE location=? AND {column} IS NOT NULL",
-            (location,),
-        )
-        row = curr.fetchone()
-        if not row or not row[0]:
-            return None
-
-        ts = row[0]
+        entry = get_latest(conn, table, location, column)
+        if entry:
+            ts = entry["ts"]
+        else:
+            curr.execute(
+                f"SELECT MAX(datetime) FROM {table} WHERE location=? AND {column} IS NOT NULL",
+                (location,),
+            )
+            row = curr.fetchone()
+            if not row or not row[0]:
+                return None
+            ts = row[0]
         # parse timestamp robustly
         from datetime import datetime
 
@@ -0,0 +1,99 @@
+"""
+conditional.py
+HTTP validators and 304 handling for the page and graph views.
+
+maptabs, interactiveMap and the graph endpoints render from data that only
+changes on ingestion or when graphs are regenerated, so each view derives an
+ETag (and a Last-Modified where it can) from what its output depends on,
+before doing any of the work:
+
+- graph endpoints: the fragment key and data watermark from fragment_cache
+  (endpoint, series, windows, metric, graph settings), dated by the newest
+  catalog update of those series;
+- maptabs: the catalog state, the graph manifest stamp and today's date (the
+  default date range);
+- interactiveMap: the graph manifest stamp.
+
+A GET or HEAD whose If-None-Match (or If-Modified-Since) still matches gets an
+empty 304. Otherwise the view renders as before and the validators are set on
+the response with `Cache-Control: no-cache`, so browsers and proxies keep the
+copy but revalidate it on every use. Views pass None as the ETag when there is
+no watermark (no catalog or change log in this database) and nothing is cached.
+"""
+
+import calendar
+import hashlib
+import json
+from datetime import datetime
+
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+from config import settings
+from services.backend.query_engine import TS_FORMAT
+
+# bump when the page templates change, so copies rendered from the old ones aren't revalidated
+PAGE_VERSION = 1
+
+
+def make_etag(*parts) -> str:
+    """
+    Weak ETag over `parts`. Weak because a re-render is equivalent but not
+    byte-identical (CSRF tokens are masked afresh each time).
+    """
+    raw = json.dumps([PAGE_VERSION, *parts], default=str)
+    return f'W/"{hashlib.sha1(raw.encode()).hexdigest()}"'
+
+
+def request_parts(request, csrf: bool = False) -> list:
+    """What a page varies by besides its data: chrome, login state and, for forms, the CSRF cookie."""
+    user = getattr(request, "user", None)
+    parts = [request.headers.get("x-requested-with", "").lower() == "xmlhttprequest",
+             bool(user and user.is_authenticated)]
+    if csrf:
+        # a cached form stays valid only while the cookie its token was masked from does
+        parts.append(request.COOKIES.get(getattr(settings, "CSRF_COOKIE_NAME", "csrftoken"), ""))
+    return parts
+
+
+def to_timestamp(value):
+    """Epoch seconds of a catalog updated_at (local wall-clock time, TS_FORMAT), or None."""
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, TS_FORMAT).timestamp()
+    except ValueError:
+        return None
+
+
+def day_start(day) -> int:
+    """Epoch seconds of midnight UTC starting `day`."""
+    return calendar.timegm(day.timetuple())
+
+
+def newest(*timestamps):
+    """Latest of the given epoch seconds, ignoring None, as an int (or None)."""
+    present = [t for t in timestamps if t is not None]
+    return int(max(present)) if present else None
+
+
+def respond(request, etag, last_modified, render, private: bool = False):
+    """
+    Return a 304 if the client's copy tagged `etag` (or dated `last_modified`,
+    epoch seconds) is still current, else render(), with the validators set.
+    Only GET and HEAD with an ETag are conditional; anything else just renders.
+    """
+    if etag is None or request.method not in ("GET", "HEAD"):
+        return render()
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = render()
+        if response.status_code != 200:
+            return response
+    response["ETag"] = etag
+    if last_modified is not None:
+        response["Last-Modified"] = http_date(last_modified)
+    # always revalidate; 304s make that cheap
+    patch_cache_control(response, no_cache=True, **({"private": True} if private else {}))
+    patch_vary_headers(response, ("X-Requested-With",))
+    return response
@@ -0,0 +1,162 @@
+"""
+export.py
+Download selected series as CSV or XLSX.
+
+    GET /api/v1/export?location=Bismarck&location=Oahe&column=discharge&column=elevation
+                      &start=2015-01-01&end=2024-12-31[&table=gauge][&format=csv|xlsx]
+
+One row per stored reading: `location,datetime,<column>,...`, locations in
+the order given, each ascending in time; a column the location's table doesn't
+have is left blank. `start`/`end` take epoch seconds or ISO dates, as in
+/api/v1/series, and either may be left out for the whole history; bounds that
+don't parse or fall outside 1677-2262 (inf, nan, ...) are a 400.
+
+Rows are read from the database cursor EXPORT_CHUNK_ROWS at a time
+(query_engine.iter_rows), never as a whole DataFrame. CSV is streamed as it is
+read (gzip/brotli when accepted), so the download starts at once. XLSX is
+written by xlsxwriter in constant-memory mode to a temporary file, which is
+streamed when complete since a workbook can't be sent before it's finished;
+it needs the optional xlsxwriter package.
+"""
+
+import csv
+import sqlite3
+import tempfile
+from datetime import datetime
+
+from django.http import FileResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+
+from services import api, views
+from services.backend import query_engine, snapshots
+from services.backend.datasources.config import LOCATION_TO_TABLE, SQL_CONVERSION, TABLE_SCHEMAS
+
+try:
+    import xlsxwriter
+except ImportError:  # optional; only format=xlsx needs it
+    xlsxwriter = None
+
+FORMATS = ("csv", "xlsx")
+EXPORT_CHUNK_ROWS = 10000
+XLSX_MAX_ROWS = 1048576  # per worksheet, header included; longer exports continue on a new sheet
+
+
+class _Echo:
+    """File-like object for csv.writer that hands each formatted row back."""
+
+    def write(self, value):
+        return value
+
+
+def _plan(conn, query) -> tuple:
+    """Validate the query into ([(location, table, columns it has)], columns, start, end)."""
+    locations = [views._normalize_posted_location(loc) for loc in query.getlist("location")]
+    locations = [loc for loc in locations if loc]
+    if not locations:
+        raise api.BadRequest("'location' is required")
+    columns = []
+    for column in query.getlist("column"):
+        column = SQL_CONVERSION.get(column, column)
+        if column and column not in columns:
+            columns.append(column)
+    if not columns:
+        raise api.BadRequest("'column' is required")
+
+    plan = []
+    for location in locations:
+        table = query.get("table") or LOCATION_TO_TABLE.get(location)
+        if table not in TABLE_SCHEMAS:
+            raise api.BadRequest(f"unknown table '{table}' for location '{location}'")
+        value_columns = query_engine.table_meta(conn, table).value_columns
+        plan.append((location, table, [c for c in columns if c in value_columns]))
+    missing = [c for c in columns if not any(c in present for _, _, present in plan)]
+    if missing:
+        raise api.BadRequest(f"unknown column(s) {', '.join(missing)} for the requested locations")
+
+    start, end = api._parse_time(query.get("start"), "start"), api._parse_time(query.get("end"), "end")
+    if start is not None and end is not None and start > end:
+        raise api.BadRequest("'start' is after 'end'")
+    return plan, columns, start, end
+
+
+def _rows(conn, plan, columns, start, end):
+    """Yield chunks of export rows [location, datetime, *columns]."""
+    for location, table, present in plan:
+        if not present:
+            continue
+        positions = [present.index(c) + 1 if c in present else None for c in columns]
+        for chunk in query_engine.iter_rows(conn, table, location, present, start, end, EXPORT_CHUNK_ROWS):
+            yield [[location, row[0], *(row[p] if p else None for p in positions)] for row in chunk]
+
+
+def _csv_chunks(plan, columns, start, end):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(["location", "datetime", *columns]).encode()
+    conn = snapshots.connect()
+    try:
+        for chunk in _rows(conn, plan, columns, start, end):
+            yield "".join(writer.writerow(row) for row in chunk).encode()
+    finally:
+        conn.close()
+
+
+def _write_xlsx(out, plan, columns, start, end):
+    workbook = xlsxwriter.Workbook(out, {"constant_memory": True})
+    date_format = workbook.add_format({"num_format": "yyyy-mm-dd hh:mm:ss"})
+    header = ["location", "datetime", *columns]
+    sheet, r = None, XLSX_MAX_ROWS
+    conn = snapshots.connect()
+    try:
+        for chunk in _rows(conn, plan, columns, start, end):
+            for location, ts, *values in chunk:
+                if r == XLSX_MAX_ROWS:
+                    sheet, r = workbook.add_worksheet(), 1
+                    sheet.write_row(0, 0, header)
+                sheet.write_string(r, 0, location)
+                try:
+                    sheet.write_datetime(r, 1, datetime.strptime(ts, query_engine.TS_FORMAT), date_format)
+                except (TypeError, ValueError):
+                    sheet.write(r, 1, ts)
+                sheet.write_row(r, 2, values)
+                r += 1
+        if sheet is None:
+            workbook.add_worksheet().write_row(0, 0, header)
+    finally:
+        conn.close()
+        workbook.close()
+
+
+@require_GET
+def export(request):
+    fmt = request.GET.get("format", "csv")
+    if fmt not in FORMATS:
+        return JsonResponse({"error": f"'format' must be one of {', '.join(FORMATS)}"}, status=400)
+    if fmt == "xlsx" and xlsxwriter is None:
+        return JsonResponse({"error": "XLSX export needs the xlsxwriter package; use format=csv"}, status=501)
+
+    conn = snapshots.connect()
+    try:
+        plan, columns, start, end = _plan(conn, request.GET)
+    except api.BadRequest as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    except sqlite3.Error as e:
+        return JsonResponse({"error": f"export unavailable: {e}"}, status=404)
+    finally:
+        conn.close()
+
+    if fmt == "xlsx":
+        out = tempfile.TemporaryFile(suffix=".xlsx")
+        try:
+            _write_xlsx(out, plan, columns, start, end)
+        except Exception:
+            out.close()
+            raise
+        out.seek(0)
+        return FileResponse(out, as_attachment=True, filename="export.xlsx",
+                            content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+
+    encoding = api.choose_encoding(request)
+    response = StreamingHttpResponse(api._compress_stream(_csv_chunks(plan, columns, start, end), encoding),
+                                     content_type="text/csv")
+    response["Content-Disposition"] = 'attachment; filename="export.csv"'
+    return api.finish_response(response, None, encoding)
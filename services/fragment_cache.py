@@ -0,0 +1,90 @@
+"""
+fragment_cache.py
+Cache of rendered graph fragments for the custom*graph views.
+
+A fragment is the Plotly div and statistics table a graph view renders into
+HTML/graphdisplay.html. It depends only on the endpoint, the series asked for
+(table, location, column, window), the metric label, the point budget and the
+WebGL threshold, so it is keyed by those (in request order) and stored in the
+Django cache selected by settings.GRAPH_FRAGMENT_CACHE_ALIAS. The page around
+it (navbar, login state) is still rendered per request.
+
+Each entry remembers the data watermark it was built at: the ingestion
+watermarks of all its series (see series_cache.watermark). A lookup only
+returns an entry whose watermark still matches, so new data shows up on the
+next request and a TTL is only needed for eviction.
+"""
+
+import hashlib
+import json
+import logging
+
+from django.core.cache import caches
+
+from config import settings
+from services.backend import series_cache
+
+logger = logging.getLogger(__name__)
+
+# bump when the fragment HTML changes shape, so old entries are never served
+FRAGMENT_VERSION = 2
+
+_counts = {"hits": 0, "misses": 0}
+
+
+def _cache():
+    return caches[getattr(settings, "GRAPH_FRAGMENT_CACHE_ALIAS", "default")]
+
+
+def make_key(endpoint: str, wanted, label: str) -> str:
+    """
+    Cache key for `endpoint` drawing the (table, location, column, start, end)
+    series in `wanted`. Order matters: traces, stats rows and title follow it.
+    """
+    raw = json.dumps([FRAGMENT_VERSION, endpoint, label, [list(w) for w in wanted],
+                      getattr(settings, "GRAPH_POINT_BUDGET", 2000), getattr(settings, "GRAPH_DOWNSAMPLE", "lttb"),
+                      getattr(settings, "GRAPH_WEBGL_POINTS", 5000)],
+                     default=str)
+    return "fragment:" + hashlib.sha1(raw.encode()).hexdigest()
+
+
+def watermark(conn, wanted):
+    """Combined watermark of every series in `wanted`, or None if any can't be read."""
+    marks = []
+    for table, location, column in sorted({(w[0], w[1], w[2]) for w in wanted}):
+        mark = series_cache.watermark(conn, table, location, column)
+        if mark is None:
+            return None
+        marks.append(mark)
+    return hashlib.sha1("\n".join(marks).encode()).hexdigest()
+
+
+def get(key: str, mark):
+    """Return the cached (plot_div, table_html) for `key` at watermark `mark`, or None."""
+    if mark is None:
+        return None
+    try:
+        entry = _cache().get(key)
+    except Exception as e:
+        logger.warning(f"Fragment cache get failed: {e}")
+        entry = None
+    if entry is None or entry[0] != mark:
+        _counts["misses"] += 1
+        return None
+    _counts["hits"] += 1
+    return entry[1]
+
+
+def put(key: str, mark, fragment):
+    """Store a fragment built at watermark `mark`. Does nothing if `mark` is None."""
+    if mark is None:
+        return
+    try:
+        _cache().set(key, (mark, fragment))
+    except Exception as e:
+        logger.warning(f"Fragment cache set failed: {e}")
+
+
+def stats() -> dict:
+    return {"alias": getattr(settings, "GRAPH_FRAGMENT_CACHE_ALIAS", "default"),
+            "hits": _counts["hits"], "misses": _counts["misses"]}
@@ -1,11 +1,14 @@
-from plotly.offline import plot
 from plotly.graph_objs import Scatter
 import os
 import re
 from datetime import datetime
 import json
 import sqlite3
+import pandas as pd
+import numpy as np
+from services import conditional, fragment_cache
 from services.backend import custom_graph as custom_graph
+from services.backend import cancellation, catalog, downsample, graph_manifest, graph_traces, latest_values, plotly_assets, query_engine, rollups, series_cache, singleflight, snapshots, stats
 from services.backend.datasources.config import SQL_CONVERSION, LOCATION_TO_TABLE, DB_PATH, TABLE_SCHEMAS
 from django.template.defaulttags import csrf_token
 from config import settings
@@ -134,21 +137,48 @@ def homepage(request):
     return render(request, 'HTML/homepage.html')
 
 def maptabs(request):
+    # Validators from the catalog and graph manifest, checked before the catalog
+    # walk below, so a repeat visit costs a 304 (see services/conditional.py)
+    try:
+        conn = snapshots.connect()
+        try:
+            mark, updated = catalog.state(conn)
+        finally:
+            conn.close()
+    except Exception:
+        mark, updated = None, None
+    etag = last_modified = None
+    if mark is not None:
+        today = datetime.utcnow().date()
+        manifest = graph_manifest.stamp()
+        etag = conditional.make_etag('maptabs', mark, manifest, today, settings.GRAPH_WEBGL_POINTS,
+                                     conditional.request_parts(request, csrf=True))
+        last_modified = conditional.newest(conditional.to_timestamp(updated), conditional.day_start(today),
+                                           *(ns / 1e9 for ns in manifest if ns))
+    return conditional.respond(request, etag, last_modified, lambda: _render_maptabs(request), private=True)
+
+def _render_maptabs(request):
     # Build per-location available data options to populate the dropdowns.
     # We'll inspect the DB table for each location's table and map SQL columns back
     # to display names using SQL_CONVERSION.
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = snapshots.connect()
         curr = conn.cursor()
     except Exception:
         conn = None
         curr = None
 
-    # Gather list of locations by scanning the Measurements DB tables.
+    # Gather list of locations from the series catalog, falling back to scanning
+    # the Measurements DB tables when the catalog hasn't been populated yet.
     locations = []
     location_table_map = {}
+    cataloged = catalog.locations_by_table(conn) if conn else {}
     try:
-        if curr:
+        for table_name, locs in cataloged.items():
+            for l in locs:
+                location_table_map.setdefault(l, table_name)
+                locations.append(l)
+        if curr and not cataloged:
             for table_name in TABLE_SCHEMAS.keys():
                 try:
                     curr.execute(f"SELECT DISTINCT location FROM \"{table_name}\" WHERE location IS NOT NULL")
@@ -175,7 +205,12 @@ def maptabs(request):
         base = loc
         table_name = LOCATION_TO_TABLE.get(base, 'gauge')
         cols = []
-        if curr:
+        if cataloged:
+            try:
+                cols = [r['col'] for r in catalog.list_series(conn, table_name, base) if r['non_null_count']]
+            except sqlite3.Error:
+                cols = []
+        if curr and not cols:
             try:
                 curr.execute(f"PRAGMA table_info({table_name})")
                 cols = [r[1] for r in curr.fetchall()]
@@ -206,75 +241,31 @@ def maptabs(request):
 
         location_options[loc] = opts
 
+    # newest reading per (table, location, column) for the "latest" badges
+    latest_by_series = latest_values.get_latest_bulk(conn) if conn else {}
+
     if conn:
         conn.close()
 
-    # Also scan static/graphs for available generated HTML graphs so the page
-    # can display latest-available dates per metric without needing a separate
-    # static JSON file.
-    from django.templatetags.static import static
-
-    graphs_dir = os.path.join(settings.BASE_DIR, 'static', 'graphs')
+    # Generated graphs per location and metric, with the latest date each covers,
+    # from the graph manifest rather than a scan of static/graphs.
     graph_index = {}
-    try:
-        files = os.listdir(graphs_dir)
-    except Exception:
-        files = []
-
-    # helper: normalize
-    def norm(s):
-        return ''.join((s or '').lower().split())
-
-    # parse filenames for metric and end-date token
-    for fn in files:
-        if not fn.lower().endswith('.html'):
+    for loc in location_options.keys():
+        indexed = graph_manifest.for_location(loc)
+        if not indexed:
             continue
-        stem = fn[:-5]
-        # try double-underscore pattern: source__Location__metric__date...
-        if '__' in stem:
-            parts = stem.split('__')
-            if len(parts) >= 3:
-                location = parts[1].replace('_', ' ').strip()
-                metric = parts[2].replace('_', ' ').strip()
-            else:
-                continue
-        else:
-            # try ' at ' human readable: '<metric> at <Location>'
-            atm = re.split(r"\s+at\s+", stem, flags=re.IGNORECASE)
-            if len(atm) >= 2:
-                location = atm[-1].replace('_', ' ').strip()
-                metric = ' at '.join(atm[:-1]).replace('_', ' ').strip()
-            else:
-                # fallback: skip if we cannot determine location
-                continue
-
-        # match location against our known locations list (template uses Title-case names)
-        for loc in location_options.keys():
-            if norm(loc) == norm(location) or norm(loc) in norm(location):
-                # find date token (try patterns like 20240814_20240904 or single 20240814)
-                latest = None
-                m = re.search(r"(\d{6,8})_(\d{6,8})_interactive", fn)
-                if m:
-                    end = m.group(2)
-                    if len(end) == 8:
-                        latest = f"{end[0:4]}-{end[4:6]}-{end[6:8]}"
-                else:
-                    m2 = re.search(r"(\d{8})_interactive", fn)
-                    if m2:
-                        d = m2.group(1)
-                        latest = f"{d[0:4]}-{d[4:6]}-{d[6:8]}"
-
-                entry = graph_index.setdefault(loc, {})
-                metrics = entry.setdefault('metrics', {})
-                lst = metrics.setdefault(metric.title(), [])
-                lst.append(fn)
-                # store/upgrade latest
-                if latest:
-                    cur = entry.setdefault('latest', {})
-                    prev = cur.get(metric.title())
-                    if not prev or latest > prev:
-                        cur[metric.title()] = latest
-                break
+        entry = graph_index.setdefault(loc, {})
+        entry['metrics'] = {metric: list(m['files']) for metric, m in indexed.items()}
+        latest = {metric: m['latest'] for metric, m in indexed.items() if m['latest']}
+        if latest:
+            entry['latest'] = latest
+
+    # Dates from the database take precedence over those parsed from graph filenames
+    for (tbl, loc, col), entry in latest_by_series.items():
+        if loc not in location_options or not entry['ts']:
+            continue
+        cur = graph_index.setdefault(loc, {}).setdefault('latest', {})
+        cur[rev.get(col, col.replace('_', ' ').title()).title()] = entry['ts'][:10]
 
     # Build location_entries so the template can render per-location forms
     table_to_endpoint = {
@@ -306,9 +297,14 @@ def maptabs(request):
         'graph_index_json': json.dumps(graph_index),
         'default_start': default_start,
         'default_end': default_end,
+        'graph_webgl_points': settings.GRAPH_WEBGL_POINTS,
     })
 
 
+# concurrent identical series reads and fragment builds share one computation
+_series_flights = singleflight.Group("series")
+_fragment_flights = singleflight.Group("fragment")
+
 def _normalize_posted_location(loc: str) -> str:
     """Normalize posted location values from forms to match DB 'location' values.
     Examples: 'Hazen ND' -> 'Hazen', 'Little Eagle SD' -> 'Little Eagle'.
@@ -327,7 +323,253 @@ def _normalize_posted_location(loc: str) -> str:
 def _is_embed_request(request) -> bool:
     """Detect if request comes from AJAX/iframe to adjust template chrome."""
     return request.headers.get('x-requested-with', '').lower() == 'xmlhttprequest'
+
+def _form(request):
+    """Submitted graph form: the query string for GET (cacheable by URL), else the POST body."""
+    return request.POST if request.method == 'POST' else request.GET
+
+def _load_rollup(conn, table_name, loc, col, start_epoch, end_epoch):
+    """Return (times, values, summary) from the rollup tables if the window holds
+    more raw values than settings.GRAPH_POINT_BUDGET, otherwise None.
+
+    The finest rollup resolution that fits the budget is used (bucket means), and
+    `summary` carries the rollup statistics for the stats table.
+    """
+    if start_epoch is None or end_epoch is None:
+        return None
+    budget = getattr(settings, 'GRAPH_POINT_BUDGET', 2000)
+    try:
+        if rollups.estimate_points(conn, table_name, loc, col, start_epoch, end_epoch) > budget:
+            resolution = rollups.choose_resolution(start_epoch, end_epoch, budget)
+            buckets = rollups.query_rollup(conn, table_name, loc, col, start_epoch, end_epoch, resolution)
+            if not buckets.empty:
+                summary = rollups.summarize(conn, table_name, loc, col, start_epoch, end_epoch)
+                return buckets['datetime'].tolist(), buckets['mean'].tolist(), summary
+    except sqlite3.Error:
+        # rollup tables not created in this database yet; fall back to raw rows
+        pass
+    return None
+
+def _reduce_series(times, values, summary, budget, method):
+    """Downsample a series longer than `budget` with `method` (see downsample.py).
+
+    A raw series gets a `summary` of the full data first, so the stats table
+    still describes every reading rather than the plotted subset.
+    """
+    if method == 'none' or len(values) <= budget:
+        return times, values, summary
+    times, values = np.asarray(times, dtype='datetime64[ns]'), np.asarray(values, dtype=np.float64)
+    if summary is None:
+        summary = stats.describe(values)
+    times, values = downsample.downsample(times, values, budget, method)
+    return times, values, summary
+
+def _load_series_many(conn, wanted, coalesce=True):
+    """Return a (times, values, summary) for each (table_name, loc, col, start_epoch,
+    end_epoch) in `wanted`, in order.
+
+    Series whose ingestion watermark hasn't moved since they were last computed
+    come from series_cache. Windows over the point budget come from the rollups
+    (see _load_rollup). The rest are read with one query per (table, column) for
+    all of their locations (location IN (...)), so comparing many sites costs one
+    query, not one per site. Anything still over the budget is downsampled with
+    settings.GRAPH_DOWNSAMPLE, so no trace has more than GRAPH_POINT_BUDGET
+    points. `summary` is None for raw series that weren't reduced.
+
+    A series another request is already computing is waited for rather than
+    computed again (single-flight, see singleflight.py), unless `coalesce` is off.
+    """
+    budget = getattr(settings, 'GRAPH_POINT_BUDGET', 2000)
+    method = getattr(settings, 'GRAPH_DOWNSAMPLE', 'lttb')
+    results = [None] * len(wanted)
+    keys, marks = {}, {}
+    raw = {}
+    led, waiting = {}, {}
+
+    def done(i, result):
+        results[i] = result
+        if i in led:
+            _series_flights.finish((keys[i], marks[i]), led.pop(i), result)
+
+    try:
+        for i, (table_name, loc, col, start_epoch, end_epoch) in enumerate(wanted):
+            cancellation.check()
+            # the resolution is a function of the window, the point budget and the data
+            keys[i] = (table_name, loc, col, start_epoch, end_epoch, f"budget={budget}:{method}")
+            marks[i] = series_cache.watermark(conn, table_name, loc, col)
+            cached = series_cache.get(keys[i], marks[i])
+            if cached is not None:
+                times, values, summary = cached
+                results[i] = (pd.DatetimeIndex(times).tolist(), values.tolist(), summary) if len(times) else ([], [], None)
+                continue
+            if coalesce:
+                call, leader = _series_flights.begin((keys[i], marks[i]))
+                if not leader:
+                    waiting[i] = call
+                    continue
+                led[i] = call
+            rolled = _load_rollup(conn, table_name, loc, col, start_epoch, end_epoch)
+            if rolled is None:
+                raw.setdefault((table_name, col), []).append(i)
+                continue
+            times, values, summary = _reduce_series(*rolled, budget, method)
+            series_cache.put(keys[i], marks[i], times, values, summary)
+            done(i, (pd.DatetimeIndex(times).tolist(), np.asarray(values, dtype=np.float64).tolist(), summary))
+
+        for (table_name, col), indexes in raw.items():
+            cancellation.check()
+            windows = {wanted[i][1]: (wanted[i][3], wanted[i][4]) for i in indexes}
+            fetched = query_engine.fetch_many(conn, table_name, col, windows)
+            for i in indexes:
+                times, values, summary = _reduce_series(*fetched[wanted[i][1]], None, budget, method)
+                series_cache.put(keys[i], marks[i], times, values, summary)
+                if len(times) == 0:
+                    done(i, ([], [], None))
+                else:
+                    done(i, (pd.DatetimeIndex(times).tolist(), values.tolist(), summary))
+    finally:
+        # release anyone waiting on a series this request didn't get to finish
+        for i, call in led.items():
+            _series_flights.finish((keys[i], marks[i]), call, ok=False)
+
+    # only wait once our own series are published, so two requests can't wait on each other
+    for i, call in waiting.items():
+        ok, result = _series_flights.wait(call)
+        results[i] = result if ok else _load_series_many(conn, [wanted[i]], coalesce=False)[0]
+    return results
+
+def _load_series(conn, table_name, loc, col, start_epoch, end_epoch):
+    """Return (times, values, summary) for one site and SQL column over a window."""
+    return _load_series_many(conn, [(table_name, loc, col, start_epoch, end_epoch)])[0]
+
+def _stats_table_html(sites, series_list, summaries):
+    """Build the per-site statistics table shown under each graph.
+
+    Sites with a rollup `summary` use it directly; the rest are computed from the
+    plotted values, all sites in one vectorized pass (see stats.py).
+    """
+    summaries = stats.describe_many([values for _, values in series_list], summaries)
+    rows = [dict(stats.table_row(summary), site=site) for site, summary in zip(sites, summaries)]
+
+    table_html = '<table class="stats"><tr><th>Site</th><th>Mean</th><th>SD</th><th>Median</th><th>Min</th><th>Max</th><th>Range</th></tr>'
+    for r in rows:
+        table_html += f"<tr><td>{r['site']}</td><td>{r['mean']}</td><td>{r['sd']}</td><td>{r['median']}</td><td>{r['min']}</td><td>{r['max']}</td><td>{r['range']}</td></tr>"
+    table_html += '</table>'
+    return table_html
     
+def _graph_fragment(conn, endpoint, wanted, sites, data2see, diagnose=False):
+    """Return (plot_div, table_html) for the series in `wanted`, one per site.
+
+    Sites are drawn in request order. The fragment is cached per request shape
+    in fragment_cache and rebuilt only when the data watermark of one of its
+    series moves; concurrent identical requests share one build. With
+    `diagnose`, an empty graph explains what each site has.
+    """
+    key = fragment_cache.make_key(endpoint, wanted, data2see)
+    mark = fragment_cache.watermark(conn, wanted)
+    cached = fragment_cache.get(key, mark)
+    if cached is not None:
+        return cached
+
+    def build():
+        fragment = _build_fragment(conn, wanted, sites, data2see, diagnose)
+        fragment_cache.put(key, mark, fragment)
+        return fragment
+    return _fragment_flights.do((key, mark), build)
+
+def _graph_response(request, conn, endpoint, wanted, sites, data2see, diagnose=False):
+    """Render HTML/graphdisplay.html for `wanted`, or a 304 if the client's copy is current.
+
+    The ETag comes from the fragment key and data watermark and Last-Modified
+    from the catalog, both read before anything is built (see services/conditional.py).
+    """
+    etag = None
+    mark = fragment_cache.watermark(conn, wanted)
+    if mark is not None:
+        etag = conditional.make_etag(fragment_cache.make_key(endpoint, wanted, data2see), mark, diagnose,
+                                     conditional.request_parts(request))
+    last_modified = conditional.to_timestamp(catalog.last_updated(conn, [w[:3] for w in wanted]))
+
+    def render_page():
+        plot_div, table_html = _graph_fragment(conn, endpoint, wanted, sites, data2see, diagnose=diagnose)
+        return render(request, 'HTML/graphdisplay.html', context={'plot': plot_div, 'table': table_html, 'embed': _is_embed_request(request)})
+    return conditional.respond(request, etag, last_modified, render_page)
+
+def _build_fragment(conn, wanted, sites, data2see, diagnose):
+    series_list = []
+    summaries = []
+    for times, values, summary in _load_series_many(conn, wanted):
+        series_list.append((times, values))
+        summaries.append(summary)
+
+    traces = graph_traces.line_traces(dict(x=times, y=values, name=sites[idx])
+                                      for idx, (times, values) in enumerate(series_list) if times)
+
+    if traces:
+        layout = dict(title=f"{data2see} - {', '.join(sites)}", xaxis=dict(title='Time'), yaxis=dict(title=data2see))
+        plot_div = plotly_assets.to_div({'data': traces, 'layout': layout})
+    elif diagnose:
+        plot_div = _no_data_diagnostics(conn, sites)
+    else:
+        plot_div = '<p>No data available for selected stations/date range.</p>'
+
+    table_html = _stats_table_html(sites, series_list, summaries)
+    return plot_div, table_html
+
+def _no_data_diagnostics(conn, sites):
+    """Explain an empty graph: rows, time range and non-empty columns per site."""
+    diag = '<p>No data available for selected stations/date range.</p>'
+    diag += '<h4>Diagnostics</h4>'
+    diag += '<table class="stats"><tr><th>Site</th><th>Rows</th><th>Min Datetime</th><th>Max Datetime</th><th>Non-empty Columns</th></tr>'
+    for loc in sites:
+        table_name = LOCATION_TO_TABLE.get(loc, 'gauge')
+        try:
+            entries = catalog.list_series(conn, table_name, loc)
+        except sqlite3.Error:
+            entries = []
+        if entries:
+            total = max(e['row_count'] for e in entries)
+            mn = min((e['min_ts'] for e in entries if e['min_ts']), default=None)
+            mx = max((e['max_ts'] for e in entries if e['max_ts']), default=None)
+            nonempty = [f"{e['col']} ({e['non_null_count']})" for e in entries if e['non_null_count']]
+            diag += f"<tr><td>{loc}</td><td>{total}</td><td>{mn or ''}</td><td>{mx or ''}</td><td>{', '.join(nonempty)}</td></tr>"
+            continue
+        try:
+            curr = conn.cursor()
+            # total rows for this location in its table
+            curr.execute(f"SELECT count(*) FROM \"{table_name}\" WHERE location=?", (loc,))
+            total = curr.fetchone()[0]
+            # min/max datetime for this location
+            try:
+                curr.execute(f"SELECT MIN(datetime), MAX(datetime) FROM \"{table_name}\" WHERE location=?", (loc,))
+                mn_mx = curr.fetchone()
+                mn = mn_mx[0]
+                mx = mn_mx[1]
+            except Exception:
+                mn = mx = None
+            # find non-empty columns for this location (limit to first 10 columns)
+            nonempty = []
+            try:
+                curr.execute(f"PRAGMA table_info(\"{table_name}\")")
+                cols = [r[1] for r in curr.fetchall()]
+                for c in cols:
+                    if c in ('datetime','location'):
+                        continue
+                    try:
+                        curr.execute(f"SELECT count(*) FROM \"{table_name}\" WHERE location=? AND \"{c}\" IS NOT NULL", (loc,))
+                        cnt = curr.fetchone()[0]
+                        if cnt and cnt>0:
+                            nonempty.append(f"{c} ({cnt})")
+                    except Exception:
+                        continue
+            except Exception:
+                nonempty = []
+            diag += f"<tr><td>{loc}</td><td>{total}</td><td>{mn or ''}</td><td>{mx or ''}</td><td>{', '.join(nonempty)}</td></tr>"
+        except Exception as e:
+            diag += f"<tr><td>{loc}</td><td colspan=4>Error: {e}</td></tr>"
+    diag += '</table>'
+    return diag
+
 def tabs(request):
     return render(request, 'graphing/tabs.html')
 
@@ -347,55 +589,42 @@ def custommesonet(request):
     return render(request, 'graphing/custommesonet.html')
 
 def interactiveMap(request):
+    # The page only changes with the generated graphs, so the manifest stamp validates it
+    manifest = graph_manifest.stamp()
+    etag = conditional.make_etag('interactiveMap', manifest, conditional.request_parts(request))
+    last_modified = conditional.newest(*(ns / 1e9 for ns in manifest if ns))
+    return conditional.respond(request, etag, last_modified, lambda: _render_interactive_map(request))
+
+def _render_interactive_map(request):
     # Build a mapping of station name -> list of graph URLs found in static/graphs
     from django.templatetags.static import static
 
-    graphs_dir = os.path.join(settings.BASE_DIR, 'static', 'graphs')
     places = ['Hazen', 'Stanton', 'Washburn', 'Price', 'Mandan', 'Bismarck', 'Judson',
               'Breien', 'Cash', 'Wakpala', 'Whitehorse', 'Schmidt', 'Little Eagle',
               'Oahe', 'Big Bend', 'Fort Randall', 'Gavins Point', 'Garrison', 'Fort Peck',
               'Fort Yates', 'Mott', 'Carson', 'Linton', 'Lemmon', 'McIntosh', 'Mclaughlin',
               'Mound City', 'Timber Lake']
 
-    graph_map = {}
-    try:
-        files = os.listdir(graphs_dir)
-    except Exception:
-        files = []
-
-    # Normalize function for matching
-    def norm(s):
-        return ''.join((s or '').lower().split())
-
-    for fn in files:
-        if not fn.lower().endswith('.html'):
-            continue
-        fn_norm = norm(fn)
-        for place in places:
-            if norm(place) in fn_norm:
-                graph_map.setdefault(place, []).append(static(f'graphs/{fn}'))
-
-    # Sort lists for determinism
-    for k in graph_map:
-        graph_map[k] = sorted(graph_map[k])
+    graph_map = {place: [static(f'graphs/{fn}') for fn in files]
+                 for place, files in graph_manifest.files_matching(places).items()}
 
     return render(request, 'HTML/interactiveMap.html', {'graph_map_json': json.dumps(graph_map)})
 
 def customgaugegraph(request):
+    form = _form(request)
     
     #Pulls most recently submitted data
-    locationlist = request.POST.getlist('location')
+    locationlist = form.getlist('location')
     length = len(locationlist)
 
-    data2see = request.POST['data2see']
+    data2see = form['data2see']
 
-    start_date = request.POST['start-date']
+    start_date = form['start-date']
 
-    end_date = request.POST['end-date']
+    end_date = form['end-date']
 
     # Build plot and table using the new custom_graph helpers
     sites = []
-    series_list = []
 
     # parse date strings to epoch seconds
     def to_epoch(s):
@@ -410,127 +639,36 @@ def customgaugegraph(request):
     start_epoch = to_epoch(start_date)
     end_epoch = to_epoch(end_date)
 
-    conn = sqlite3.connect(DB_PATH)
+    conn = snapshots.connect()
     try:
+        wanted = []
         for item in locationlist:
             loc = _normalize_posted_location(item)
             sites.append(loc)
             # determine table for this location (gauge)
             table_name = LOCATION_TO_TABLE.get(loc, 'gauge')
-            # query table for time window
-            df = custom_graph.query_data(conn, table_name, start_epoch, end_epoch)
-            if df is None or df.empty:
-                series_list.append(([], []))
-                continue
-            # filter by location if column exists
-            if 'location' in df.columns:
-                df = df[df['location'] == loc]
             # map display name to sql column
             col = SQL_CONVERSION.get(data2see, None)
             if not col:
                 col = data2see.replace(' ', '_').lower()
-            if col not in df.columns:
-                series_list.append(([], []))
-                continue
-            clean = custom_graph._prepare_df_for_plot(df, 'datetime', col)
-            if clean.empty:
-                series_list.append(([], []))
-            else:
-                series_list.append((clean['datetime'].tolist(), clean[col].tolist()))
-
-        # Build plotly traces
-        import plotly.graph_objs as go
-        traces = []
-        for idx, (times, values) in enumerate(series_list):
-            if not times:
-                continue
-            traces.append(go.Scatter(x=times, y=values, mode='lines', name=sites[idx]))
-
-        if traces:
-            layout = dict(title=f"{data2see} - {', '.join(sites)}", xaxis=dict(title='Time'), yaxis=dict(title=data2see))
-            plot_div = plot({'data': traces, 'layout': layout}, output_type='div')
-        else:
-            # No trace data: build a helpful diagnostic to explain why
-            diag = '<p>No data available for selected stations/date range.</p>'
-            diag += '<h4>Diagnostics</h4>'
-            diag += '<table class="stats"><tr><th>Site</th><th>Rows</th><th>Min Datetime</th><th>Max Datetime</th><th>Non-empty Columns</th></tr>'
-            for loc in sites:
-                try:
-                    curr = conn.cursor()
-                    # total rows for this location in its table
-                    table_name = LOCATION_TO_TABLE.get(loc, 'gauge')
-                    curr.execute(f"SELECT count(*) FROM \"{table_name}\" WHERE location=?", (loc,))
-                    total = curr.fetchone()[0]
-                    # min/max datetime for this location
-                    try:
-                        curr.execute(f"SELECT MIN(datetime), MAX(datetime) FROM \"{table_name}\" WHERE location=?", (loc,))
-                        mn_mx = curr.fetchone()
-                        mn = mn_mx[0]
-                        mx = mn_mx[1]
-                    except Exception:
-                        mn = mx = None
-                    # find non-empty columns for this location (limit to first 10 columns)
-                    nonempty = []
-                    try:
-                        curr.execute(f"PRAGMA table_info(\"{table_name}\")")
-                        cols = [r[1] for r in curr.fetchall()]
-                        for c in cols:
-                            if c in ('datetime','location'):
-                                continue
-                            try:
-                                curr.execute(f"SELECT count(*) FROM \"{table_name}\" WHERE location=? AND \"{c}\" IS NOT NULL", (loc,))
-                                cnt = curr.fetchone()[0]
-                                if cnt and cnt>0:
-                                    nonempty.append(f"{c} ({cnt})")
-                            except Exception:
-                                continue
-                    except Exception:
-                        nonempty = []
-                    diag += f"<tr><td>{loc}</td><td>{total}</td><td>{mn or ''}</td><td>{mx or ''}</td><td>{', '.join(nonempty)}</td></tr>"
-                except Exception as e:
-                    diag += f"<tr><td>{loc}</td><td colspan=4>Error: {e}</td></tr>"
-            diag += '</table>'
-            plot_div = diag
-
-        # Build a simple statistics table HTML
-        import statistics, math
-        rows = []
-        for idx, (times, values) in enumerate(series_list):
-            vals = [v for v in values if v is not None and (not (isinstance(v, float) and math.isnan(v)))]
-            if not vals:
-                rows.append({'site': sites[idx], 'mean': '', 'sd': '', 'median': '', 'min': '', 'max': '', 'range': ''})
-                continue
-            mean = round(statistics.mean(vals), 3)
-            sd = round(statistics.pstdev(vals), 3) if len(vals) > 1 else 0.0
-            med = round(statistics.median(vals), 3)
-            mn = round(min(vals), 3)
-            mx = round(max(vals), 3)
-            rg = round(mx - mn, 3)
-            rows.append({'site': sites[idx], 'mean': mean, 'sd': sd, 'median': med, 'min': mn, 'max': mx, 'range': rg})
-
-        # convert rows to simple html table
-        table_html = '<table class="stats"><tr><th>Site</th><th>Mean</th><th>SD</th><th>Median</th><th>Min</th><th>Max</th><th>Range</th></tr>'
-        for r in rows:
-            table_html += f"<tr><td>{r['site']}</td><td>{r['mean']}</td><td>{r['sd']}</td><td>{r['median']}</td><td>{r['min']}</td><td>{r['max']}</td><td>{r['range']}</td></tr>"
-        table_html += '</table>'
-
-        return render(request, "HTML/graphdisplay.html", context={'plot': plot_div, 'table': table_html, 'embed': _is_embed_request(request)})
+            wanted.append((table_name, loc, col, start_epoch, end_epoch))
+        return _graph_response(request, conn, 'customgaugegraph', wanted, sites, data2see, diagnose=True)
     finally:
         conn.close()
 
 def customdamgraph(request):
-    locationlist = request.POST.getlist('dam')
-    data2see = request.POST['data2see']
+    form = _form(request)
+    locationlist = form.getlist('dam')
+    data2see = form['data2see']
     if "_" in data2see:
         data2see = data2see.split("_")
         data2see = data2see[0] + " " + data2see[1]
 
-    start_date = request.POST['start-date']
-    end_date = request.POST['end-date']
+    start_date = form['start-date']
+    end_date = form['end-date']
 
     # reuse logic from customgaugegraph but with dam table
     sites = []
-    series_list = []
 
     def to_epoch(s):
         if not s:
@@ -544,79 +682,33 @@ def customdamgraph(request):
     start_epoch = to_epoch(start_date)
     end_epoch = to_epoch(end_date)
 
-    conn = sqlite3.connect(DB_PATH)
+    conn = snapshots.connect()
     try:
+        wanted = []
         for loc in locationlist:
             locn = _normalize_posted_location(loc)
             sites.append(locn)
             table_name = LOCATION_TO_TABLE.get(loc, 'dam')
-            df = custom_graph.query_data(conn, table_name, start_epoch, end_epoch)
-            if df is None or df.empty:
-                series_list.append(([], []))
-                continue
-            if 'location' in df.columns:
-                df = df[df['location'] == locn]
             col = SQL_CONVERSION.get(data2see, None)
             if not col:
                 col = data2see.replace(' ', '_').lower()
-            if col not in df.columns:
-                series_list.append(([], []))
-                continue
-            clean = custom_graph._prepare_df_for_plot(df, 'datetime', col)
-            if clean.empty:
-                series_list.append(([], []))
-            else:
-                series_list.append((clean['datetime'].tolist(), clean[col].tolist()))
-
-        import plotly.graph_objs as go
-        traces = []
-        for idx, (times, values) in enumerate(series_list):
-            if not times:
-                continue
-            traces.append(go.Scatter(x=times, y=values, mode='lines', name=sites[idx]))
-
-        if traces:
-            layout = dict(title=f"{data2see} - {', '.join(sites)}", xaxis=dict(title='Time'), yaxis=dict(title=data2see))
-            plot_div = plot({'data': traces, 'layout': layout}, output_type='div')
-        else:
-            plot_div = '<p>No data available for selected stations/date range.</p>'
-
-        import statistics, math
-        rows = []
-        for idx, (times, values) in enumerate(series_list):
-            vals = [v for v in values if v is not None and (not (isinstance(v, float) and math.isnan(v)))]
-            if not vals:
-                rows.append({'site': sites[idx], 'mean': '', 'sd': '', 'median': '', 'min': '', 'max': '', 'range': ''})
-                continue
-            mean = round(statistics.mean(vals), 3)
-            sd = round(statistics.pstdev(vals), 3) if len(vals) > 1 else 0.0
-            med = round(statistics.median(vals), 3)
-            mn = round(min(vals), 3)
-            mx = round(max(vals), 3)
-            rg = round(mx - mn, 3)
-            rows.append({'site': sites[idx], 'mean': mean, 'sd': sd, 'median': med, 'min': mn, 'max': mx, 'range': rg})
-
-        table_html = '<table class="stats"><tr><th>Site</th><th>Mean</th><th>SD</th><th>Median</th><th>Min</th><th>Max</th><th>Range</th></tr>'
-        for r in rows:
-            table_html += f"<tr><td>{r['site']}</td><td>{r['mean']}</td><td>{r['sd']}</td><td>{r['median']}</td><td>{r['min']}</td><td>{r['max']}</td><td>{r['range']}</td></tr>"
-        table_html += '</table>'
-
-        return render(request, 'HTML/graphdisplay.html', context={'plot': plot_div, 'table': table_html, 'embed': _is_embed_request(request)})
+            wanted.append((table_name, locn, col, start_epoch, end_epoch))
+        return _graph_response(request, conn, 'customdamgraph', wanted, sites, data2see)
     finally:
         conn.close()
 
 def custommesonetgraph(request):
-    locationlist = request.POST.getlist('mesonet')
-    data2see = request.POST['data2see']
+    form = _form(request)
+    locationlist = form.getlist('mesonet')
+    data2see = form['data2see']
     if "_" in data2see:
         data2see = data2see.split("_")
         data2see = data2see[0] + " " + data2see[1]
 
-    start_date = request.POST['start-date']
-    end_date = request.POST['end-date']
+    start_date = form['start-date']
+    end_date = form['end-date']
 
     sites = []
-    series_list = []
 
     def to_epoch(s):
         if not s:
@@ -630,79 +722,33 @@ def custommesonetgraph(request):
     start_epoch = to_epoch(start_date)
     end_epoch = to_epoch(end_date)
 
-    conn = sqlite3.connect(DB_PATH)
+    conn = snapshots.connect()
     try:
+        wanted = []
         for loc in locationlist:
             locn = _normalize_posted_location(loc)
             sites.append(locn)
             table_name = LOCATION_TO_TABLE.get(loc, 'mesonet')
-            df = custom_graph.query_data(conn, table_name, start_epoch, end_epoch)
-            if df is None or df.empty:
-                series_list.append(([], []))
-                continue
-            if 'location' in df.columns:
-                df = df[df['location'] == locn]
             col = SQL_CONVERSION.get(data2see, None)
             if not col:
                 col = data2see.replace(' ', '_').lower()
-            if col not in df.columns:
-                series_list.append(([], []))
-                continue
-            clean = custom_graph._prepare_df_for_plot(df, 'datetime', col)
-            if clean.empty:
-                series_list.append(([], []))
-            else:
-                series_list.append((clean['datetime'].tolist(), clean[col].tolist()))
-
-        import plotly.graph_objs as go
-        traces = []
-        for idx, (times, values) in enumerate(series_list):
-            if not times:
-                continue
-            traces.append(go.Scatter(x=times, y=values, mode='lines', name=sites[idx]))
-
-        if traces:
-            layout = dict(title=f"{data2see} - {', '.join(sites)}", xaxis=dict(title='Time'), yaxis=dict(title=data2see))
-            plot_div = plot({'data': traces, 'layout': layout}, output_type='div')
-        else:
-            plot_div = '<p>No data available for selected stations/date range.</p>'
-
-        import statistics, math
-        rows = []
-        for idx, (times, values) in enumerate(series_list):
-            vals = [v for v in values if v is not None and (not (isinstance(v, float) and math.isnan(v)))]
-            if not vals:
-                rows.append({'site': sites[idx], 'mean': '', 'sd': '', 'median': '', 'min': '', 'max': '', 'range': ''})
-                continue
-            mean = round(statistics.mean(vals), 3)
-            sd = round(statistics.pstdev(vals), 3) if len(vals) > 1 else 0.0
-            med = round(statistics.median(vals), 3)
-            mn = round(min(vals), 3)
-            mx = round(max(vals), 3)
-            rg = round(mx - mn, 3)
-            rows.append({'site': sites[idx], 'mean': mean, 'sd': sd, 'median': med, 'min': mn, 'max': mx, 'range': rg})
-
-        table_html = '<table class="stats"><tr><th>Site</th><th>Mean</th><th>SD</th><th>Median</th><th>Min</th><th>Max</th><th>Range</th></tr>'
-        for r in rows:
-            table_html += f"<tr><td>{r['site']}</td><td>{r['mean']}</td><td>{r['sd']}</td><td>{r['median']}</td><td>{r['min']}</td><td>{r['max']}</td><td>{r['range']}</td></tr>"
-        table_html += '</table>'
-
-        return render(request, 'HTML/graphdisplay.html', context={'plot': plot_div, 'table': table_html, 'embed': _is_embed_request(request)})
+            wanted.append((table_name, locn, col, start_epoch, end_epoch))
+        return _graph_response(request, conn, 'custommesonetgraph', wanted, sites, data2see)
     finally:
         conn.close()
 
 def customcocograph(request):
-    locationlist = request.POST.getlist('cocorahs')
-    data2see = request.POST['data2see']
+    form = _form(request)
+    locationlist = form.getlist('cocorahs')
+    data2see = form['data2see']
     if "_" in data2see:
         data2see = data2see.split("_")
         data2see = data2see[0] + " " + data2see[1]
 
-    start_date = request.POST['start-date']
-    end_date = request.POST['end-date']
+    start_date = form['start-date']
+    end_date = form['end-date']
 
     sites = []
-    series_list = []
 
     def to_epoch(s):
         if not s:
@@ -716,78 +762,32 @@ def customcocograph(request):
     start_epoch = to_epoch(start_date)
     end_epoch = to_epoch(end_date)
 
-    conn = sqlite3.connect(DB_PATH)
+    conn = snapshots.connect()
     try:
+        wanted = []
         for loc in locationlist:
             locn = _normalize_posted_location(loc)
             sites.append(locn)
             table_name = LOCATION_TO_TABLE.get(loc, 'cocorahs')
-            df = custom_graph.query_data(conn, table_name, start_epoch, end_epoch)
-            if df is None or df.empty:
-                series_list.append(([], []))
-                continue
-            if 'location' in df.columns:
-                df = df[df['location'] == locn]
             col = SQL_CONVERSION.get(data2see, None)
             if not col:
                 col = data2see.replace(' ', '_').lower()
-            if col not in df.columns:
-                series_list.append(([], []))
-                continue
-            clean = custom_graph._prepare_df_for_plot(df, 'datetime', col)
-            if clean.empty:
-                series_list.append(([], []))
-            else:
-                series_list.append((clean['datetime'].tolist(), clean[col].tolist()))
-
-        import plotly.graph_objs as go
-        traces = []
-        for idx, (times, values) in enumerate(series_list):
-            if not times:
-                continue
-            traces.append(go.Scatter(x=times, y=values, mode='lines', name=sites[idx]))
-
-        if traces:
-            layout = dict(title=f"{data2see} - {', '.join(sites)}", xaxis=dict(title='Time'), yaxis=dict(title=data2see))
-            plot_div = plot({'data': traces, 'layout': layout}, output_type='div')
-        else:
-            plot_div = '<p>No data available for selected stations/date range.</p>'
-
-        import statistics, math
-        rows = []
-        for idx, (times, values) in enumerate(series_list):
-            vals = [v for v in values if v is not None and (not (isinstance(v, float) and math.isnan(v)))]
-            if not vals:
-                rows.append({'site': sites[idx], 'mean': '', 'sd': '', 'median': '', 'min': '', 'max': '', 'range': ''})
-                continue
-            mean = round(statistics.mean(vals), 3)
-            sd = round(statistics.pstdev(vals), 3) if len(vals) > 1 else 0.0
-            med = round(statistics.median(vals), 3)
-            mn = round(min(vals), 3)
-            mx = round(max(vals), 3)
-            rg = round(mx - mn, 3)
-            rows.append({'site': sites[idx], 'mean': mean, 'sd': sd, 'median': med, 'min': mn, 'max': mx, 'range': rg})
-
-        table_html = '<table class="stats"><tr><th>Site</th><th>Mean</th><th>SD</th><th>Median</th><th>Min</th><th>Max</th><th>Range</th></tr>'
-        for r in rows:
-            table_html += f"<tr><td>{r['site']}</td><td>{r['mean']}</td><td>{r['sd']}</td><td>{r['median']}</td><td>{r['min']}</td><td>{r['max']}</td><td>{r['range']}</td></tr>"
-        table_html += '</table>'
-
-        return render(request, 'HTML/graphdisplay.html', context={'plot': plot_div, 'table': table_html, 'embed': _is_embed_request(request)})
+            wanted.append((table_name, locn, col, start_epoch, end_epoch))
+        return _graph_response(request, conn, 'customcocograph', wanted, sites, data2see)
     finally:
         conn.close()
 
 def customshadehillgraph(request):
-    data2see = request.POST['data2see']
+    form = _form(request)
+    data2see = form['data2see']
     if "_" in data2see:
         data2see = data2see.split("_")
         data2see = data2see[0] + " " + data2see[1]
 
-    start_date = request.POST['start-date']
-    end_date = request.POST['end-date']
+    start_date = form['start-date']
+    end_date = form['end-date']
 
     sites = ['Shadehill']
-    series_list = []
 
     def to_epoch(s):
         if not s:
@@ -801,76 +801,29 @@ def customshadehillgraph(request):
     start_epoch = to_epoch(start_date)
     end_epoch = to_epoch(end_date)
 
-    conn = sqlite3.connect(DB_PATH)
+    conn = snapshots.connect()
     try:
         table_name = LOCATION_TO_TABLE.get('Shadehill', 'shadehill')
-        df = custom_graph.query_data(conn, table_name, start_epoch, end_epoch)
-        if df is None or df.empty:
-            series_list.append(([], []))
-        else:
-            if 'location' in df.columns:
-                df = df[df['location'] == 'Shadehill']
-            col = SQL_CONVERSION.get(data2see, None)
-            if not col:
-                col = data2see.replace(' ', '_').lower()
-            if col not in df.columns:
-                series_list.append(([], []))
-            else:
-                clean = custom_graph._prepare_df_for_plot(df, 'datetime', col)
-                if clean.empty:
-                    series_list.append(([], []))
-                else:
-                    series_list.append((clean['datetime'].tolist(), clean[col].tolist()))
-
-        import plotly.graph_objs as go
-        traces = []
-        for idx, (times, values) in enumerate(series_list):
-            if not times:
-                continue
-            traces.append(go.Scatter(x=times, y=values, mode='lines', name=sites[idx]))
-
-        if traces:
-            layout = dict(title=f"{data2see} - Shadehill", xaxis=dict(title='Time'), yaxis=dict(title=data2see))
-            plot_div = plot({'data': traces, 'layout': layout}, output_type='div')
-        else:
-            plot_div = '<p>No data available for selected stations/date range.</p>'
-
-        import statistics, math
-        rows = []
-        for idx, (times, values) in enumerate(series_list):
-            vals = [v for v in values if v is not None and (not (isinstance(v, float) and math.isnan(v)))]
-            if not vals:
-                rows.append({'site': sites[idx], 'mean': '', 'sd': '', 'median': '', 'min': '', 'max': '', 'range': ''})
-                continue
-            mean = round(statistics.mean(vals), 3)
-            sd = round(statistics.pstdev(vals), 3) if len(vals) > 1 else 0.0
-            med = round(statistics.median(vals), 3)
-            mn = round(min(vals), 3)
-            mx = round(max(vals), 3)
-            rg = round(mx - mn, 3)
-            rows.append({'site': sites[idx], 'mean': mean, 'sd': sd, 'median': med, 'min': mn, 'max': mx, 'range': rg})
-
-        table_html = '<table class="stats"><tr><th>Site</th><th>Mean</th><th>SD</th><th>Median</th><th>Min</th><th>Max</th><th>Range</th></tr>'
-        for r in rows:
-            table_html += f"<tr><td>{r['site']}</td><td>{r['mean']}</td><td>{r['sd']}</td><td>{r['median']}</td><td>{r['min']}</td><td>{r['max']}</td><td>{r['range']}</td></tr>"
-        table_html += '</table>'
-
-        return render(request, 'HTML/graphdisplay.html', context={'plot': plot_div, 'table': table_html, 'embed': _is_embed_request(request)})
+        col = SQL_CONVERSION.get(data2see, None)
+        if not col:
+            col = data2see.replace(' ', '_').lower()
+        wanted = [(table_name, 'Shadehill', col, start_epoch, end_epoch)]
+        return _graph_response(request, conn, 'customshadehillgraph', wanted, sites, data2see)
     finally:
         conn.close()
 
 def customnoaagraph(request):
-    locationlist = request.POST.getlist('noaa')
-    data2see = request.POST['data2see']
+    form = _form(request)
+    locationlist = form.getlist('noaa')
+    data2see = form['data2see']
     if "_" in data2see:
         data2see = data2see.split("_")
         data2see = data2see[0] + " " + data2see[1]
 
-    start_date = request.POST['start-date']
-    end_date = request.POST['end-date']
+    start_date = form['start-date']
+    end_date = form['end-date']
 
     sites = []
-    series_list = []
 
     def to_epoch(s):
         if not s:
@@ -884,64 +837,18 @@ def customnoaagraph(request):
     start_epoch = to_epoch(start_date)
     end_epoch = to_epoch(end_date)
 
-    conn = sqlite3.connect(DB_PATH)
+    conn = snapshots.connect()
     try:
+        wanted = []
         for loc in locationlist:
             locn = _normalize_posted_location(loc)
             sites.append(locn)
             table_name = LOCATION_TO_TABLE.get(loc, 'noaa')
-            df = custom_graph.query_data(conn, table_name, start_epoch, end_epoch)
-            if df is None or df.empty:
-                series_list.append(([], []))
-                continue
-            if 'location' in df.columns:
-                df = df[df['location'] == locn]
             col = SQL_CONVERSION.get(data2see, None)
             if not col:
                 col = data2see.replace(' ', '_').lower()
-            if col not in df.columns:
-                series_list.append(([], []))
-                continue
-            clean = custom_graph._prepare_df_for_plot(df, 'datetime', col)
-            if clean.empty:
-                series_list.append(([], []))
-            else:
-                series_list.append((clean['datetime'].tolist(), clean[col].tolist()))
-
-        import plotly.graph_objs as go
-        traces = []
-        for idx, (times, values) in enumerate(series_list):
-            if not times:
-                continue
-            traces.append(go.Scatter(x=times, y=values, mode='lines', name=sites[idx]))
-
-        if traces:
-            layout = dict(title=f"{data2see} - {', '.join(sites)}", xaxis=dict(title='Time'), yaxis=dict(title=data2see))
-            plot_div = plot({'data': traces, 'layout': layout}, output_type='div')
-        else:
-            plot_div = '<p>No data available for selected stations/date range.</p>'
-
-        import statistics, math
-        rows = []
-        for idx, (times, values) in enumerate(series_list):
-            vals = [v for v in values if v is not None and (not (isinstance(v, float) and math.isnan(v)))]
-            if not vals:
-                rows.append({'site': sites[idx], 'mean': '', 'sd': '', 'median': '', 'min': '', 'max': '', 'range': ''})
-                continue
-            mean = round(statistics.mean(vals), 3)
-            sd = round(statistics.pstdev(vals), 3) if len(vals) > 1 else 0.0
-            med = round(statistics.median(vals), 3)
-            mn = round(min(vals), 3)
-            mx = round(max(vals), 3)
-            rg = round(mx - mn, 3)
-            rows.append({'site': sites[idx], 'mean': mean, 'sd': sd, 'median': med, 'min': mn, 'max': mx, 'range': rg})
-
-        table_html = '<table class="stats"><tr><th>Site</th><th>Mean</th><th>SD</th><th>Median</th><th>Min</th><th>Max</th><th>Range</th></tr>'
-        for r in rows:
-            table_html += f"<tr><td>{r['site']}</td><td>{r['mean']}</td><td>{r['sd']}</td><td>{r['median']}</td><td>{r['min']}</td><td>{r['max']}</td><td>{r['range']}</td></tr>"
-        table_html += '</table>'
-
-        return render(request, 'HTML/graphdisplay.html', context={'plot': plot_div, 'table': table_html, 'embed': _is_embed_request(request)})
+            wanted.append((table_name, locn, col, start_epoch, end_epoch))
+        return _graph_response(request, conn, 'customnoaagraph', wanted, sites, data2see)
     finally:
         conn.close()
 
@@ -950,11 +857,12 @@ def generate_maptab_graph(request):
     """Unified endpoint for maptabs forms: accepts location(s), data2see, start-date, end-date
     and returns the same HTML fragment as other graph endpoints (plot + stats table).
     """
+    form = _form(request)
     # same parameter names as existing forms
-    locationlist = request.POST.getlist('location')
-    data2see = request.POST.get('data2see', '')
-    start_date = request.POST.get('start-date', '')
-    end_date = request.POST.get('end-date', '')
+    locationlist = form.getlist('location')
+    data2see = form.get('data2see', '')
+    start_date = form.get('start-date', '')
+    end_date = form.get('end-date', '')
 
     # parse dates to epoch
     def to_epoch(s):
@@ -970,10 +878,10 @@ def generate_maptab_graph(request):
     end_epoch = to_epoch(end_date)
 
     sites = []
-    series_list = []
 
-    conn = sqlite3.connect(DB_PATH)
+    conn = snapshots.connect()
     try:
+        wanted = []
         for item in locationlist:
             loc = _normalize_posted_location(item)
             sites.append(loc)
@@ -987,8 +895,12 @@ def generate_maptab_graph(request):
             # If start/end were not provided by the client, choose a recent window
             # based on the latest available timestamp for this (table, column).
             if start_epoch is None or end_epoch is None:
+                entry = latest_values.get_latest(conn, table_name, loc, col)
                 try:
-                    latest_dt = custom_graph.get_latest_datetime(conn, table_name, col)
+                    if entry:
+                        latest_dt = datetime.fromisoformat(entry['ts'])
+                    else:
+                        latest_dt = custom_graph.get_latest_datetime(conn, table_name, col)
                 except Exception:
                     latest_dt = None
                 if latest_dt:
@@ -1003,55 +915,8 @@ def generate_maptab_graph(request):
                 start_e = start_epoch
                 end_e = end_epoch
 
-            # Query data for this location and column using computed window
-            df = custom_graph.query_data(conn, table_name, start_e, end_e)
-            if df is None or df.empty:
-                series_list.append(([], []))
-                continue
-            if 'location' in df.columns:
-                df = df[df['location'] == loc]
-            if col not in df.columns:
-                series_list.append(([], []))
-                continue
-            clean = custom_graph._prepare_df_for_plot(df, 'datetime', col)
-            if clean.empty:
-                series_list.append(([], []))
-            else:
-                series_list.append((clean['datetime'].tolist(), clean[col].tolist()))
-
-        import plotly.graph_objs as go
-        traces = []
-        for idx, (times, values) in enumerate(series_list):
-            if not times:
-                continue
-            traces.append(go.Scatter(x=times, y=values, mode='lines', name=sites[idx]))
-
-        if traces:
-            layout = dict(title=f"{data2see} - {', '.join(sites)}", xaxis=dict(title='Time'), yaxis=dict(title=data2see))
-            plot_div = plot({'data': traces, 'layout': layout}, output_type='div')
-        else:
-            plot_div = '<p>No data available for selected stations/date range.</p>'
-
-        import statistics, math
-        rows = []
-        for idx, (times, values) in enumerate(series_list):
-            vals = [v for v in values if v is not None and (not (isinstance(v, float) and math.isnan(v)))]
-            if not vals:
-                rows.append({'site': sites[idx], 'mean': '', 'sd': '', 'median': '', 'min': '', 'max': '', 'range': ''})
-                continue
-            mean = round(statistics.mean(vals), 3)
-            sd = round(statistics.pstdev(vals), 3) if len(vals) > 1 else 0.0
-            med = round(statistics.median(vals), 3)
-            mn = round(min(vals), 3)
-            mx = round(max(vals), 3)
-            rg = round(mx - mn, 3)
-            rows.append({'site': sites[idx], 'mean': mean, 'sd': sd, 'median': med, 'min': mn, 'max': mx, 'range': rg})
-
-        table_html = '<table class="stats"><tr><th>Site</th><th>Mean</th><th>SD</th><th>Median</th><th>Min</th><th>Max</th><th>Range</th></tr>'
-        for r in rows:
-            table_html += f"<tr><td>{r['site']}</td><td>{r['mean']}</td><td>{r['sd']}</td><td>{r['median']}</td><td>{r['min']}</td><td>{r['max']}</td><td>{r['range']}</td></tr>"
-        table_html += '</table>'
-
-        return render(request, 'HTML/graphdisplay.html', context={'plot': plot_div, 'table': table_html, 'embed': _is_embed_request(request)})
+            # Queue this location and its window; all locations are read together below
+            wanted.append((table_name, loc, col, start_e, end_e))
+        return _graph_response(request, conn, 'generate_maptab_graph', wanted, sites, data2see)
     finally:
         conn.close()
@@ -0,0 +1,152 @@
+/*
+ * Client for /api/v1/series?format=binary and /api/v1/tile (see services/api.py).
+ *
+ * The payload is a uint32 header length, a JSON header, then one
+ * little-endian float64 array per header field (t and v for a series),
+ * starting on an 8-byte boundary, so they are wrapped in Float64Arrays over
+ * the response buffer without copying and handed to Plotly without any JSON
+ * number parsing.
+ *
+ * attachZoomTiles() makes a plotted series fetch finer detail from the tile
+ * pyramid (services/backend/tiles.py) for the visible range as the user zooms.
+ */
+(function () {
+  // mirror services/backend/tiles.py
+  const TILE_BASE_BUCKET_MS = 60 * 1000;
+  const TILE_POINTS = 256;
+  const TILE_MAX_LEVEL = 20;
+  const TILE_TARGET_POINTS = 1000;
+  const EMPTY_TILE = { t: new Float64Array(0), v: new Float64Array(0) };
+
+  function decodeSeriesBinary(buffer) {
+    const view = new DataView(buffer);
+    const headerLength = view.getUint32(0, true);
+    const header = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 4, headerLength)));
+    const offset = 4 + headerLength;
+    const count = header.count;
+    const decoded = { header: header };
+    (header.fields || ['t', 'v']).forEach((field, k) => {
+      decoded[field] = new Float64Array(buffer, offset + 8 * count * k, count);
+    });
+    return decoded;
+  }
+
+  async function fetchSeriesBinary(params, options) {
+    const query = new URLSearchParams(Object.assign({}, params, { format: 'binary' }));
+    const resp = await fetch(`/api/v1/series?${query}`, Object.assign({ credentials: 'same-origin' }, options));
+    if (!resp.ok) {
+      const error = new Error(`series request failed (${resp.status})`);
+      error.status = resp.status;
+      throw error;
+    }
+    return decodeSeriesBinary(await resp.arrayBuffer());
+  }
+
+  function round3(x) {
+    return Math.round(x * 1000) / 1000;
+  }
+
+  // Same columns as the server-rendered stats table (views._stats_table_html)
+  function statsTableHtml(seriesList) {
+    let html = '<table class="stats"><tr><th>Site</th><th>Mean</th><th>SD</th><th>Median</th><th>Min</th><th>Max</th><th>Range</th></tr>';
+    seriesList.forEach(s => {
+      const m = s.header.summary;
+      const cells = m
+        ? [m.mean, m.sd, m.median, m.min, m.max, round3(m.max) - round3(m.min)].map(round3)
+        : ['', '', '', '', '', ''];
+      html += `<tr><td>${s.header.location}</td>${cells.map(c => `<td>${c}</td>`).join('')}</tr>`;
+    });
+    return html + '</table>';
+  }
+
+  // webglPoints: settings.GRAPH_WEBGL_POINTS, passed in by the page so client- and
+  // server-rendered graphs switch to WebGL at the same size
+  function plotSeries(el, seriesList, layout, webglPoints) {
+    const total = seriesList.reduce((n, s) => n + s.t.length, 0);
+    const webgl = webglPoints != null && total > webglPoints;
+    const traces = seriesList.map(s => ({
+      x: s.t,
+      y: s.v,
+      name: s.header.location,
+      mode: 'lines',
+      type: webgl ? 'scattergl' : 'scatter'
+    }));
+    return Plotly.newPlot(el, traces, Object.assign({ xaxis: { type: 'date' }, showlegend: true }, layout),
+                          { responsive: true, displaylogo: false });
+  }
+
+  function tileLevel(windowMs) {
+    for (let z = 0; z <= TILE_MAX_LEVEL; z++) {
+      if (windowMs / (TILE_BASE_BUCKET_MS * 2 ** z) <= TILE_TARGET_POINTS) return z;
+    }
+    return TILE_MAX_LEVEL;
+  }
+
+  // Plotly date-axis ranges are naive wall-clock strings, like the API's times
+  function axisMs(value) {
+    return typeof value === 'number' ? value : Date.parse(String(value).replace(' ', 'T') + 'Z');
+  }
+
+  function attachZoomTiles(el, params, traceIndex) {
+    traceIndex = traceIndex || 0;
+    const original = { x: el.data[traceIndex].x, y: el.data[traceIndex].y };
+    const cache = new Map();
+    let generation = 0;
+
+    function getTile(z, i) {
+      const key = `${z}/${i}`;
+      if (!cache.has(key)) {
+        const query = new URLSearchParams(Object.assign({}, params, { z: z, i: i }));
+        cache.set(key, fetch(`/api/v1/tile?${query}`, { credentials: 'same-origin' })
+          .then(resp => {
+            // 400: the tile lies outside the series' data, e.g. panned past its ends
+            if (resp.status === 400) return EMPTY_TILE;
+            if (!resp.ok) throw new Error(`tile request failed (${resp.status})`);
+            return resp.arrayBuffer().then(decodeSeriesBinary);
+          })
+          .catch(err => { cache.delete(key); throw err; }));
+      }
+      return cache.get(key);
+    }
+
+    el.on('plotly_relayout', async event => {
+      const current = ++generation;
+      if (event['xaxis.autorange']) {
+        Plotly.restyle(el, { x: [original.x], y: [original.y] }, [traceIndex]);
+        return;
+      }
+      const range = event['xaxis.range'] || [event['xaxis.range[0]'], event['xaxis.range[1]']];
+      if (range[0] === undefined || range[1] === undefined) return;
+      const lo = axisMs(range[0]);
+      const hi = axisMs(range[1]);
+      if (!(hi > lo)) return;
+
+      const z = tileLevel(hi - lo);
+      const span = TILE_BASE_BUCKET_MS * 2 ** z * TILE_POINTS;
+      const wanted = [];
+      for (let i = Math.floor(lo / span); i <= Math.floor(hi / span); i++) wanted.push(getTile(z, i));
+      let tiles;
+      try {
+        tiles = await Promise.all(wanted);
+      } catch (_err) {
+        return;  // keep what is drawn
+      }
+      if (current !== generation) return;  // a newer zoom is in flight
+
+      const count = tiles.reduce((n, tile) => n + tile.t.length, 0);
+      const x = new Float64Array(count);
+      const y = new Float64Array(count);
+      let at = 0;
+      tiles.forEach(tile => { x.set(tile.t, at); y.set(tile.v, at); at += tile.t.length; });
+      Plotly.restyle(el, { x: [x], y: [y] }, [traceIndex]);
+    });
+  }
+
+  window.seriesBinary = {
+    decode: decodeSeriesBinary,
+    fetch: fetchSeriesBinary,
+    plot: plotSeries,
+    statsTableHtml: statsTableHtml,
+    attachZoomTiles: attachZoomTiles
+  };
+})();